@@ -0,0 +1,219 @@
+"""
+Acceso a la base de datos sin bloquear el event loop para los endpoints de lectura
+AsyncDB.run_sync ejecuta las funciones de consulta existentes (que reciben una
+Session) sin frenar el loop:
+- por defecto, con una Session del pool síncrono en un hilo
+- con DB_ASYNC_DRIVER y asyncpg (PostgreSQL) o aiosqlite (SQLite) instalados,
+  sobre una conexión de SQLAlchemy asyncio. Es un pool aparte (DB_ASYNC_POOL_SIZE /
+  DB_ASYNC_MAX_OVERFLOW) que se suma al síncrono, que siguen usando el ETL y la exportación
+El engine asíncrono sale de la URL del engine síncrono (mismo motor y fallback)
+"""
+import asyncio
+import importlib.util
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Any, AsyncIterator, Callable, Optional
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from config import get_settings
+from database import get_db_engine, get_db_session
+
+try:
+    # Requiere greenlet y un driver asíncrono (pip install asyncpg aiosqlite)
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+except ImportError:
+    async_sessionmaker = None
+    create_async_engine = None
+
+
+# Dialecto del engine síncrono -> (módulo del driver, drivername asíncrono)
+ASYNC_DRIVERS = {
+    "postgresql": ("asyncpg", "postgresql+asyncpg"),
+    "sqlite": ("aiosqlite", "sqlite+aiosqlite"),
+}
+
+_async_engine = None
+_async_engine_loop = None
+_AsyncSessionLocal = None
+_fallback_slots = None
+_fallback_slots_loop = None
+
+
+@lru_cache()
+def _module_installed(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
+def _async_url(engine):
+    """URL del engine síncrono con el driver asíncrono; None si no está activo o instalado"""
+    driver = ASYNC_DRIVERS.get(engine.dialect.name)
+    if not get_settings().db_async_driver or create_async_engine is None or driver is None:
+        return None
+    module, drivername = driver
+    if not (_module_installed(module) and _module_installed("greenlet")):
+        return None
+    return engine.url.set(drivername=drivername)
+
+
+def async_available() -> bool:
+    return _async_url(get_db_engine()) is not None
+
+
+def get_async_engine():
+    """
+    Engine asíncrono del event loop actual (None sin driver asíncrono activo)
+    Las conexiones de asyncpg / aiosqlite quedan ligadas al loop que las abrió:
+    desde otro loop (scripts con asyncio.run) se crea uno nuevo
+    """
+    global _async_engine, _async_engine_loop, _AsyncSessionLocal
+
+    loop = asyncio.get_running_loop()
+    if _async_engine is None or _async_engine_loop is not loop:
+        url = _async_url(get_db_engine())
+        if url is None:
+            return None
+        settings = get_settings()
+        # Pool explícito: aiosqlite usa NullPool por defecto (un hilo nuevo por conexión)
+        _async_engine = create_async_engine(
+            url,
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=settings.db_async_pool_size,
+            max_overflow=settings.db_async_max_overflow,
+            pool_recycle=settings.db_pool_recycle,
+            pool_timeout=settings.db_pool_timeout,
+            pool_pre_ping=True
+        )
+        _AsyncSessionLocal = async_sessionmaker(
+            _async_engine, autoflush=False, expire_on_commit=False
+        )
+        _async_engine_loop = loop
+    return _async_engine
+
+
+async def dispose_async_engine():
+    """Cierra las conexiones del pool asíncrono (apagado de la aplicación)"""
+    global _async_engine, _async_engine_loop, _AsyncSessionLocal
+
+    if _async_engine is not None and _async_engine_loop is asyncio.get_running_loop():
+        await _async_engine.dispose()
+    _async_engine = None
+    _async_engine_loop = None
+    _AsyncSessionLocal = None
+
+
+def get_async_pool_stats() -> dict:
+    """Estado del pool asíncrono (es un pool aparte del síncrono que usa el ETL)"""
+    if _async_engine is None:
+        return {"enabled": async_available(), "connected": False}
+    pool = _async_engine.pool
+    return {
+        "enabled": True,
+        "connected": True,
+        "driver": _async_engine.dialect.driver,
+        "pool_size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+    }
+
+
+def _sync_session_slots() -> asyncio.Semaphore:
+    """
+    Sin driver asíncrono: Sessions síncronas abiertas a la vez en este loop, tantas
+    como conexiones del pool síncrono. Con más, las peticiones esperarían una
+    conexión ocupando los hilos que necesitan las que ya la tienen para terminar
+    """
+    global _fallback_slots, _fallback_slots_loop
+
+    loop = asyncio.get_running_loop()
+    if _fallback_slots is None or _fallback_slots_loop is not loop:
+        settings = get_settings()
+        _fallback_slots = asyncio.Semaphore(settings.db_pool_size + settings.db_max_overflow)
+        _fallback_slots_loop = loop
+    return _fallback_slots
+
+
+class AsyncDB:
+    """
+    Sesión de una petición o tarea
+    run_sync(fn, *args) llama fn(session, *args) con una Session síncrona:
+    - sin driver asíncrono, una Session del engine síncrono en un hilo (ver _sync_session_slots)
+    - con él, AsyncSession.run_sync (E/S sin bloquear el loop)
+    fn no debe tomar locks de hilos mientras consulta: con AsyncSession corre
+    en el hilo del loop y otra petición quedaría esperando ese lock
+    """
+
+    def __init__(self, session_factory=None):
+        self._factory = session_factory
+        self._session = None
+        self._slots = None
+
+    @property
+    def is_async(self) -> bool:
+        return self._factory is not None
+
+    async def run_sync(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        if self._factory is not None:
+            if self._session is None:
+                self._session = self._factory()
+            return await self._session.run_sync(fn, *args, **kwargs)
+        if self._session is None:
+            self._slots = _sync_session_slots()
+            await self._slots.acquire()
+            self._session = get_db_session()
+        return await asyncio.to_thread(fn, self._session, *args, **kwargs)
+
+    async def _call(self, method: str):
+        if self._session is None:
+            return
+        if self._factory is not None:
+            await getattr(self._session, method)()
+        else:
+            await asyncio.to_thread(getattr(self._session, method))
+
+    async def commit(self):
+        await self._call("commit")
+
+    async def rollback(self):
+        await self._call("rollback")
+
+    async def close(self):
+        try:
+            await self._call("close")
+        finally:
+            self._session = None
+            if self._slots is not None:
+                self._slots.release()
+                self._slots = None
+
+
+def get_async_db_session() -> AsyncDB:
+    """Crea una AsyncDB (asíncrona si el driver está activo e instalado)"""
+    engine = get_async_engine()
+    return AsyncDB(_AsyncSessionLocal if engine is not None else None)
+
+
+@asynccontextmanager
+async def async_db_session() -> AsyncIterator[AsyncDB]:
+    """async with async_db_session() as db: ... (cierra la sesión al salir)"""
+    db = get_async_db_session()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+# Para usar con FastAPI Depends
+async def get_async_db() -> AsyncIterator[AsyncDB]:
+    """Dependency asíncrona para los endpoints de lectura"""
+    async with async_db_session() as db:
+        yield db
+
+
+def run_with_session(fn: Callable[[Session], Any]) -> Any:
+    """fn(session) con una Session síncrona propia (para asyncio.to_thread)"""
+    db = get_db_session()
+    try:
+        return fn(db)
+    finally:
+        db.close()
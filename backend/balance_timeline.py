@@ -0,0 +1,217 @@
+"""
+Línea de tiempo de saldos por (cuenta, identificación, sucursal) (balance_timeline)
+El ETL recalcula solo los periodos que reemplaza o carga, en la misma transacción.
+Saldo a una fecha: el último periodo <= fecha de cada clave (si la clave no
+aparece en un mes se arrastra el saldo anterior). Entre fechas: saldo de
+apertura, saldo final y suma de débitos / créditos del rango
+Los periodos AAAA13 (cierre anual) quedan entre diciembre y enero del año siguiente
+"""
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import and_, case, column, delete, func, insert, literal, or_, select, table, tuple_
+from sqlalchemy.orm import Session
+from database import BalanceReport, BalanceTimeline, FactBalance
+
+TIMELINE_KEY = ["codigo_cuenta_contable", "identificacion", "sucursal"]
+TIMELINE_COLUMNS = [
+    *TIMELINE_KEY, "periodo", "año",
+    "saldo_inicial", "movimiento_debito", "movimiento_credito", "saldo_final",
+]
+
+# (codigo_cuenta_contable, identificacion, sucursal); sucursal None = todas las sucursales
+BalanceKey = Tuple[int, str, Optional[str]]
+
+
+def _timeline_select(periods: Optional[List[int]] = None, source=None):
+    """
+    GROUP BY clave + periodo de la vista balance_reports_flat (o de una tabla de
+    aterrizaje); varias filas de una clave en un mes se suman
+    """
+    columns = (source if source is not None else BalanceReport.__table__).c
+    identificacion = func.coalesce(columns["identificacion"], "")
+    sucursal = func.coalesce(columns["sucursal"], "")
+    statement = select(
+        columns["codigo_cuenta_contable"],
+        identificacion,
+        sucursal,
+        columns["periodo"],
+        func.max(columns["año"]),
+        func.sum(columns["saldo_inicial"]),
+        func.sum(columns["movimiento_debito"]),
+        func.sum(columns["movimiento_credito"]),
+        func.sum(columns["saldo_final"]),
+    ).where(
+        columns["codigo_cuenta_contable"].is_not(None),
+        columns["periodo"].is_not(None),
+        columns["año"].is_not(None)
+    ).group_by(columns["codigo_cuenta_contable"], identificacion, sucursal, columns["periodo"])
+    if periods is not None:
+        statement = statement.where(columns["periodo"].in_(periods))
+    return statement
+
+
+def _insert_from_select(periods: Optional[List[int]] = None):
+    return insert(BalanceTimeline).from_select(TIMELINE_COLUMNS, _timeline_select(periods))
+
+
+def refresh_timeline(db: Session, periods: Iterable[int]):
+    """
+    Recalcula la línea de tiempo de los periodos indicados (sin commit)
+    Debe ejecutarse en la transacción que modificó esos periodos
+    """
+    periods = sorted({int(p) for p in periods if p is not None})
+    if not periods:
+        return
+    db.execute(delete(BalanceTimeline).where(BalanceTimeline.periodo.in_(periods)))
+    db.execute(_insert_from_select(periods))
+
+
+def compute_timeline(db: Session, periods: Iterable[int], source_table: str) -> List[dict]:
+    """
+    Calcula la línea de tiempo desde la tabla de aterrizaje antes del swap, para
+    que la transacción del swap solo escriba las filas ya agregadas
+    """
+    periods = sorted({int(p) for p in periods if p is not None})
+    source = table(source_table, *[column(name) for name in [
+        *TIMELINE_KEY, "periodo", "año", "saldo_inicial", "movimiento_debito", "movimiento_credito", "saldo_final"
+    ]])
+    rows = db.execute(_timeline_select(periods, source)).all()
+    return [dict(zip(TIMELINE_COLUMNS, row)) for row in rows]
+
+
+def replace_timeline(db: Session, periods: Iterable[int], rows: List[dict]):
+    """Reemplaza la línea de tiempo de los periodos con filas de compute_timeline (sin commit)"""
+    periods = sorted({int(p) for p in periods if p is not None})
+    if periods:
+        db.execute(delete(BalanceTimeline).where(BalanceTimeline.periodo.in_(periods)))
+    if rows:
+        db.execute(insert(BalanceTimeline), rows)
+
+
+def backfill_balance_timeline(engine):
+    """Construye la línea de tiempo completa si está vacía y fact_balance ya tiene datos"""
+    with engine.begin() as connection:
+        if connection.execute(select(BalanceTimeline.periodo).limit(1)).first() is not None:
+            return
+        # Se consulta fact_balance y no la vista: sin los joins de las dimensiones
+        if connection.execute(select(FactBalance.id).limit(1)).first() is None:
+            return
+        connection.execute(_insert_from_select())
+
+
+def periodo_for_date(fecha: date, include_closing: bool = False) -> int:
+    """
+    Último periodo cubierto por la fecha (granularidad mensual)
+    En diciembre, include_closing incluye el periodo de cierre AAAA13
+    """
+    if fecha.month == 12 and include_closing:
+        return fecha.year * 100 + 13
+    return fecha.year * 100 + fecha.month
+
+
+def _keys_filter(keys: Sequence[BalanceKey]):
+    """(cuenta, identificación, sucursal) IN (...) OR (cuenta, identificación) IN (...)"""
+    full = [(cuenta, identificacion, sucursal) for cuenta, identificacion, sucursal in keys if sucursal is not None]
+    partial = [(cuenta, identificacion) for cuenta, identificacion, sucursal in keys if sucursal is None]
+    conditions = []
+    if full:
+        conditions.append(tuple_(
+            BalanceTimeline.codigo_cuenta_contable, BalanceTimeline.identificacion, BalanceTimeline.sucursal
+        ).in_(full))
+    if partial:
+        conditions.append(tuple_(
+            BalanceTimeline.codigo_cuenta_contable, BalanceTimeline.identificacion
+        ).in_(partial))
+    return or_(*conditions)
+
+
+def _balances_statement(keys: Sequence[BalanceKey], hasta: int, desde: Optional[int]):
+    """
+    Una consulta por bloque de claves con funciones de ventana sobre la clave primaria:
+    - ultimo = 1: fila del último periodo <= hasta (saldo final)
+    - primero_rango = 1 con periodo >= desde: primera fila del rango (saldo de apertura
+      = saldo final del periodo anterior guardado, o su saldo inicial si no hay)
+    - debito_rango / credito_rango: sumas del rango, repetidas en cada fila de la clave
+    Devuelve a lo sumo dos filas por clave
+    """
+    t = BalanceTimeline
+    partition = [t.codigo_cuenta_contable, t.identificacion, t.sucursal]
+    columns = [
+        *partition,
+        t.periodo,
+        t.saldo_final,
+        func.row_number().over(partition_by=partition, order_by=t.periodo.desc()).label("ultimo"),
+    ]
+    if desde is None:
+        inner = select(*columns).where(_keys_filter(keys), t.periodo <= hasta).subquery()
+        return select(inner).where(inner.c.ultimo == 1)
+
+    in_range = t.periodo >= desde
+    in_range_flag = case((in_range, 1), else_=0)
+    inner = select(
+        *columns,
+        t.saldo_inicial,
+        func.row_number().over(
+            partition_by=[*partition, in_range_flag], order_by=t.periodo
+        ).label("primero_rango"),
+        func.lag(t.saldo_final).over(partition_by=partition, order_by=t.periodo).label("saldo_anterior"),
+        func.sum(case((in_range, t.movimiento_debito), else_=literal(0))).over(
+            partition_by=partition
+        ).label("debito_rango"),
+        func.sum(case((in_range, t.movimiento_credito), else_=literal(0))).over(
+            partition_by=partition
+        ).label("credito_rango"),
+        in_range_flag.label("en_rango"),
+    ).where(_keys_filter(keys), t.periodo <= hasta).subquery()
+
+    return select(inner).where(
+        or_(inner.c.ultimo == 1, and_(inner.c.en_rango == 1, inner.c.primero_rango == 1))
+    )
+
+
+def _to_float(value) -> float:
+    if value is None:
+        return 0.0
+    return float(value) if isinstance(value, Decimal) else value
+
+
+def balances(
+    db: Session,
+    keys: Sequence[BalanceKey],
+    hasta: int,
+    desde: Optional[int] = None,
+    chunk_size: int = 500
+) -> List[Dict]:
+    """
+    Saldo al periodo hasta de cada clave (y, con desde, apertura y movimientos
+    del rango desde..hasta) en consultas de chunk_size claves
+    Las claves sin datos hasta ese periodo no aparecen en el resultado
+    """
+    results: Dict[Tuple, Dict] = {}
+    keys = list(dict.fromkeys(keys))
+    for start in range(0, len(keys), chunk_size):
+        rows = db.execute(_balances_statement(keys[start:start + chunk_size], hasta, desde)).all()
+        for row in rows:
+            key = (row.codigo_cuenta_contable, row.identificacion, row.sucursal)
+            entry = results.setdefault(key, {
+                "codigo_cuenta_contable": row.codigo_cuenta_contable,
+                "identificacion": row.identificacion,
+                "sucursal": row.sucursal,
+            })
+            if row.ultimo == 1:
+                entry["periodo"] = row.periodo
+                entry["saldo_final"] = _to_float(row.saldo_final)
+                if desde is not None:
+                    entry["movimiento_debito"] = _to_float(row.debito_rango)
+                    entry["movimiento_credito"] = _to_float(row.credito_rango)
+            if desde is not None and row.en_rango == 1 and row.primero_rango == 1:
+                opening = row.saldo_anterior if row.saldo_anterior is not None else row.saldo_inicial
+                entry["saldo_inicial"] = _to_float(opening)
+
+    if desde is not None:
+        for entry in results.values():
+            # Sin filas en el rango: el saldo no se movió desde el último periodo anterior
+            entry.setdefault("saldo_inicial", entry["saldo_final"])
+            entry["movimiento"] = entry["movimiento_debito"] - entry["movimiento_credito"]
+    return [results[key] for key in sorted(results)]
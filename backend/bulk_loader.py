@@ -0,0 +1,212 @@
+"""
+Carga masiva de DataFrames procesados en una tabla de aterrizaje temporal
+PostgreSQL usa COPY FROM STDIN alimentado por un CSV generado por lotes;
+SQLite (fallback) usa insert() con executemany por lotes
+La tabla de aterrizaje tiene la forma plana de process_excel y solo vive dentro
+de la transacción de la carga: star_schema la convierte en dimensiones + fact_balance
+"""
+import io
+import uuid
+from datetime import datetime
+from typing import Iterator, List, Optional
+import numpy as np
+import pandas as pd
+from sqlalchemy import Column, Date, DateTime, Integer, MetaData, Numeric, String, Table, Text, insert, text
+from sqlalchemy.orm import Session
+from config import get_settings
+
+
+# Columnas que produce ExcelProcessor.process_excel, en el orden del COPY
+INT_COLUMNS = ['codigo_cuenta_contable', 'año', 'periodo']
+TEXT_COLUMNS = [
+    'nombre_cuenta_contable', 'cod_relacional',
+    'identificacion', 'sucursal', 'nombre_tercero'
+]
+NUMERIC_COLUMNS = [
+    'saldo_inicial', 'movimiento_debito', 'movimiento_credito',
+    'movimiento', 'saldo_final'
+]
+LOAD_COLUMNS = [
+    'codigo_cuenta_contable', 'nombre_cuenta_contable', 'cod_relacional',
+    'identificacion', 'sucursal', 'nombre_tercero',
+    'saldo_inicial', 'movimiento_debito', 'movimiento_credito',
+    'movimiento', 'saldo_final',
+    'fecha', 'año', 'periodo',
+    'created_at'
+]
+
+# Marcador de NULL en el CSV del COPY (distingue NULL de cadena vacía)
+COPY_NULL = r'\N'
+
+
+def landing_table(name: str) -> Table:
+    """
+    Tabla de aterrizaje con las columnas de LOAD_COLUMNS; fila numera las filas en
+    el orden del Excel (los ids de fact_balance se asignan en ese orden)
+    """
+    return Table(
+        name,
+        MetaData(),
+        Column("fila", Integer, primary_key=True, autoincrement=True),
+        Column("codigo_cuenta_contable", Integer),
+        Column("nombre_cuenta_contable", Text),
+        Column("cod_relacional", String(10)),
+        Column("identificacion", String(50)),
+        Column("sucursal", String(100)),
+        Column("nombre_tercero", Text),
+        *[Column(name, Numeric(18, 2)) for name in NUMERIC_COLUMNS],
+        Column("fecha", Date),
+        Column("año", Integer),
+        Column("periodo", Integer),
+        Column("created_at", DateTime),
+        prefixes=["TEMPORARY"]
+    )
+
+
+def create_landing(connection) -> str:
+    """
+    Crea una tabla de aterrizaje temporal (de la conexión) y retorna su nombre
+    Debe eliminarse (drop_landing) antes del commit: después la sesión puede
+    devolver la conexión al pool
+    """
+    name = f"balance_landing_{uuid.uuid4().hex[:8]}"
+    landing_table(name).create(connection)
+    return name
+
+
+def drop_landing(connection, name: str):
+    connection.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+
+
+class _CsvBatchStream(io.TextIOBase):
+    """
+    Archivo de solo lectura que genera el CSV lote a lote
+    psycopg2.copy_expert lo consume con read(size) sin materializar todo el CSV
+    """
+
+    def __init__(self, chunks: Iterator[str]):
+        self._chunks = chunks
+        self._buffer = ""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            data, self._buffer = self._buffer, ""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readline(self, size: int = -1) -> str:
+        return self.read(size)
+
+
+class BulkLoader:
+    """Inserta DataFrames de balance en bloque según el motor de base de datos"""
+
+    def __init__(self, batch_size: Optional[int] = None):
+        self.batch_size = batch_size or get_settings().etl_batch_size
+
+    def load(
+        self,
+        db: Session,
+        df: pd.DataFrame,
+        table: str,
+        prepared: bool = False
+    ) -> int:
+        """
+        Inserta el DataFrame dentro de la transacción de la sesión (no hace commit)
+
+        Args:
+            db: Sesión de SQLAlchemy
+            df: DataFrame con las columnas de ExcelProcessor.process_excel
+            table: Tabla de aterrizaje destino (create_landing)
+            prepared: True si df ya pasó por prepare_frame (ej: en el pool de parseo)
+
+        Returns:
+            Número de filas insertadas
+        """
+        if df.empty:
+            return 0
+
+        frame = df if prepared else self.prepare_frame(df)
+        if db.get_bind().dialect.name == "postgresql":
+            self._copy_postgres(db.connection(), frame, table)
+        else:
+            self._insert_batches(db.connection(), frame, table)
+
+        return len(frame)
+
+    @staticmethod
+    def prepare_frame(df: pd.DataFrame) -> pd.DataFrame:
+        """Normaliza tipos de forma vectorizada (equivalente a los pd.notna por fila)"""
+        frame = pd.DataFrame(index=range(len(df)))
+
+        for col in INT_COLUMNS:
+            values = pd.to_numeric(df[col].reset_index(drop=True), errors='coerce')
+            if pd.api.types.is_integer_dtype(values.dtype):
+                # int64 / Int64 (process_excel): sin pasar por float
+                frame[col] = values.astype('Int64')
+            else:
+                # int() trunca hacia cero, igual que el camino fila a fila anterior
+                frame[col] = np.trunc(values.astype('float64')).astype('Int64')
+        for col in TEXT_COLUMNS:
+            values = df[col].reset_index(drop=True)
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                # Solo se convierten las categorías; sigue siendo categórico (pickle y CSV más livianos)
+                frame[col] = values.map(str, na_action='ignore')
+            else:
+                frame[col] = values.map(str, na_action='ignore').astype(object)
+        for col in NUMERIC_COLUMNS:
+            values = pd.to_numeric(df[col].reset_index(drop=True), errors='coerce')
+            frame[col] = values.astype('float64')
+
+        fecha = pd.to_datetime(df['fecha'].reset_index(drop=True), errors='coerce')
+        frame['fecha'] = fecha.dt.date
+
+        frame['created_at'] = datetime.utcnow()
+
+        return frame[LOAD_COLUMNS]
+
+    def iter_records(self, frame: pd.DataFrame) -> Iterator[List[dict]]:
+        """Genera lotes de diccionarios con None en lugar de NaN/NA"""
+        for start in range(0, len(frame), self.batch_size):
+            batch = frame.iloc[start:start + self.batch_size].astype(object)
+            batch = batch.where(batch.notna(), None)
+            yield batch.to_dict("records")
+
+    def iter_csv_chunks(self, frame: pd.DataFrame) -> Iterator[str]:
+        """Genera el CSV del COPY lote a lote"""
+        for start in range(0, len(frame), self.batch_size):
+            yield frame.iloc[start:start + self.batch_size].to_csv(
+                header=False,
+                index=False,
+                na_rep=COPY_NULL,
+                date_format="%Y-%m-%d %H:%M:%S.%f"
+            )
+
+    def _insert_batches(self, connection, frame: pd.DataFrame, table: str):
+        """SQLite y otros motores: executemany por lotes con insert() de Core"""
+        statement = insert(landing_table(table))
+        for records in self.iter_records(frame):
+            connection.execute(statement, records)
+
+    def _copy_postgres(self, connection, frame: pd.DataFrame, table: str):
+        """PostgreSQL: COPY FROM STDIN con el CSV en streaming"""
+        columns = ", ".join(f'"{col}"' for col in LOAD_COLUMNS)
+        copy_sql = (
+            f'COPY "{table}" ({columns}) '
+            f"FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')"
+        )
+        stream = _CsvBatchStream(self.iter_csv_chunks(frame))
+        cursor = connection.connection.dbapi_connection.cursor()
+        try:
+            cursor.copy_expert(copy_sql, stream, size=1 << 16)
+        finally:
+            cursor.close()
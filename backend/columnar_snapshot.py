@@ -0,0 +1,460 @@
+"""
+Snapshot columnar en memoria de balance_reports (opcional: SNAPSHOT_ENABLED)
+Cada periodo es un segmento de arrays numpy ordenado por id, así el orden
+(periodo, id) de los endpoints sale de recorrer los segmentos en orden. Los
+textos se guardan como códigos de diccionarios compartidos por todos los
+periodos y cada segmento tiene un índice ordenado por codigo_cuenta_contable.
+La vigencia se controla con data_versions: antes de responder se compara la
+versión de cada periodo y solo se recargan los que cambiaron (también los que
+cargó otro worker). ETLService recarga los periodos que acaba de confirmar
+Las filas sin periodo no entran al snapshot
+"""
+import logging
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from config import get_settings
+from database import BalancePeriodSummary, BalanceReport, DataVersion, get_db_session
+from metrics import SNAPSHOT_REFRESH_ERRORS
+from powerbi_export import EXPORT_FIELDS, MONEY_FIELDS, select_columns
+
+logger = logging.getLogger(__name__)
+
+STRING_FIELDS = ("nombre_cuenta_contable", "cod_relacional", "identificacion", "sucursal", "nombre_tercero")
+INT_FIELDS = ("id", "codigo_cuenta_contable", "año", "periodo")
+
+# Fila con los campos de EXPORT_FIELDS: sirve para rows_to_columnar_bytes y para _balance_report_to_dict
+SnapshotRow = namedtuple("SnapshotRow", EXPORT_FIELDS)
+
+
+class StringDictionary:
+    """Texto <-> código int32 (-1 = NULL); solo crece, compartido por todos los segmentos"""
+
+    def __init__(self):
+        self._codes: Dict[str, int] = {}
+        self._values: List[str] = []
+        self._array: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def encode(self, values: pd.Series) -> np.ndarray:
+        """Códigos de una columna: factorize local y luego un código global por valor distinto"""
+        local_codes, uniques = pd.factorize(values, use_na_sentinel=True)
+        with self._lock:
+            mapping = np.empty(len(uniques) + 1, dtype=np.int32)
+            for position, value in enumerate(uniques):
+                code = self._codes.get(value)
+                if code is None:
+                    code = len(self._values)
+                    self._codes[value] = code
+                    self._values.append(value)
+                mapping[position] = code
+            mapping[-1] = -1
+        # El sentinel -1 de factorize apunta a la última posición de mapping (NULL)
+        return mapping[local_codes]
+
+    def code(self, value: str) -> Optional[int]:
+        """Código de un valor sin agregarlo (None si nunca apareció)"""
+        return self._codes.get(value)
+
+    def decode(self, codes: np.ndarray) -> list:
+        with self._lock:
+            if self._array is None or len(self._array) != len(self._values) + 1:
+                # La última posición corresponde al código -1
+                self._array = np.array(self._values + [None], dtype=object)
+            array = self._array
+        return array[codes].tolist()
+
+    @property
+    def nbytes(self) -> int:
+        """Aproximado: textos + dict + lista + array de decodificación"""
+        with self._lock:
+            strings = sum(sys.getsizeof(value) for value in self._values)
+            array = self._array.nbytes if self._array is not None else 0
+            return strings + sys.getsizeof(self._codes) + sys.getsizeof(self._values) + array
+
+
+@dataclass
+class PeriodSegment:
+    """Filas de un periodo ordenadas por id + índice ordenado por cuenta"""
+    periodo: int
+    version: int
+    columns: Dict[str, np.ndarray]
+    cuenta_order: np.ndarray  # posiciones ordenadas por codigo_cuenta_contable
+    cuenta_sorted: np.ndarray  # codigo_cuenta_contable[cuenta_order]
+    year_totals: Dict[int, Tuple[int, float]] = field(default_factory=dict)  # año -> (filas, Σ saldo_final)
+
+    @property
+    def rows(self) -> int:
+        return len(self.columns["id"])
+
+    def match(
+        self,
+        año: Optional[int],
+        codigo_cuenta: Optional[int],
+        codes: Dict[str, int]
+    ) -> np.ndarray:
+        """Posiciones (ordenadas por id) que cumplen los filtros; codes = código de cada texto filtrado"""
+        if codigo_cuenta is not None:
+            # Índice ordenado: rango con searchsorted y vuelta al orden por id
+            lo, hi = np.searchsorted(self.cuenta_sorted, [codigo_cuenta, codigo_cuenta + 1])
+            positions = np.sort(self.cuenta_order[lo:hi])
+        else:
+            positions = None
+
+        mask = None
+        if año is not None:
+            mask = self.columns["año"] == año
+        for field, code in codes.items():
+            field_mask = self.columns[field] == code
+            mask = field_mask if mask is None else mask & field_mask
+
+        if positions is None:
+            return np.arange(self.rows) if mask is None else np.flatnonzero(mask)
+        return positions if mask is None else positions[mask[positions]]
+
+    def materialize(self, positions: np.ndarray, dictionaries: Dict[str, StringDictionary]) -> List[SnapshotRow]:
+        """Filas Python (None para NULL) en el orden de EXPORT_FIELDS"""
+        values = []
+        for field in EXPORT_FIELDS:
+            column = self.columns[field][positions]
+            if field in STRING_FIELDS:
+                values.append(dictionaries[field].decode(column))
+            elif field in INT_FIELDS:
+                null = np.iinfo(column.dtype).min
+                values.append([None if value == null else value for value in column.tolist()])
+            elif field in MONEY_FIELDS:
+                values.append([None if value != value else value for value in column.tolist()])
+            else:
+                # datetime64 -> date / datetime (NaT -> None)
+                values.append(column.astype(object).tolist())
+        return [SnapshotRow._make(row) for row in zip(*values)]
+
+
+def _int_column(series: pd.Series, dtype) -> np.ndarray:
+    """Enteros con NULL representado por el mínimo del tipo"""
+    return series.astype("Int64").fillna(np.iinfo(dtype).min).to_numpy(dtype=dtype)
+
+
+class ColumnarSnapshot:
+    """Segmentos por periodo + diccionarios de textos; se sincroniza con data_versions"""
+
+    def __init__(self):
+        self.dictionaries = {field: StringDictionary() for field in STRING_FIELDS}
+        # Se reemplaza completo (copy-on-write): las lecturas no necesitan lock
+        self._segments: Dict[int, PeriodSegment] = {}
+        # Protege el reemplazo de _segments, _inflight y los contadores (nunca una lectura de la base)
+        self._lock = threading.Lock()
+        self._inflight: Dict[Tuple[int, int], Future] = {}
+        self._loaded = False
+        self._counters = {"syncs": 0, "period_loads": 0, "period_drops": 0, "load_seconds": 0.0}
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    # ---------- Carga ----------
+
+    @staticmethod
+    def _current_versions(db: Session, periods: Optional[Iterable[int]] = None) -> Dict[int, int]:
+        """Periodos con datos (resumen por periodo) y su versión en data_versions (0 si no tiene)"""
+        statement = select(
+            BalancePeriodSummary.periodo, func.coalesce(DataVersion.version, 0)
+        ).outerjoin(DataVersion, DataVersion.periodo == BalancePeriodSummary.periodo)
+        if periods is not None:
+            statement = statement.where(BalancePeriodSummary.periodo.in_(sorted(periods)))
+        return {int(periodo): int(version) for periodo, version in db.execute(statement)}
+
+    def _load_segment(self, db: Session, periodo: int, version: int) -> Optional[PeriodSegment]:
+        statement = select(*select_columns("arrow")).where(
+            BalanceReport.periodo == periodo
+        ).order_by(BalanceReport.id)
+        frame = pd.read_sql(statement, db.connection())
+        if frame.empty:
+            return None
+
+        columns = {}
+        for field in EXPORT_FIELDS:
+            series = frame[field]
+            if field in STRING_FIELDS:
+                columns[field] = self.dictionaries[field].encode(series)
+            elif field in INT_FIELDS:
+                columns[field] = _int_column(series, np.int32 if field in ("año", "periodo") else np.int64)
+            elif field in MONEY_FIELDS:
+                columns[field] = series.to_numpy(dtype=np.float64, na_value=np.nan)
+            elif field == "fecha":
+                columns[field] = pd.to_datetime(series).to_numpy(dtype="datetime64[D]")
+            else:
+                columns[field] = pd.to_datetime(series).to_numpy(dtype="datetime64[us]")
+
+        cuenta_order = np.argsort(columns["codigo_cuenta_contable"], kind="stable")
+        # Totales para stats (el año de un periodo casi siempre es uno solo)
+        years = columns["año"]
+        year_totals = {}
+        for year in np.unique(years[years != np.iinfo(years.dtype).min]).tolist():
+            mask = years == year
+            year_totals[year] = (int(np.count_nonzero(mask)), float(np.nansum(columns["saldo_final"][mask])))
+        return PeriodSegment(
+            periodo=periodo,
+            version=version,
+            columns=columns,
+            cuenta_order=cuenta_order,
+            cuenta_sorted=columns["codigo_cuenta_contable"][cuenta_order],
+            year_totals=year_totals,
+        )
+
+    def _load_segments(self, db: Session, versions: Dict[int, int]) -> Dict[int, Tuple[int, Optional[PeriodSegment]]]:
+        """
+        Lee los periodos de versions fuera de _lock: las demás sincronizaciones y la
+        recarga del ETL no esperan la lectura. Un periodo + versión que ya está
+        cargando otro hilo se espera en lugar de leerse dos veces
+        """
+        owned, waiting = {}, {}
+        with self._lock:
+            for key in sorted(versions.items()):
+                future = self._inflight.get(key)
+                if future is None:
+                    owned[key] = self._inflight[key] = Future()
+                else:
+                    waiting[key] = future
+
+        started = time.perf_counter()
+        loaded = {}
+        try:
+            for (periodo, version), future in owned.items():
+                try:
+                    segment = self._load_segment(db, periodo, version)
+                except BaseException as e:
+                    future.set_exception(e)
+                    raise
+                future.set_result(segment)
+                loaded[periodo] = (version, segment)
+        finally:
+            with self._lock:
+                for key, future in owned.items():
+                    del self._inflight[key]
+                    # Los que quedaron sin leer por un error: quien los espera falla también
+                    future.cancel()
+                self._counters["period_loads"] += len(loaded)
+                self._counters["load_seconds"] += time.perf_counter() - started
+
+        for (periodo, version), future in waiting.items():
+            loaded[periodo] = (version, future.result())
+        return loaded
+
+    def _install(self, loaded: Dict[int, Tuple[int, Optional[PeriodSegment]]], removed: Iterable[int]):
+        """Reemplaza los segmentos leídos y quita removed (bajo _lock; no toca la base)"""
+        with self._lock:
+            segments = dict(self._segments)
+            for periodo in removed:
+                if segments.pop(periodo, None) is not None:
+                    self._counters["period_drops"] += 1
+            for periodo, (version, segment) in loaded.items():
+                current = segments.get(periodo)
+                if current is not None and current.version > version:
+                    # Otro hilo ya instaló una versión más nueva mientras se leía esta
+                    continue
+                if segment is None:
+                    segments.pop(periodo, None)
+                else:
+                    segments[periodo] = segment
+            self._segments = dict(sorted(segments.items()))
+
+    def sync(self, db: Session):
+        """
+        Deja el snapshot igual a la base: una consulta a las versiones por periodo y
+        recarga solo los periodos nuevos o con otra versión (la primera vez, todos)
+        La versión se lee antes que las filas: si el ETL confirma en medio, la
+        próxima sincronización vuelve a cargar el periodo
+        """
+        versions = self._current_versions(db)
+        segments = self._segments
+        stale = {
+            periodo: version for periodo, version in versions.items()
+            if periodo not in segments or segments[periodo].version != version
+        }
+        removed = [periodo for periodo in segments if periodo not in versions]
+        self._counters["syncs"] += 1
+        if not stale and not removed and self._loaded:
+            return
+
+        self._install(self._load_segments(db, stale), removed)
+        self._loaded = True
+
+    def refresh_periods(self, db: Session, periods: Iterable[int]):
+        """Recarga los periodos indicados (ej: después de un commit del ETL)"""
+        periods = sorted({int(p) for p in periods if p is not None})
+        if not periods:
+            return
+        versions = self._current_versions(db, periods)
+        self._install(self._load_segments(db, versions), [p for p in periods if p not in versions])
+
+    # ---------- Consultas ----------
+
+    def _segments_for(self, año: Optional[int], periodo: Optional[int]) -> List[PeriodSegment]:
+        segments = self._segments
+        if periodo is not None:
+            segment = segments.get(periodo)
+            return [segment] if segment is not None else []
+        if año is not None:
+            return [s for p, s in segments.items() if año * 100 <= p <= año * 100 + 99]
+        return list(segments.values())
+
+    def _text_codes(self, **values) -> Optional[Dict[str, int]]:
+        """Códigos de los filtros de texto; None si algún valor no existe (resultado vacío)"""
+        codes = {}
+        for field, value in values.items():
+            if value is None:
+                continue
+            code = self.dictionaries[field].code(value)
+            if code is None:
+                return None
+            codes[field] = code
+        return codes
+
+    def page(
+        self,
+        año: Optional[int] = None,
+        periodo: Optional[int] = None,
+        codigo_cuenta: Optional[int] = None,
+        cod_relacional: Optional[str] = None,
+        identificacion: Optional[str] = None,
+        limit: int = 1000,
+        offset: int = 0,
+        after: Optional[Tuple[int, int]] = None,
+        include_total: bool = False
+    ) -> Tuple[List[SnapshotRow], Optional[int], bool]:
+        """
+        Página ordenada por (periodo, id): offset o keyset (after = último (periodo, id))
+        Devuelve (filas, total sin el cursor o None, hay_más)
+        """
+        codes = self._text_codes(cod_relacional=cod_relacional, identificacion=identificacion)
+        if codes is None:
+            return [], (0 if include_total else None), False
+
+        wanted = limit + 1  # una fila extra para saber si hay más
+        skip = 0 if after is not None else offset
+        picked: List[Tuple[PeriodSegment, np.ndarray]] = []
+        collected = 0
+        total = 0
+        for segment in self._segments_for(año, periodo):
+            if collected >= wanted and not include_total:
+                break
+            positions = segment.match(año, codigo_cuenta, codes)
+            total += len(positions)
+            if collected >= wanted:
+                continue
+            if after is not None:
+                if segment.periodo < after[0]:
+                    continue
+                if segment.periodo == after[0]:
+                    positions = positions[segment.columns["id"][positions] > after[1]]
+            if skip:
+                if len(positions) <= skip:
+                    skip -= len(positions)
+                    continue
+                positions = positions[skip:]
+                skip = 0
+            positions = positions[:wanted - collected]
+            if len(positions):
+                picked.append((segment, positions))
+                collected += len(positions)
+
+        rows = []
+        for segment, positions in picked:
+            rows.extend(segment.materialize(positions, self.dictionaries))
+        has_more = len(rows) > limit
+        return rows[:limit], (total if include_total else None), has_more
+
+    def summary_stats(self, año: Optional[int] = None) -> dict:
+        """Mismo contenido que period_summary.summary_stats, calculado de los arrays"""
+        segments = self._segments
+        total_records = 0
+        total_saldo_final = 0.0
+        years = set()
+        for segment in segments.values():
+            years.update(segment.year_totals)
+            for year, (rows, saldo_final) in segment.year_totals.items():
+                if año is None or year == año:
+                    total_records += rows
+                    total_saldo_final += saldo_final
+        return {
+            "total_records": total_records,
+            # Centavos, como la suma NUMERIC de la base
+            "total_saldo_final": round(total_saldo_final, 2),
+            "years": sorted(years),
+            "periods": sorted(segments),
+        }
+
+    def memory_stats(self) -> dict:
+        """Bytes por columna (arrays de todos los segmentos), índices y diccionarios"""
+        segments = self._segments
+        columns = {field: 0 for field in EXPORT_FIELDS}
+        indexes = 0
+        for segment in segments.values():
+            for field, array in segment.columns.items():
+                columns[field] += array.nbytes
+            indexes += segment.cuenta_order.nbytes + segment.cuenta_sorted.nbytes
+        dictionaries = {
+            field: {"values": len(dictionary), "bytes": dictionary.nbytes}
+            for field, dictionary in self.dictionaries.items()
+        }
+        total = sum(columns.values()) + indexes + sum(d["bytes"] for d in dictionaries.values())
+        return {
+            "loaded": self._loaded,
+            "periods": len(segments),
+            "rows": sum(segment.rows for segment in segments.values()),
+            "bytes": total,
+            "column_bytes": columns,
+            "index_bytes": indexes,
+            "dictionaries": dictionaries,
+            **self._counters,
+        }
+
+
+_snapshot: Optional[ColumnarSnapshot] = None
+_snapshot_lock = threading.Lock()
+
+
+def get_columnar_snapshot() -> Optional[ColumnarSnapshot]:
+    """Snapshot del proceso (se crea vacío la primera vez); None si SNAPSHOT_ENABLED = false"""
+    global _snapshot
+
+    if not get_settings().snapshot_enabled:
+        return None
+
+    if _snapshot is None:
+        with _snapshot_lock:
+            if _snapshot is None:
+                _snapshot = ColumnarSnapshot()
+    return _snapshot
+
+
+def refresh_snapshot(periods: Sequence[int]):
+    """
+    Llamado por ETLService después de confirmar periodos: si el snapshot de este
+    proceso ya está cargado, recarga solo esos periodos (los demás workers los
+    detectan por data_versions en su próxima consulta)
+    """
+    snapshot = get_columnar_snapshot()
+    if snapshot is None or not snapshot.loaded:
+        return
+    db = get_db_session()
+    try:
+        snapshot.refresh_periods(db, periods)
+    except Exception:
+        # El snapshot se corrige en la próxima sincronización; no debe fallar el ETL
+        SNAPSHOT_REFRESH_ERRORS.inc()
+        logger.warning("No se pudo actualizar el snapshot columnar (periodos %s)", list(periods), exc_info=True)
+    finally:
+        db.close()
@@ -7,6 +7,8 @@ class Settings(BaseSettings):
     siigo_partner_id: str
     siigo_base_url: str
     siigo_username: str
+    siigo_token_default_ttl: int = 86400  # segundos si /auth no envía expires_in
+    siigo_token_refresh_margin: int = 300  # renovar el token antes de que expire
     backend_port: int = 8000
     
     # Configuración de PostgreSQL
@@ -15,6 +17,66 @@ class Settings(BaseSettings):
     db_name: str = "siigo_db"
     db_user: str = "postgres"
     db_password: str = "postgres"
+    db_backend: str = "auto"  # auto | postgresql | sqlite
+
+    # Pool de conexiones (un engine por proceso)
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_recycle: int = 1800  # segundos
+    db_pool_timeout: int = 30  # segundos de espera por una conexión libre
+    # Endpoints de lectura con asyncpg / aiosqlite (async_database). Abre un pool aparte
+    # que se suma al anterior; desactivado, las consultas usan el pool síncrono en hilos
+    db_async_driver: bool = False
+    db_async_pool_size: int = 5
+    db_async_max_overflow: int = 5
+
+    # Carga masiva del ETL (filas por lote de COPY / executemany)
+    etl_batch_size: int = 5000
+
+    # Concurrencia del ETL: periodos en vuelo y cuota de peticiones a Siigo
+    etl_max_concurrency: int = 3
+    siigo_rate_limit_per_minute: int = 60
+    siigo_rate_limit_burst: int = 3
+    excel_parse_workers: int = 2  # procesos para parsear Excel (0 = hilo en el mismo proceso)
+
+    # Jobs del ETL en segundo plano (cola en la tabla etl_jobs)
+    etl_job_workers: int = 1  # jobs simultáneos por proceso (0 = este proceso no ejecuta jobs)
+    etl_job_queue_size: int = 20  # máximo de jobs en cola; más allá se responde 429
+    etl_job_poll_interval: float = 2.0  # segundos entre consultas de la cola
+    etl_job_heartbeat_interval: float = 5.0  # segundos entre latidos / revisión de cancelación
+    etl_job_stale_after: float = 120.0  # sin latido por más tiempo: el job se vuelve a encolar
+
+    # Caché en disco de los Excel descargados (replay sin llamar a Siigo)
+    # Desactivada por defecto: guarda los reportes contables completos en disco.
+    # Con EXCEL_CACHE_ENABLED=true los directorios se crean solo para el usuario (0700)
+    excel_cache_enabled: bool = False
+    excel_cache_dir: str = ""  # vacío = backend/data/excel_cache
+    excel_cache_max_bytes: int = 2 * 1024 * 1024 * 1024
+
+    # Caché de respuestas de Power BI (invalidada por data_versions)
+    response_cache_enabled: bool = True
+    response_cache_ttl: float = 300.0  # segundos
+    response_cache_max_bytes: int = 64 * 1024 * 1024
+
+    # Snapshot columnar en memoria de balance_reports para Power BI (cada worker tiene el suyo)
+    snapshot_enabled: bool = False
+
+    # Saldos a una fecha (balance_timeline): claves por consulta del endpoint por lotes
+    balance_query_chunk_keys: int = 500
+
+    # Exportación en streaming para Power BI (filas por lote del cursor)
+    export_chunk_rows: int = 5000
+
+    # Cliente HTTP compartido (keep-alive) para Siigo y descargas de Excel
+    http2_enabled: bool = True  # solo si el paquete h2 está instalado
+    http_max_connections: int = 20
+    http_max_keepalive_connections: int = 10
+    http_keepalive_expiry: float = 30.0  # segundos
+    http_connect_timeout: float = 10.0
+    http_timeout: float = 60.0
+    siigo_auth_timeout: float = 30.0
+    siigo_report_timeout: float = 60.0
+    excel_download_timeout: float = 120.0
 
     class Config:
         env_file = "../.env"
@@ -0,0 +1,50 @@
+"""
+Versiones de datos por periodo (tabla data_versions)
+ETLService las incrementa en la misma transacción que modifica fact_balance;
+las cachés las leen para saber si una respuesta guardada sigue vigente
+"""
+from datetime import datetime
+from typing import Iterable, Optional
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from database import DataVersion, upsert
+
+
+def bump_periods(db: Session, periods: Iterable[int]):
+    """
+    Incrementa la versión de los periodos indicados (sin commit)
+    Un solo INSERT ... ON CONFLICT DO UPDATE: dos cargas concurrentes del mismo
+    periodo nuevo no chocan con la clave ni pierden un incremento
+    """
+    now = datetime.utcnow()
+    rows = [
+        {"periodo": periodo, "version": 1, "updated_at": now}
+        for periodo in sorted({int(p) for p in periods if p is not None})
+    ]
+    if not rows:
+        return
+    statement = upsert(db, DataVersion)
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[DataVersion.periodo],
+            set_={"version": DataVersion.version + 1, "updated_at": statement.excluded.updated_at}
+        ),
+        rows
+    )
+
+
+def version_token(db: Session, año: Optional[int] = None, periodo: Optional[int] = None) -> str:
+    """
+    Resumen de las versiones de los periodos que puede tocar una consulta
+    Cambia cada vez que alguno de ellos se vuelve a cargar
+    """
+    statement = select(
+        func.count(DataVersion.periodo),
+        func.coalesce(func.sum(DataVersion.version), 0)
+    )
+    if periodo is not None:
+        statement = statement.where(DataVersion.periodo == periodo)
+    if año is not None:
+        statement = statement.where(DataVersion.periodo.between(año * 100, año * 100 + 99))
+    count, total = db.execute(statement).one()
+    return f"{count}.{total}"
@@ -0,0 +1,463 @@
+"""
+Jobs del ETL en segundo plano (tabla etl_jobs)
+Los endpoints ETL con background=true encolan un job y responden de inmediato
+con su id. Cada proceso de uvicorn ejecuta un ETLJobRunner con N workers que
+toman jobs de la cola con un UPDATE condicional (un job lo ejecuta un solo
+proceso), publican el avance por periodo y revisan si se pidió cancelarlo.
+Como la cola vive en la base, sobrevive reinicios y se consulta desde cualquier worker
+"""
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import func, insert, literal, select, text, update
+from sqlalchemy.orm import Session
+from config import get_settings
+from database import EtlJob, get_db_session
+
+
+JOB_KINDS = ("process-year", "process-previous-year", "process-date-range")
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+# Clave del advisory lock que serializa los enqueue en PostgreSQL (ver enqueue_job)
+ENQUEUE_LOCK_KEY = 7_351_043
+
+
+class JobQueueFull(Exception):
+    """La cola ya tiene etl_job_queue_size jobs esperando"""
+
+
+def worker_identity() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _period_label(year: int, month: int) -> str:
+    return f"{year}-{month:02d}"
+
+
+# ==========================
+# Persistencia (sin commit: lo hace quien llama)
+# ==========================
+
+def enqueue_job(db: Session, kind: str, params: dict, max_queued: int) -> EtlJob:
+    """
+    Agrega un job a la cola; JobQueueFull si ya hay max_queued esperando
+    El conteo y el INSERT son una sola sentencia (INSERT ... SELECT ... WHERE
+    conteo < max_queued), así dos pedidos simultáneos no pasan ambos el límite.
+    En SQLite las escrituras ya se serializan; en PostgreSQL (READ COMMITTED)
+    cada sentencia no ve el INSERT sin confirmar de la otra, por eso se toma
+    además un advisory lock hasta el commit
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Tipo de job desconocido: {kind}")
+
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text(f"SELECT pg_advisory_xact_lock({ENQUEUE_LOCK_KEY})"))
+
+    values = {
+        "id": uuid.uuid4().hex,
+        "kind": kind,
+        "params": params,
+        "status": "queued",
+        "cancel_requested": False,
+        "attempts": 0,
+        "created_at": datetime.utcnow(),
+    }
+    columns = EtlJob.__table__.c
+    queued = select(func.count()).select_from(EtlJob).where(EtlJob.status == "queued").scalar_subquery()
+    result = db.execute(
+        insert(EtlJob).from_select(
+            list(values),
+            select(*[literal(value, columns[name].type) for name, value in values.items()])
+            .where(queued < max_queued)
+        )
+    )
+    if result.rowcount != 1:
+        raise JobQueueFull(f"La cola de jobs ETL está llena ({max_queued} en espera)")
+    return get_job(db, values["id"])
+
+
+def claim_next_job(db: Session, worker_id: str) -> Optional[str]:
+    """
+    Toma el job en cola más antiguo para worker_id y retorna su id
+    El UPDATE ... WHERE status = 'queued' solo afecta una fila si nadie lo tomó
+    antes: con varios procesos compitiendo, cada job queda en uno solo
+    """
+    candidates = db.execute(
+        select(EtlJob.id)
+        .where(EtlJob.status == "queued")
+        .order_by(EtlJob.created_at)
+        .limit(5)
+    ).scalars().all()
+
+    now = datetime.utcnow()
+    for job_id in candidates:
+        result = db.execute(
+            update(EtlJob)
+            .where(EtlJob.id == job_id, EtlJob.status == "queued")
+            .values(
+                status="running",
+                worker_id=worker_id,
+                attempts=EtlJob.attempts + 1,
+                started_at=now,
+                heartbeat_at=now
+            )
+        )
+        if result.rowcount == 1:
+            return job_id
+    return None
+
+
+def touch_job(db: Session, job_id: str, progress: Optional[dict] = None) -> bool:
+    """Latido del job (y avance si se pasa); retorna True si se pidió cancelarlo"""
+    values = {"heartbeat_at": datetime.utcnow()}
+    if progress is not None:
+        values["progress"] = progress
+    db.execute(
+        update(EtlJob)
+        .where(EtlJob.id == job_id, EtlJob.status == "running")
+        .values(**values)
+    )
+    return bool(db.execute(
+        select(EtlJob.cancel_requested).where(EtlJob.id == job_id)
+    ).scalar())
+
+
+def finish_job(
+    db: Session,
+    job_id: str,
+    status: str,
+    progress: Optional[dict] = None,
+    result: Optional[dict] = None,
+    error: Optional[str] = None
+):
+    values = {"status": status, "finished_at": datetime.utcnow(), "result": result, "error": error}
+    if progress is not None:
+        values["progress"] = progress
+    db.execute(update(EtlJob).where(EtlJob.id == job_id).values(**values))
+
+
+def requeue_job(db: Session, job_id: str):
+    """Devuelve a la cola un job interrumpido por el apagado del proceso"""
+    db.execute(
+        update(EtlJob)
+        .where(EtlJob.id == job_id, EtlJob.status == "running")
+        .values(status="queued", worker_id=None)
+    )
+
+
+def requeue_stale_jobs(db: Session, stale_after: float) -> int:
+    """
+    Jobs 'running' sin latido reciente (su proceso murió): se vuelven a encolar,
+    o se dan por cancelados si ya se había pedido cancelarlos
+    Reejecutarlos es seguro: los periodos ya cargados se omiten por hash
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=stale_after)
+    stale = (EtlJob.status == "running", EtlJob.heartbeat_at < cutoff)
+    db.execute(
+        update(EtlJob)
+        .where(*stale, EtlJob.cancel_requested.is_(True))
+        .values(status="cancelled", finished_at=datetime.utcnow())
+    )
+    result = db.execute(
+        update(EtlJob)
+        .where(*stale)
+        .values(status="queued", worker_id=None)
+    )
+    return result.rowcount
+
+
+def request_cancel(db: Session, job_id: str) -> Optional[EtlJob]:
+    """
+    En cola: se cancela de inmediato. En ejecución: se marca cancel_requested y
+    el proceso que lo ejecuta lo detiene en su próximo latido; la escritura de
+    periodo en curso se revierte antes de su commit y el job figura como
+    cancelling hasta que su hilo termina
+    Retorna el job (None si no existe)
+    """
+    db.execute(
+        update(EtlJob)
+        .where(EtlJob.id == job_id, EtlJob.status == "queued")
+        .values(status="cancelled", cancel_requested=True, finished_at=datetime.utcnow())
+    )
+    db.execute(
+        update(EtlJob)
+        .where(EtlJob.id == job_id, EtlJob.status == "running")
+        .values(cancel_requested=True)
+    )
+    return get_job(db, job_id)
+
+
+def get_job(db: Session, job_id: str) -> Optional[EtlJob]:
+    return db.execute(select(EtlJob).where(EtlJob.id == job_id)).scalar_one_or_none()
+
+
+def job_spec(db: Session, job_id: str) -> Tuple[str, dict]:
+    """(kind, params) del job para ejecutarlo fuera de la sesión"""
+    job = get_job(db, job_id)
+    return job.kind, dict(job.params or {})
+
+
+def list_jobs(db: Session, status: Optional[str] = None, limit: int = 50) -> List[EtlJob]:
+    query = select(EtlJob).order_by(EtlJob.created_at.desc()).limit(limit)
+    if status == "cancelling":
+        query = query.where(EtlJob.status == "running", EtlJob.cancel_requested.is_(True))
+    elif status:
+        query = query.where(EtlJob.status == status)
+    return list(db.execute(query).scalars())
+
+
+def job_to_dict(job: EtlJob) -> dict:
+    """
+    Estado del job para la API; un job en ejecución con cancelación pedida figura
+    como cancelling hasta que termine la escritura que tenga en curso
+    """
+    def iso(value: Optional[datetime]) -> Optional[str]:
+        return value.isoformat() if value else None
+
+    duration = None
+    if job.started_at:
+        duration = round(((job.finished_at or datetime.utcnow()) - job.started_at).total_seconds(), 3)
+
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": "cancelling" if job.status == "running" and job.cancel_requested else job.status,
+        "params": job.params,
+        "cancel_requested": job.cancel_requested,
+        "progress": job.progress,
+        "result": job.result,
+        "error": job.error,
+        "worker_id": job.worker_id,
+        "attempts": job.attempts,
+        "created_at": iso(job.created_at),
+        "started_at": iso(job.started_at),
+        "finished_at": iso(job.finished_at),
+        "heartbeat_at": iso(job.heartbeat_at),
+        "duration_seconds": duration,
+    }
+
+
+# ==========================
+# Avance por periodo
+# ==========================
+
+class JobProgress:
+    """
+    Avance de un job por periodo: ETLService lo invoca al iniciar y terminar
+    cada periodo, y save() lo persiste en etl_jobs.progress
+    """
+
+    def __init__(self, save: Callable[[], Awaitable[None]]):
+        self.periods: Dict[str, dict] = {}
+        self._save = save
+
+    def snapshot(self) -> dict:
+        periods = list(self.periods.values())
+        return {
+            "total": len(periods),
+            "completed": sum(p["status"] in ("done", "skipped", "failed") for p in periods),
+            "failed": sum(p["status"] == "failed" for p in periods),
+            "rows": sum(p["rows"] for p in periods),
+            "periods": periods,
+        }
+
+    async def start(self, periods: Sequence[Tuple[int, int]]):
+        self.periods = {
+            _period_label(year, month): {
+                "periodo": _period_label(year, month),
+                "status": "pending",
+                "rows": 0,
+                "seconds": None,
+                "error": None,
+            }
+            for year, month in periods
+        }
+        await self._save()
+
+    async def period_started(self, year: int, month: int):
+        self.periods[_period_label(year, month)]["status"] = "running"
+        await self._save()
+
+    async def period_finished(
+        self,
+        year: int,
+        month: int,
+        rows: int = 0,
+        skipped: bool = False,
+        seconds: Optional[float] = None,
+        error: Optional[str] = None
+    ):
+        period = self.periods[_period_label(year, month)]
+        period["status"] = "failed" if error else "skipped" if skipped else "done"
+        period["rows"] = rows
+        period["seconds"] = round(seconds, 3) if seconds is not None else None
+        period["error"] = error
+        await self._save()
+
+    def mark_unfinished(self, status: str):
+        """Periodos que no llegaron a terminar (job cancelado)"""
+        for period in self.periods.values():
+            if period["status"] in ("pending", "running"):
+                period["status"] = status
+
+
+# ==========================
+# Runner
+# ==========================
+
+class ETLJobRunner:
+    """
+    Ejecuta jobs de etl_jobs en el event loop del proceso
+    - workers: jobs simultáneos en este proceso (los periodos de cada job
+      comparten el planificador y la cuota de Siigo de ETLService)
+    - un monitor periódico envía latidos, aplica cancelaciones pedidas desde
+      cualquier proceso y reencola jobs de procesos que murieron
+    """
+
+    def __init__(self, etl_service, workers: Optional[int] = None):
+        self.settings = get_settings()
+        self.etl_service = etl_service
+        self.workers = self.settings.etl_job_workers if workers is None else workers
+        self.worker_id = worker_identity()
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancelled: set = set()
+
+    async def start(self):
+        if self.workers <= 0 or self._tasks:
+            return
+        try:
+            await asyncio.to_thread(self._in_session, requeue_stale_jobs, self.settings.etl_job_stale_after)
+        except Exception as e:
+            print(f"⚠️  No se pudieron revisar los jobs ETL pendientes: {e}")
+        self._tasks = [asyncio.create_task(self._worker_loop()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._monitor_loop()))
+
+    async def stop(self):
+        """Detiene los workers; los jobs en curso vuelven a la cola para otro proceso"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Despierta a los workers locales (se acaba de encolar un job)"""
+        self._wakeup.set()
+
+    def cancel_local(self, job_id: str) -> bool:
+        """Cancela de inmediato un job si corre en este proceso"""
+        task = self._running.get(job_id)
+        if task is None:
+            return False
+        self._cancelled.add(job_id)
+        task.cancel()
+        return True
+
+    @staticmethod
+    def _in_session(operation: Callable, *args) -> Any:
+        """Ejecuta una operación de persistencia en su propia transacción"""
+        db = get_db_session()
+        try:
+            result = operation(db, *args)
+            db.commit()
+            return result
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def _worker_loop(self):
+        while True:
+            try:
+                job_id = await asyncio.to_thread(self._in_session, claim_next_job, self.worker_id)
+            except Exception as e:
+                print(f"⚠️  No se pudo consultar la cola de jobs ETL: {e}")
+                job_id = None
+
+            if job_id is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.settings.etl_job_poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._run_job(job_id)
+
+    async def _run_job(self, job_id: str):
+        kind, params = await asyncio.to_thread(self._in_session, job_spec, job_id)
+        save_lock = asyncio.Lock()
+
+        async def save():
+            # Con el lock cada escritura lleva la foto más reciente (sin desorden entre hilos)
+            async with save_lock:
+                try:
+                    await asyncio.to_thread(self._in_session, touch_job, job_id, progress.snapshot())
+                except Exception as e:
+                    print(f"⚠️  No se pudo guardar el avance del job {job_id}: {e}")
+
+        progress = JobProgress(save)
+        task = asyncio.create_task(self._execute(kind, params, progress))
+        self._running[job_id] = task
+        print(f"▶️  Job ETL {job_id} ({kind}) iniciado")
+
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            if job_id not in self._cancelled:
+                # Apagado del proceso: otro worker (o el próximo arranque) lo retoma
+                task.cancel()
+                await asyncio.to_thread(self._in_session, requeue_job, job_id)
+                raise
+            progress.mark_unfinished("cancelled")
+            await asyncio.to_thread(
+                self._in_session, finish_job, job_id, "cancelled", progress.snapshot()
+            )
+            print(f"⏹️  Job ETL {job_id} cancelado")
+        except Exception as e:
+            await asyncio.to_thread(
+                self._in_session, finish_job, job_id, "failed", progress.snapshot(), None, str(e)
+            )
+            print(f"ERROR en job ETL {job_id}: {e}")
+        else:
+            errors = result.get("errors") or []
+            status = "succeeded" if result.get("success", not errors) else "failed"
+            await asyncio.to_thread(
+                self._in_session, finish_job, job_id, status, progress.snapshot(),
+                result, "; ".join(errors) or None
+            )
+            print(f"✅ Job ETL {job_id} terminado: {status}")
+        finally:
+            self._running.pop(job_id, None)
+            self._cancelled.discard(job_id)
+
+    async def _execute(self, kind: str, params: dict, progress: JobProgress) -> dict:
+        method = {
+            "process-year": self.etl_service.process_year_report,
+            "process-previous-year": self.etl_service.process_previous_year,
+            "process-date-range": self.etl_service.process_date_range,
+        }[kind]
+        return await method(**params, progress=progress)
+
+    async def _monitor_loop(self):
+        while True:
+            await asyncio.sleep(self.settings.etl_job_heartbeat_interval)
+            for job_id in list(self._running):
+                try:
+                    cancel = await asyncio.to_thread(self._in_session, touch_job, job_id)
+                except Exception as e:
+                    print(f"⚠️  No se pudo registrar el latido del job {job_id}: {e}")
+                    continue
+                if cancel and job_id not in self._cancelled:
+                    self.cancel_local(job_id)
+            try:
+                await asyncio.to_thread(
+                    self._in_session, requeue_stale_jobs, self.settings.etl_job_stale_after
+                )
+            except Exception as e:
+                print(f"⚠️  No se pudieron revisar los jobs ETL sin latido: {e}")
@@ -3,21 +3,60 @@ Servicio ETL para procesar reportes de Siigo mes por mes
 Replica la lógica de PowerQuery
 """
 import asyncio
-from typing import List, Optional
+import threading
+import time
+from typing import Any, Callable, List, Optional, Tuple
 from datetime import date, datetime
 import pandas as pd
 from siigo_client import SiigoClient
 from excel_processor import ExcelProcessor
-from database import get_db_session, BalanceReport, init_db, get_db_engine
+from bulk_loader import BulkLoader, create_landing, drop_landing
+from period_scheduler import PeriodScheduler, TokenBucket
+from parse_pool import parse_excel_in_pool
+from excel_cache import get_excel_cache
+from period_summary import compute_periods, refresh_periods, replace_periods
+from balance_timeline import compute_timeline, refresh_timeline, replace_timeline
+from star_schema import load_facts
+from columnar_snapshot import refresh_snapshot
+from data_versions import bump_periods
+from partitions import (
+    create_staging, drop_table, finalize_staging, is_partitioned, prepare_partitions, swap_partition
+)
+from period_runs import PeriodRunKey, is_unchanged, record_period_run
+from config import get_settings
+from metrics import (
+    ETL_LOAD_ROWS_PER_SECOND, ETL_LOAD_SECONDS, ETL_PERIOD_ROWS, ETL_PERIOD_SECONDS, ETL_PERIODS,
+    ETL_ROWS_LOADED, SIIGO_RATE_LIMIT_RETRIES, set_span_attributes, span
+)
+from database import get_db_session, FactBalance, init_db, get_db_engine
 from sqlalchemy import delete
 
 
+class LoadCancelled(Exception):
+    """La carga de un periodo se revirtió porque se canceló el job"""
+
+
+def _raise_if_cancelled(cancel: Optional[threading.Event]):
+    if cancel is not None and cancel.is_set():
+        raise LoadCancelled("Carga cancelada: no se confirma")
+
+
 class ETLService:
     """Servicio para procesar y guardar reportes de Siigo en PostgreSQL"""
     
-    def __init__(self):
-        self.siigo_client = SiigoClient()
+    def __init__(self, siigo_client: Optional[SiigoClient] = None):
+        # Compartir el cliente permite un solo token para API y ETL
+        self.siigo_client = siigo_client or SiigoClient()
         self.excel_processor = ExcelProcessor()
+        self.bulk_loader = BulkLoader()
+        
+        settings = get_settings()
+        self.scheduler = PeriodScheduler(settings.etl_max_concurrency)
+        # Cuota de Siigo compartida por todas las ejecuciones del servicio
+        self.rate_limiter = TokenBucket(
+            rate=settings.siigo_rate_limit_per_minute / 60.0,
+            capacity=settings.siigo_rate_limit_burst
+        )
     
     async def process_year_report(
         self,
@@ -27,7 +66,10 @@ class ETLService:
         account_start: Optional[str] = None,
         account_end: Optional[str] = None,
         includes_tax_diff: bool = False,
-        clear_existing: bool = True
+        clear_existing: bool = True,
+        force: bool = False,
+        replay: bool = False,
+        progress: Optional[Any] = None
     ) -> dict:
         """
         Procesa reportes mes por mes para un año completo y los guarda en PostgreSQL
@@ -39,7 +81,10 @@ class ETLService:
             account_start: Código de cuenta inicial (opcional)
             account_end: Código de cuenta final (opcional)
             includes_tax_diff: Incluir diferencia de impuestos
-            clear_existing: Si True, elimina datos existentes del mismo año antes de insertar
+            clear_existing: Si True, reemplaza los datos existentes de cada mes al cargarlo
+            force: Si True, recarga los meses aunque el Excel no haya cambiado
+            replay: Si True, usa solo los Excel de la caché local (sin llamar a Siigo) e implica force
+            progress: Seguimiento por periodo (ver etl_jobs.JobProgress), opcional
             
         Returns:
             Diccionario con estadísticas del procesamiento
@@ -49,72 +94,50 @@ class ETLService:
         end_m = max(month_start, month_end)
         months = list(range(start_m, end_m + 1))
         
-        # Obtener token una sola vez (con retry para rate limit)
-        import asyncio
-        max_retries = 3
-        retry_delay = 2  # segundos
-        
-        for attempt in range(max_retries):
-            try:
-                token = await self.siigo_client.get_access_token()
-                break
-            except Exception as e:
-                if "429" in str(e) or "rate limit" in str(e).lower():
-                    if attempt < max_retries - 1:
-                        wait_time = retry_delay * (attempt + 1)
-                        print(f"⚠️  Rate limit alcanzado. Esperando {wait_time} segundos antes de reintentar...")
-                        await asyncio.sleep(wait_time)
-                        continue
-                raise
+        # Obtener token una sola vez (con retry para rate limit); replay no llama a Siigo
+        if not replay:
+            await self._with_rate_limit_retry(self.siigo_client.get_access_token)
         
         # Inicializar base de datos si no existe
         init_db()
-        
-        # Eliminar datos existentes si se solicita
-        if clear_existing:
-            await self._clear_year_data(year, months)
+        # Crear antes las particiones que faltan: durante las cargas paralelas no se toca la tabla padre
+        prepare_partitions(get_db_engine(), [year * 100 + m for m in months])
         
         total_rows = 0
         processed_months = []
+        skipped_months = []
         errors = []
         
-        # Procesar cada mes
-        for month in months:
-            try:
-                # Solicitar reporte para el mes específico (m..m)
-                result = await self.siigo_client.get_balance_report_by_thirdparty(
-                    year=year,
-                    month_start=month,
-                    month_end=month,
-                    account_start=account_start or "",
-                    account_end=account_end or "",
-                    includes_tax_diff=includes_tax_diff
-                )
-                
-                file_url = result.get('file_url')
-                if not file_url:
-                    errors.append(f"Mes {month}: No se recibió file_url")
-                    continue
-                
-                # Descargar Excel
-                excel_content = await self.excel_processor.download_excel(file_url)
-                
-                # Procesar Excel
-                df = self.excel_processor.process_excel(excel_content, year, month)
-                
-                # Guardar en PostgreSQL
-                rows_inserted = await self._save_to_database(df)
-                total_rows += rows_inserted
-                processed_months.append(month)
-                
-            except Exception as e:
-                error_msg = f"Mes {month}: {str(e)}"
+        # Procesar los meses con N periodos en vuelo (resultados en orden)
+        # Cada mes se reemplaza al cargarlo, y solo si su Excel cambió
+        periods = [(year, month) for month in months]
+        if progress is not None:
+            await progress.start(periods)
+        outcomes = await self.scheduler.run(
+            periods,
+            lambda y, m: self._track_period(
+                progress, y, m, account_start, account_end, includes_tax_diff, clear_existing,
+                force or replay, replay
+            ),
+            concurrency=self._replay_concurrency() if replay else None
+        )
+        
+        for (_, month), outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                error_msg = f"Mes {month}: {str(outcome)}"
                 errors.append(error_msg)
-                print(f"ERROR procesando mes {month}: {e}")
+                print(f"ERROR procesando mes {month}: {outcome}")
+                continue
+            if outcome["skipped"]:
+                skipped_months.append(month)
+                continue
+            total_rows += outcome["rows"]
+            processed_months.append(month)
         
         return {
             "year": year,
             "months_processed": processed_months,
+            "months_skipped": skipped_months,
             "total_rows": total_rows,
             "errors": errors,
             "success": len(errors) == 0
@@ -126,7 +149,10 @@ class ETLService:
         account_start: Optional[str] = None,
         account_end: Optional[str] = None,
         includes_tax_diff: bool = False,
-        clear_existing: bool = True
+        clear_existing: bool = True,
+        force: bool = False,
+        replay: bool = False,
+        progress: Optional[Any] = None
     ) -> dict:
         """
         Procesa el año anterior completo (meses 1-12 + mes 13 cierre) - Replica la segunda query de PowerQuery
@@ -137,6 +163,9 @@ class ETLService:
             account_end: Código de cuenta final (opcional)
             includes_tax_diff: Incluir diferencia de impuestos
             clear_existing: Si True, elimina datos existentes del año anterior
+            force: Si True, recarga los meses aunque el Excel no haya cambiado
+            replay: Si True, usa solo los Excel de la caché local (sin llamar a Siigo) e implica force
+            progress: Seguimiento por periodo (ver etl_jobs.JobProgress), opcional
             
         Returns:
             Diccionario con estadísticas del procesamiento
@@ -152,84 +181,405 @@ class ETLService:
             account_start=account_start,
             account_end=account_end,
             includes_tax_diff=includes_tax_diff,
-            clear_existing=clear_existing
+            clear_existing=clear_existing,
+            force=force,
+            replay=replay,
+            progress=progress
         )
     
-    async def _save_to_database(self, df: pd.DataFrame) -> int:
-        """Guarda un DataFrame en PostgreSQL"""
+    async def _with_rate_limit_retry(self, call, max_retries: int = 3, retry_delay: int = 2):
+        """Ejecuta una llamada a Siigo reintentando ante rate limit (429)"""
+        for attempt in range(max_retries):
+            try:
+                return await call()
+            except Exception as e:
+                if "429" in str(e) or "rate limit" in str(e).lower():
+                    if attempt < max_retries - 1:
+                        wait_time = retry_delay * (attempt + 1)
+                        SIIGO_RATE_LIMIT_RETRIES.inc()
+                        print(f"⚠️  Rate limit alcanzado. Esperando {wait_time} segundos antes de reintentar...")
+                        await asyncio.sleep(wait_time)
+                        continue
+                raise
+    
+    async def _request_report(
+        self,
+        year: int,
+        month: int,
+        account_start: Optional[str],
+        account_end: Optional[str],
+        includes_tax_diff: bool
+    ) -> dict:
+        """Solicita el reporte de un mes respetando la cuota de Siigo"""
+        await self.rate_limiter.acquire()
+        return await self.siigo_client.get_balance_report_by_thirdparty(
+            year=year,
+            month_start=month,
+            month_end=month,
+            account_start=account_start or "",
+            account_end=account_end or "",
+            includes_tax_diff=includes_tax_diff
+        )
+    
+    async def _track_period(
+        self,
+        progress: Optional[Any],
+        year: int,
+        month: int,
+        *args
+    ) -> dict:
+        """
+        _process_period con métricas y span del periodo; si hay progress (job en
+        segundo plano) le informa inicio, filas, tiempo y error
+        """
+        if progress is not None:
+            await progress.period_started(year, month)
+        started = time.perf_counter()
+        with span("etl.period", year=year, month=month):
+            try:
+                outcome = await self._process_period(year, month, *args)
+            except Exception as e:
+                seconds = time.perf_counter() - started
+                ETL_PERIOD_SECONDS.labels(outcome="failed").observe(seconds)
+                ETL_PERIODS.labels(outcome="failed").inc()
+                if progress is not None:
+                    await progress.period_finished(year, month, seconds=seconds, error=str(e))
+                raise
+            set_span_attributes(rows=outcome["rows"], skipped=outcome["skipped"])
+        
+        seconds = time.perf_counter() - started
+        result = "skipped" if outcome["skipped"] else "loaded"
+        ETL_PERIOD_SECONDS.labels(outcome=result).observe(seconds)
+        ETL_PERIODS.labels(outcome=result).inc()
+        if not outcome["skipped"]:
+            ETL_PERIOD_ROWS.observe(outcome["rows"])
+        if progress is not None:
+            await progress.period_finished(
+                year, month, rows=outcome["rows"], skipped=outcome["skipped"], seconds=seconds
+            )
+        return outcome
+    
+    async def _process_period(
+        self,
+        year: int,
+        month: int,
+        account_start: Optional[str],
+        account_end: Optional[str],
+        includes_tax_diff: bool,
+        clear_existing: bool = True,
+        force: bool = False,
+        replay: bool = False
+    ) -> dict:
+        """
+        Procesa un periodo: solicitar reporte -> descargar Excel -> procesar -> insertar
+        El parseo corre en el pool de procesos y la inserción en un hilo, para que
+        otros periodos avancen en paralelo sin bloquear el event loop
+        Si el Excel tiene el mismo hash que la última carga (y force es False) no
+        se parsea ni se escribe nada
+        Con replay el Excel sale de la caché local en vez de Siigo
+        
+        Returns:
+            {"rows": filas insertadas, "skipped": True si el periodo no cambió}
+        """
+        key = PeriodRunKey.build(year, month, account_start, account_end, includes_tax_diff)
+        excel_content = await self._fetch_excel(key, replay)
+        
+        content_hash = self.excel_processor.content_hash(excel_content)
+        if not force and await asyncio.to_thread(self._is_unchanged, key, content_hash):
+            print(f"⏭️  Sin cambios {year}-{month:02d}: se omite")
+            return {"rows": 0, "skipped": True}
+        
+        # Procesar Excel (y preparar las filas) en otro proceso
+        with span("excel.parse", bytes=len(excel_content)):
+            frame = await parse_excel_in_pool(excel_content, year, month)
+        
+        # Guardar en base de datos junto con el hash de esta carga; con clear_existing
+        # el mes se reemplaza de forma atómica (si algo falla conserva sus datos)
+        with span("etl.load", rows=len(frame)):
+            if clear_existing:
+                rows_inserted = await self._run_write(self._replace_period, frame, key, content_hash)
+            else:
+                rows_inserted = await self._save_to_database(
+                    frame, prepared=True, period_run=(key, content_hash)
+                )
+        # Snapshot columnar de este proceso (si está activo), ya con el periodo confirmado
+        await asyncio.to_thread(refresh_snapshot, [key.periodo])
+        print(f"✅ Procesado {year}-{month:02d}: {rows_inserted} registros")
+        return {"rows": rows_inserted, "skipped": False}
+    
+    async def _fetch_excel(self, key: PeriodRunKey, replay: bool = False) -> bytes:
+        """
+        Excel del periodo: de la caché local (replay) o pidiendo el reporte a Siigo
+        Cada descarga se guarda en la caché para poder repetir la transformación
+        """
+        cache = get_excel_cache()
+        if replay:
+            if cache is None:
+                raise Exception("replay requiere la caché de Excel (EXCEL_CACHE_ENABLED)")
+            with span("excel.cache"):
+                excel_content = await asyncio.to_thread(cache.get, key)
+            if excel_content is None:
+                raise Exception(f"No hay Excel en caché para {key.year}-{key.month:02d}")
+            return excel_content
+        
+        # Solicitar reporte para el mes específico (m..m)
+        with span("siigo.report"):
+            result = await self._with_rate_limit_retry(
+                lambda: self._request_report(
+                    key.year, key.month, key.account_start, key.account_end, key.includes_tax_diff
+                )
+            )
+        
+        file_url = result.get('file_url')
+        if not file_url:
+            raise Exception("No se recibió file_url")
+        
+        # Descargar Excel
+        with span("excel.download"):
+            excel_content = await self.excel_processor.download_excel(file_url)
+        
+        if cache is not None:
+            try:
+                await asyncio.to_thread(cache.put, key, excel_content)
+            except OSError as e:
+                # Sin caché el periodo se procesa igual
+                print(f"⚠️  No se pudo guardar el Excel {key.year}-{key.month:02d} en caché: {e}")
+        return excel_content
+    
+    @staticmethod
+    def _replay_concurrency() -> int:
+        """Replay no depende de la cuota de Siigo: tantos periodos como procesos de parseo"""
+        settings = get_settings()
+        return max(settings.etl_max_concurrency, settings.excel_parse_workers)
+    
+    @staticmethod
+    def _is_unchanged(key: PeriodRunKey, content_hash: str) -> bool:
+        db = get_db_session()
+        try:
+            return is_unchanged(db, key, content_hash)
+        finally:
+            db.close()
+    
+    async def _save_to_database(
+        self,
+        df: pd.DataFrame,
+        prepared: bool = False,
+        period_run: Optional[Tuple[PeriodRunKey, str]] = None
+    ) -> int:
+        """
+        Guarda un DataFrame en PostgreSQL usando carga masiva (COPY / executemany)
+        Corre en un hilo con el engine síncrono, como _replace_period: el COPY de
+        psycopg2 consume el CSV en streaming y armarlo es CPU que tampoco debe
+        correr en el event loop, así que un driver asíncrono no evitaría el hilo
+        """
+        return await self._run_write(self._save_dataframe, df, prepared, period_run)
+    
+    @staticmethod
+    async def _run_write(write: Callable[..., int], *args) -> int:
+        """
+        Ejecuta una escritura en un hilo pasándole un evento de cancelación
+        Cancelar la tarea (job cancelado) no detiene el hilo: se activa el evento,
+        la escritura se revierte en vez de confirmar (si el commit ya estaba en
+        curso, el periodo queda cargado) y se espera a que el hilo termine. Así el
+        job no se da por cancelado con una escritura todavía en curso
+        """
+        cancel = threading.Event()
+        future = asyncio.ensure_future(asyncio.to_thread(write, *args, cancel))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            cancel.set()
+            while not future.done():
+                try:
+                    await asyncio.wait([future])
+                except asyncio.CancelledError:
+                    pass
+            if not future.cancelled():
+                # El resultado (o LoadCancelled) ya no le interesa a nadie
+                future.exception()
+            raise
+    
+    def _save_dataframe(
+        self,
+        df: pd.DataFrame,
+        prepared: bool = False,
+        period_run: Optional[Tuple[PeriodRunKey, str]] = None,
+        cancel: Optional[threading.Event] = None
+    ) -> int:
+        """
+        Inserción síncrona (se ejecuta en un hilo del pool de asyncio)
+        period_run = (clave, hash) registra la carga en etl_period_runs en la misma transacción
+        cancel: si se activa antes del commit la carga se revierte (ver _run_write)
+        """
+        periods = df['periodo'].dropna().unique() if 'periodo' in df.columns else []
+        # Particiones de los periodos nuevos antes de abrir la transacción de la carga
+        prepare_partitions(get_db_engine(), periods)
         db = get_db_session()
-        rows_inserted = 0
+        started = time.perf_counter()
         
+        landing = None
         try:
-            for _, row in df.iterrows():
-                balance_record = BalanceReport(
-                    codigo_cuenta_contable=int(row['codigo_cuenta_contable']) if pd.notna(row['codigo_cuenta_contable']) else None,
-                    nombre_cuenta_contable=str(row['nombre_cuenta_contable']) if pd.notna(row['nombre_cuenta_contable']) else None,
-                    cod_relacional=str(row['cod_relacional']) if pd.notna(row['cod_relacional']) else None,
-                    identificacion=str(row['identificacion']) if pd.notna(row['identificacion']) else None,
-                    sucursal=str(row['sucursal']) if pd.notna(row['sucursal']) else None,
-                    nombre_tercero=str(row['nombre_tercero']) if pd.notna(row['nombre_tercero']) else None,
-                    saldo_inicial=float(row['saldo_inicial']) if pd.notna(row['saldo_inicial']) else None,
-                    movimiento_debito=float(row['movimiento_debito']) if pd.notna(row['movimiento_debito']) else None,
-                    movimiento_credito=float(row['movimiento_credito']) if pd.notna(row['movimiento_credito']) else None,
-                    movimiento=float(row['movimiento']) if pd.notna(row['movimiento']) else None,
-                    saldo_final=float(row['saldo_final']) if pd.notna(row['saldo_final']) else None,
-                    fecha=row['fecha'] if pd.notna(row['fecha']) else None,
-                    año=int(row['año']) if pd.notna(row['año']) else None,
-                    periodo=int(row['periodo']) if pd.notna(row['periodo']) else None
-                )
-                db.add(balance_record)
-                rows_inserted += 1
-            
+            landing = create_landing(db.connection())
+            rows_inserted = self.bulk_loader.load(db, df, landing, prepared=prepared)
+            if rows_inserted:
+                load_facts(db, landing)
+            drop_landing(db.connection(), landing)
+            # Resumen por periodo en la misma transacción que la carga (sumando las filas previas)
+            if rows_inserted:
+                refresh_periods(db, periods)
+                refresh_timeline(db, periods)
+                bump_periods(db, periods)
+            if period_run is not None:
+                key, content_hash = period_run
+                record_period_run(db, key, content_hash, rows_inserted)
+            _raise_if_cancelled(cancel)
             db.commit()
+            landing = None
         except Exception as e:
-            db.rollback()
+            self._discard_landing(db, landing)
             raise e
         finally:
             db.close()
         
+        self._observe_load("append", rows_inserted, started)
         return rows_inserted
     
-    async def _clear_year_data(self, year: int, months: List[int]):
-        """Elimina datos existentes para un año y meses específicos"""
+    @staticmethod
+    def _discard_landing(db, landing: Optional[str]):
+        """
+        Revierte la transacción tras un error y elimina la tabla de aterrizaje (en
+        SQLite su CREATE no se revierte). La tabla es temporal de la conexión y
+        db.rollback() devuelve la conexión al pool, así que se elimina antes por
+        la misma conexión DBAPI
+        """
+        if landing is not None:
+            try:
+                dbapi_connection = db.connection().connection.dbapi_connection
+                dbapi_connection.rollback()
+                cursor = dbapi_connection.cursor()
+                cursor.execute(f'DROP TABLE IF EXISTS "{landing}"')
+                cursor.close()
+                dbapi_connection.commit()
+            except Exception as e:
+                print(f"⚠️  No se pudo eliminar la tabla de aterrizaje {landing}: {e}")
+        db.rollback()
+    
+    @staticmethod
+    def _observe_load(mode: str, rows: int, started: float):
+        """Tiempo y filas/s de la escritura (mode: append, replace o swap)"""
+        seconds = time.perf_counter() - started
+        ETL_LOAD_SECONDS.labels(mode=mode).observe(seconds)
+        if rows and seconds > 0:
+            ETL_LOAD_ROWS_PER_SECOND.labels(mode=mode).observe(rows / seconds)
+        ETL_ROWS_LOADED.inc(rows)
+    
+    def _replace_period(
+        self,
+        frame: pd.DataFrame,
+        key: PeriodRunKey,
+        content_hash: str,
+        cancel: Optional[threading.Event] = None
+    ) -> int:
+        """
+        Reemplaza los datos de un periodo sin que los lectores vean un hueco
+        - PostgreSQL particionado: hechos en staging + swap de partición (_swap_partition)
+        - Otros: DELETE + carga en una sola transacción (los lectores ven los
+          datos anteriores hasta el commit)
+        Resumen y línea de tiempo se calculan desde la tabla de aterrizaje
+        """
+        with get_db_engine().connect() as connection:
+            partitioned = is_partitioned(connection)
+        started = time.perf_counter()
+        if partitioned:
+            rows_inserted = self._swap_partition(frame, key, content_hash, cancel)
+            self._observe_load("swap", rows_inserted, started)
+            return rows_inserted
+
+        periods = [key.periodo]
         db = get_db_session()
+        landing = None
         try:
-            db.execute(
-                delete(BalanceReport).where(
-                    BalanceReport.año == year,
-                    BalanceReport.periodo.in_([year * 100 + m for m in months])
-                )
-            )
+            landing = create_landing(db.connection())
+            rows_inserted = self.bulk_loader.load(db, frame, landing, prepared=True)
+            db.execute(delete(FactBalance).where(FactBalance.periodo == key.periodo))
+            load_facts(db, landing)
+            replace_periods(db, periods, compute_periods(db, periods, landing))
+            replace_timeline(db, periods, compute_timeline(db, periods, landing))
+            drop_landing(db.connection(), landing)
+            bump_periods(db, periods)
+            record_period_run(db, key, content_hash, rows_inserted)
+            _raise_if_cancelled(cancel)
             db.commit()
+            landing = None
         except Exception as e:
-            db.rollback()
-            print(f"Error limpiando datos: {e}")
+            self._discard_landing(db, landing)
+            raise e
         finally:
             db.close()
+        
+        self._observe_load("replace", rows_inserted, started)
+        return rows_inserted
     
-    async def process_date_range(
+    def _swap_partition(
         self,
-        fecha_inicio: str,
-        fecha_fin: str,
-        account_start: Optional[str] = None,
-        account_end: Optional[str] = None,
-        includes_tax_diff: bool = False,
-        clear_existing: bool = True
-    ) -> dict:
+        frame: pd.DataFrame,
+        key: PeriodRunKey,
+        content_hash: str,
+        cancel: Optional[threading.Event] = None
+    ) -> int:
         """
-        Procesa reportes desde fecha_inicio hasta fecha_fin
-        Replica la lógica de PowerQuery con rango de fechas
-        
-        Args:
-            fecha_inicio: Fecha de inicio en formato YYYY-MM-DD (ej: 2024-01-31)
-            fecha_fin: Fecha de fin en formato YYYY-MM-DD (ej: 2025-09-30)
-            account_start: Código de cuenta inicial (opcional)
-            account_end: Código de cuenta final (opcional)
-            includes_tax_diff: Incluir diferencia de impuestos
-            clear_existing: Si True, elimina datos existentes del rango antes de insertar
+        1. COPY a la tabla de aterrizaje, dimensiones, hechos en una tabla staging
+           (validación e índices), resumen y línea de tiempo (sin bloquear a nadie)
+        2. Transacción corta: resumen, línea de tiempo, versión y registro de la
+           carga y, al final, DETACH de la partición anterior y ATTACH de la staging.
+           El bloqueo de fact_balance que toma DETACH dura solo hasta el commit
+        """
+        periods = [key.periodo]
+        db = get_db_session()
+        staging = None
+        landing = None
+        try:
+            landing = create_landing(db.connection())
+            rows_inserted = self.bulk_loader.load(db, frame, landing, prepared=True)
+            staging = create_staging(db.connection(), key.periodo)
+            load_facts(db, landing, staging)
+            finalize_staging(db.connection(), staging, key.periodo, rows_inserted)
+            summary = compute_periods(db, periods, landing)
+            timeline = compute_timeline(db, periods, landing)
+            drop_landing(db.connection(), landing)
+            _raise_if_cancelled(cancel)
+            db.commit()
+            landing = None
             
-        Returns:
-            Diccionario con estadísticas del procesamiento
+            replace_periods(db, periods, summary)
+            replace_timeline(db, periods, timeline)
+            bump_periods(db, periods)
+            record_period_run(db, key, content_hash, rows_inserted)
+            _raise_if_cancelled(cancel)
+            swap_partition(db.connection(), key.periodo, staging)
+            db.commit()
+            staging = None
+        except Exception as e:
+            self._discard_landing(db, landing)
+            raise e
+        finally:
+            if staging is not None:
+                # La staging ya se había confirmado: eliminarla (la partición anterior sigue intacta)
+                try:
+                    drop_table(db.connection(), staging)
+                    db.commit()
+                except Exception as cleanup_error:
+                    db.rollback()
+                    print(f"⚠️  No se pudo eliminar la tabla staging {staging}: {cleanup_error}")
+            db.close()
+        
+        return rows_inserted
+    
+    @staticmethod
+    def plan_date_range(fecha_inicio: str, fecha_fin: str) -> Tuple[date, date, List[Tuple[int, int]]]:
+        """
+        Valida el rango de fechas y calcula los periodos (año, mes) a procesar
+        Lanza ValueError si las fechas no son válidas
         """
         # Parsear fechas
         try:
@@ -269,83 +619,85 @@ class ETLService:
             for month in range(month_start, month_end + 1):
                 periodos_a_procesar.append((year, month))
         
-        # Inicializar base de datos
-        init_db()
+        return fecha_inicio_parsed, fecha_fin_parsed, periodos_a_procesar
+    
+    async def process_date_range(
+        self,
+        fecha_inicio: str,
+        fecha_fin: str,
+        account_start: Optional[str] = None,
+        account_end: Optional[str] = None,
+        includes_tax_diff: bool = False,
+        clear_existing: bool = True,
+        force: bool = False,
+        replay: bool = False,
+        progress: Optional[Any] = None
+    ) -> dict:
+        """
+        Procesa reportes desde fecha_inicio hasta fecha_fin
+        Replica la lógica de PowerQuery con rango de fechas
         
-        # Eliminar datos existentes si se solicita
-        if clear_existing:
-            # Agrupar por año para limpiar
-            years_to_clear = {}
-            for year, month in periodos_a_procesar:
-                if year not in years_to_clear:
-                    years_to_clear[year] = []
-                if month not in years_to_clear[year]:
-                    years_to_clear[year].append(month)
+        Args:
+            fecha_inicio: Fecha de inicio en formato YYYY-MM-DD (ej: 2024-01-31)
+            fecha_fin: Fecha de fin en formato YYYY-MM-DD (ej: 2025-09-30)
+            account_start: Código de cuenta inicial (opcional)
+            account_end: Código de cuenta final (opcional)
+            includes_tax_diff: Incluir diferencia de impuestos
+            clear_existing: Si True, reemplaza los datos existentes de cada periodo al cargarlo
+            force: Si True, recarga los periodos aunque el Excel no haya cambiado
+            replay: Si True, usa solo los Excel de la caché local (sin llamar a Siigo) e implica force
+            progress: Seguimiento por periodo (ver etl_jobs.JobProgress), opcional
             
-            for year, months in years_to_clear.items():
-                await self._clear_year_data(year, months)
+        Returns:
+            Diccionario con estadísticas del procesamiento
+        """
+        fecha_inicio_parsed, fecha_fin_parsed, periodos_a_procesar = self.plan_date_range(
+            fecha_inicio, fecha_fin
+        )
+        
+        # Inicializar base de datos
+        init_db()
+        prepare_partitions(get_db_engine(), [year * 100 + month for year, month in periodos_a_procesar])
         
         total_rows = 0
         processed_periods = []
+        skipped_periods = []
         errors = []
         
-        # Obtener token una sola vez (con retry para rate limit)
-        max_retries = 3
-        retry_delay = 2
+        # Obtener token una sola vez (con retry para rate limit); replay no llama a Siigo
+        if not replay:
+            await self._with_rate_limit_retry(self.siigo_client.get_access_token)
         
-        for attempt in range(max_retries):
-            try:
-                token = await self.siigo_client.get_access_token()
-                break
-            except Exception as e:
-                if "429" in str(e) or "rate limit" in str(e).lower():
-                    if attempt < max_retries - 1:
-                        wait_time = retry_delay * (attempt + 1)
-                        print(f"⚠️  Rate limit alcanzado. Esperando {wait_time} segundos antes de reintentar...")
-                        await asyncio.sleep(wait_time)
-                        continue
-                raise
+        # Procesar los periodos con N en vuelo (resultados en orden)
+        # Cada periodo se reemplaza al cargarlo, y solo si su Excel cambió
+        if progress is not None:
+            await progress.start(periodos_a_procesar)
+        outcomes = await self.scheduler.run(
+            periodos_a_procesar,
+            lambda y, m: self._track_period(
+                progress, y, m, account_start, account_end, includes_tax_diff, clear_existing,
+                force or replay, replay
+            ),
+            concurrency=self._replay_concurrency() if replay else None
+        )
         
-        # Procesar cada periodo
-        for year, month in periodos_a_procesar:
-            try:
-                # Solicitar reporte para el mes específico
-                result = await self.siigo_client.get_balance_report_by_thirdparty(
-                    year=year,
-                    month_start=month,
-                    month_end=month,
-                    account_start=account_start or "",
-                    account_end=account_end or "",
-                    includes_tax_diff=includes_tax_diff
-                )
-                
-                file_url = result.get('file_url')
-                if not file_url:
-                    errors.append(f"{year}-{month:02d}: No se recibió file_url")
-                    continue
-                
-                # Descargar Excel
-                excel_content = await self.excel_processor.download_excel(file_url)
-                
-                # Procesar Excel
-                df = self.excel_processor.process_excel(excel_content, year, month)
-                
-                # Guardar en base de datos
-                rows_inserted = await self._save_to_database(df)
-                total_rows += rows_inserted
-                processed_periods.append(f"{year}-{month:02d}")
-                
-                print(f"✅ Procesado {year}-{month:02d}: {rows_inserted} registros")
-                
-            except Exception as e:
-                error_msg = f"{year}-{month:02d}: {str(e)}"
+        for (year, month), outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                error_msg = f"{year}-{month:02d}: {str(outcome)}"
                 errors.append(error_msg)
-                print(f"ERROR procesando {year}-{month:02d}: {e}")
+                print(f"ERROR procesando {year}-{month:02d}: {outcome}")
+                continue
+            if outcome["skipped"]:
+                skipped_periods.append(f"{year}-{month:02d}")
+                continue
+            total_rows += outcome["rows"]
+            processed_periods.append(f"{year}-{month:02d}")
         
         return {
             "fecha_inicio": fecha_inicio_parsed.isoformat(),
             "fecha_fin": fecha_fin_parsed.isoformat(),
             "periodos_procesados": processed_periods,
+            "periodos_omitidos": skipped_periods,
             "total_periodos": len(processed_periods),
             "total_rows": total_rows,
             "errors": errors,
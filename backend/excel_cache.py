@@ -0,0 +1,159 @@
+"""
+Caché en disco de los Excel descargados de Siigo
+Los archivos se guardan por contenido (blobs/<sha256>.xlsx) y una referencia por
+periodo + parámetros del reporte apunta al último blob descargado. Permite
+volver a transformar periodos (replay) sin pedir nada a Siigo.
+Tiene un límite de bytes: se eliminan primero los blobs usados hace más tiempo
+(la lectura actualiza su mtime)
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Optional
+from config import get_settings
+from period_runs import PeriodRunKey
+
+PRIVATE_DIR_MODE = 0o700
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "excel_cache")
+
+
+class ExcelCache:
+    """Blobs por contenido + referencias por periodo, con evicción LRU por mtime"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._blobs = os.path.join(directory, "blobs")
+        self._refs = os.path.join(directory, "refs")
+        # Reportes contables: solo el usuario del proceso puede leerlos
+        # (los archivos ya se crean 0600 con mkstemp)
+        for path in (directory, self._blobs, self._refs):
+            os.makedirs(path, mode=PRIVATE_DIR_MODE, exist_ok=True)
+        for path in (self._blobs, self._refs):
+            os.chmod(path, PRIVATE_DIR_MODE)
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    @staticmethod
+    def ref_name(key: PeriodRunKey) -> str:
+        """<año>-<mes>-<hash de los parámetros> (ej: 2024-03-1a2b3c4d5e6f7a8b)"""
+        params = json.dumps(
+            [key.account_start, key.account_end, key.includes_tax_diff], separators=(",", ":")
+        )
+        return f"{key.year}-{key.month:02d}-{hashlib.sha256(params.encode()).hexdigest()[:16]}"
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self._blobs, f"{digest}.xlsx")
+
+    def _ref_path(self, key: PeriodRunKey) -> str:
+        return os.path.join(self._refs, self.ref_name(key))
+
+    def _write_atomic(self, path: str, data: bytes):
+        # Archivo temporal + rename: otro proceso nunca ve un archivo a medias
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get(self, key: PeriodRunKey) -> Optional[bytes]:
+        """Excel guardado para el periodo y parámetros; None si no está (o se evictó)"""
+        try:
+            with open(self._ref_path(key), "r") as ref:
+                digest = ref.read().strip()
+            blob_path = self._blob_path(digest)
+            with open(blob_path, "rb") as blob:
+                content = blob.read()
+            os.utime(blob_path)
+        except FileNotFoundError:
+            with self._lock:
+                self._counters["misses"] += 1
+            return None
+
+        with self._lock:
+            self._counters["hits"] += 1
+        return content
+
+    def put(self, key: PeriodRunKey, content: bytes) -> str:
+        """Guarda el Excel (si el contenido ya existe solo se actualiza la referencia)"""
+        digest = hashlib.sha256(content).hexdigest()
+        blob_path = self._blob_path(digest)
+        if os.path.exists(blob_path):
+            os.utime(blob_path)
+        else:
+            self._write_atomic(blob_path, content)
+        self._write_atomic(self._ref_path(key), digest.encode())
+
+        with self._lock:
+            self._counters["stores"] += 1
+        self.evict()
+        return digest
+
+    def _blob_entries(self):
+        entries = []
+        for entry in os.scandir(self._blobs):
+            if entry.is_file() and entry.name.endswith(".xlsx"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self) -> int:
+        """Elimina los blobs menos usados hasta quedar bajo max_bytes"""
+        entries = sorted(self._blob_entries())
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        if evicted:
+            # Las referencias a blobs eliminados quedan huérfanas: se tratan como miss
+            with self._lock:
+                self._counters["evictions"] += evicted
+        return evicted
+
+    def stats(self) -> dict:
+        entries = self._blob_entries()
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            "directory": os.path.abspath(self.directory),
+            "blobs": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            **counters,
+        }
+
+
+_cache: Optional[ExcelCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_excel_cache() -> Optional[ExcelCache]:
+    """Caché del proceso (se crea la primera vez); None si EXCEL_CACHE_ENABLED = false (por defecto)"""
+    global _cache
+
+    settings = get_settings()
+    if not settings.excel_cache_enabled:
+        return None
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                directory = settings.excel_cache_dir or DEFAULT_DIR
+                _cache = ExcelCache(directory, settings.excel_cache_max_bytes)
+    return _cache
@@ -2,11 +2,112 @@
 Procesador de archivos Excel de Siigo
 Replica la lógica ETL de PowerQuery
 """
+import numpy as np
 import pandas as pd
-import httpx
-from typing import List, Dict, Any, Optional
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES
+from pandas._libs.parsers import STR_NA_VALUES
+from config import get_settings
+from http_client import get_http_client
+from metrics import EXCEL_DOWNLOAD_BYTES, EXCEL_DOWNLOAD_SECONDS, timed
+
+try:
+    # Motor opcional (Rust) mucho más rápido que openpyxl para leer .xlsx
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+from typing import List, Dict, Any, Iterator, Optional
+from calendar import monthrange
 from datetime import date, datetime
+import hashlib
 import io
+import time
+import zipfile
+
+
+HEADER_FIRST_CELL = "Nivel"
+HEADER_THIRD_CELL = "Código cuenta contable"
+TRANSACTIONAL_VALUES = {'SÍ', 'SI'}
+
+# Columnas del Excel de Siigo que se conservan al leer la hoja
+SOURCE_COLUMNS = {
+    'Nivel', 'Transaccional',
+    'Código cuenta contable', 'Nombre Cuenta contable',
+    'Identificación', 'Sucursal', 'Nombre tercero',
+    'Saldo Inicial', 'Movimiento Débito', 'Movimiento Crédito', 'Saldo final',
+    'Movimiento', 'Cod Relacional', 'Fecha', 'Año', 'Periodo'
+}
+
+
+def _cell_value(value):
+    """
+    Normaliza una celda igual que pd.read_excel(engine='openpyxl'):
+    vacías, errores y textos NA ('', 'N/A', 'nan'...) -> NaN; floats enteros -> int
+    """
+    if value is None:
+        return np.nan
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value
+    if isinstance(value, str) and (value in STR_NA_VALUES or value in ERROR_CODES):
+        return np.nan
+    return value
+
+
+def _header_names(row: List[Any]) -> List[Any]:
+    """Nombres de columna como los genera pandas (Unnamed: i, duplicados X.1)"""
+    names = []
+    seen = {}
+    for i, value in enumerate(row):
+        name = f"Unnamed: {i}" if value is np.nan else value
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+# Columnas de salida de process_excel (nombres del modelo de BD)
+OUTPUT_COLUMNS = [
+    'codigo_cuenta_contable', 'nombre_cuenta_contable', 'cod_relacional',
+    'identificacion', 'sucursal', 'nombre_tercero',
+    'saldo_inicial', 'movimiento_debito', 'movimiento_credito',
+    'movimiento', 'saldo_final',
+    'fecha', 'año', 'periodo'
+]
+
+COD_RELACIONAL_DIGITS = 6
+_POWERS_OF_TEN = 10 ** np.arange(19, dtype=np.int64)
+
+
+def _to_int64(values: pd.Series) -> pd.Series:
+    """Entero nullable; los decimales se truncan hacia cero (igual que int())"""
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return values.astype('Int64')
+    return pd.Series(np.trunc(values.to_numpy(dtype='float64', na_value=np.nan)), index=values.index).astype('Int64')
+
+
+def _cod_relacional(codigo: pd.Series) -> pd.Series:
+    """
+    Primeros 6 caracteres del código de cuenta sin pasar por texto fila a fila:
+    código // 10^(dígitos - 6). Solo los valores distintos se convierten a str
+    y el resultado es categórico (NaN -> nulo)
+    """
+    valid = codigo.notna().to_numpy()
+    values = codigo.to_numpy(dtype=np.int64, na_value=0)[valid]
+    magnitude = np.abs(values)
+    digits = np.maximum(np.searchsorted(_POWERS_OF_TEN, magnitude, side='right'), 1)
+    # Con signo (no debería haber códigos negativos) el "-" ocupa uno de los 6 caracteres
+    keep = np.where(values < 0, COD_RELACIONAL_DIGITS - 1, COD_RELACIONAL_DIGITS)
+    prefix = magnitude // _POWERS_OF_TEN[np.maximum(digits - keep, 0)]
+    prefix = np.where(values < 0, -prefix, prefix)
+
+    uniques, inverse = np.unique(prefix, return_inverse=True)
+    codes = np.full(len(codigo), -1, dtype=np.int64)
+    codes[valid] = inverse
+    categories = uniques.astype(str).astype(object)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=codigo.index)
 
 
 class ExcelProcessor:
@@ -23,162 +124,240 @@ class ExcelProcessor:
         Returns:
             Contenido del archivo en bytes
         """
-        async with httpx.AsyncClient() as client:
-            response = await client.get(file_url, timeout=120.0)
+        client = get_http_client()
+        with timed(EXCEL_DOWNLOAD_SECONDS):
+            response = await client.get(file_url, timeout=get_settings().excel_download_timeout)
             response.raise_for_status()
-            return response.content
+        EXCEL_DOWNLOAD_BYTES.observe(len(response.content))
+        return response.content
+    
+    @staticmethod
+    def content_hash(excel_content: bytes) -> str:
+        """
+        SHA-256 del contenido del libro (hojas y textos compartidos)
+        Se excluyen los metadatos del .xlsx (docProps: fechas de creación), que
+        cambian en cada descarga aunque los datos sean los mismos
+        """
+        digest = hashlib.sha256()
+        try:
+            with zipfile.ZipFile(io.BytesIO(excel_content)) as workbook:
+                for name in sorted(workbook.namelist()):
+                    if name.startswith("xl/worksheets/") or name == "xl/sharedStrings.xml":
+                        digest.update(name.encode())
+                        digest.update(workbook.read(name))
+        except zipfile.BadZipFile:
+            # No es un .xlsx (ej: .xls antiguo): hash del archivo completo
+            return hashlib.sha256(excel_content).hexdigest()
+        return digest.hexdigest()
+
+    @staticmethod
+    def _iter_sheet_rows(excel_content: bytes) -> Iterator[List[Any]]:
+        """
+        Recorre la primera hoja fila a fila
+        Usa calamine si está instalado; si no, openpyxl en modo read_only
+        """
+        if CalamineWorkbook is not None:
+            workbook = CalamineWorkbook.from_filelike(io.BytesIO(excel_content))
+            for row in workbook.get_sheet_by_index(0).iter_rows():
+                yield [_cell_value(value) for value in row]
+            return
+        
+        workbook = load_workbook(io.BytesIO(excel_content), read_only=True, data_only=True)
+        try:
+            sheet = workbook.worksheets[0]
+            for row in sheet.iter_rows(values_only=True):
+                yield [_cell_value(value) for value in row]
+        finally:
+            workbook.close()
+    
+    @staticmethod
+    def _collect_columns(names: List[Any], rows: Iterator[List[Any]]) -> Dict[Any, list]:
+        """
+        Acumula solo las columnas usadas, sin las filas completamente vacías
+        (dropna(how='all')); el filtro de Nivel / Transaccional es vectorizado (_row_mask)
+        """
+        positions = {
+            name: i for i, name in enumerate(names)
+            if isinstance(name, str) and name in SOURCE_COLUMNS
+        }
+        columns = {name: [] for name in positions}
+        width = len(names)
+        
+        for row in rows:
+            if all(value is np.nan for value in row):
+                continue
+            if len(row) < width:
+                row = row + [np.nan] * (width - len(row))
+            for name, i in positions.items():
+                columns[name].append(row[i])
+        
+        return columns
+    
+    @staticmethod
+    def _unique_mask(values: np.ndarray, predicate) -> np.ndarray:
+        """
+        Evalúa predicate una vez por valor distinto (factorize) y lo expande a todas
+        las filas: Nivel y Transaccional tienen solo un puñado de valores
+        """
+        codes, uniques = pd.factorize(values, use_na_sentinel=True)
+        per_unique = np.fromiter((predicate(value) for value in uniques), dtype=bool, count=len(uniques))
+        # Código -1 = NaN: se evalúa aparte
+        return np.append(per_unique, predicate(np.nan))[codes]
+    
+    @staticmethod
+    def _row_mask(columns: Dict[str, np.ndarray], rows: int) -> np.ndarray:
+        """Filas a conservar: Nivel no vacío y Transaccional = Sí/SI"""
+        mask = np.ones(rows, dtype=bool)
+        if 'Nivel' in columns:
+            mask &= ExcelProcessor._unique_mask(
+                columns['Nivel'],
+                lambda value: not (isinstance(value, str) and value.strip() == '')
+            )
+        if 'Transaccional' in columns:
+            mask &= ExcelProcessor._unique_mask(
+                columns['Transaccional'],
+                lambda value: str(value).upper().strip() in TRANSACTIONAL_VALUES
+            )
+        return mask
+    
+    @staticmethod
+    def _stream_sheet_columns(excel_content: bytes) -> Dict[Any, list]:
+        """
+        Una sola pasada por la hoja: detecta el encabezado (columna 0 = "Nivel" y
+        columna 2 = "Código cuenta contable") y filtra las filas mientras lee
+        """
+        rows = ExcelProcessor._iter_sheet_rows(excel_content)
+        preamble = []
+        
+        for row in rows:
+            if (len(row) > 2 and
+                    str(row[0]).strip() == HEADER_FIRST_CELL and
+                    str(row[2]).strip() == HEADER_THIRD_CELL):
+                return ExcelProcessor._collect_columns(_header_names(row), rows)
+            preamble.append(row)
+        
+        # Si no se encuentra, usar la primera fila como header
+        if not preamble:
+            return {}
+        width = max(len(row) for row in preamble)
+        names = preamble[0] + [np.nan] * (width - len(preamble[0]))
+        return ExcelProcessor._collect_columns(names, iter(preamble[1:]))
+    
+    @staticmethod
+    def filter_rows(columns: Dict[Any, list]) -> Dict[str, np.ndarray]:
+        """Columnas leídas -> arreglos numpy con solo las filas transaccionales"""
+        arrays = {name: np.asarray(values, dtype=object) for name, values in columns.items()}
+        rows = len(next(iter(arrays.values()))) if arrays else 0
+        mask = ExcelProcessor._row_mask(arrays, rows)
+        if mask.all():
+            return arrays
+        return {name: values[mask] for name, values in arrays.items()}
+    
+    @staticmethod
+    def transform(columns: Dict[str, np.ndarray], year: int, month: int) -> pd.DataFrame:
+        """
+        Transformaciones de PowerQuery sobre las columnas filtradas, de forma vectorizada
+        - Código cuenta contable como entero (Int64) y Cod Relacional = sus primeros
+          6 dígitos calculados aritméticamente
+        - Textos repetidos (nombre de cuenta, sucursal, cod_relacional) como categorías
+        - Montos redondeados a 2 decimales y Movimiento = Débito - Crédito
+        """
+        rows = len(next(iter(columns.values()))) if columns else 0
+        
+        def source(name: str) -> Optional[pd.Series]:
+            values = columns.get(name)
+            return pd.Series(values, dtype=object, copy=False) if values is not None else None
+        
+        def empty() -> np.ndarray:
+            return np.full(rows, None, dtype=object)
+        
+        out = {}
+        
+        codigo = source('Código cuenta contable')
+        if codigo is not None:
+            codigo = _to_int64(pd.to_numeric(codigo, errors='coerce'))
+            out['codigo_cuenta_contable'] = codigo
+        else:
+            out['codigo_cuenta_contable'] = empty()
+        
+        nombre_cuenta = source('Nombre Cuenta contable')
+        out['nombre_cuenta_contable'] = (
+            nombre_cuenta.astype('category') if nombre_cuenta is not None else empty()
+        )
+        out['cod_relacional'] = _cod_relacional(codigo) if codigo is not None else empty()
+        
+        for name, target in (('Identificación', 'identificacion'), ('Nombre tercero', 'nombre_tercero')):
+            values = source(name)
+            out[target] = values if values is not None else empty()
+        sucursal = source('Sucursal')
+        out['sucursal'] = sucursal.astype('category') if sucursal is not None else empty()
+        
+        money = {}
+        for name, target in (
+            ('Saldo Inicial', 'saldo_inicial'),
+            ('Movimiento Débito', 'movimiento_debito'),
+            ('Movimiento Crédito', 'movimiento_credito'),
+            ('Saldo final', 'saldo_final'),
+        ):
+            values = source(name)
+            if values is not None:
+                money[target] = pd.to_numeric(values, errors='coerce').round(2)
+        
+        for target in ('saldo_inicial', 'movimiento_debito', 'movimiento_credito', 'saldo_final'):
+            out[target] = money[target] if target in money else empty()
+        if 'movimiento_debito' in money and 'movimiento_credito' in money:
+            out['movimiento'] = (money['movimiento_debito'] - money['movimiento_credito']).round(2)
+        else:
+            out['movimiento'] = empty()
+        
+        # Fecha: último día del mes (mes 13 = cierre = 31 de diciembre)
+        if month == 13:
+            fecha = date(year, 12, 31)
+        else:
+            fecha = date(year, month, monthrange(year, month)[1])
+        out['fecha'] = np.full(rows, fecha, dtype=object)
+        out['año'] = np.full(rows, year, dtype=np.int64)
+        out['periodo'] = np.full(rows, year * 100 + month, dtype=np.int64)
+        
+        return pd.DataFrame({name: out[name] for name in OUTPUT_COLUMNS}, copy=False)
     
     @staticmethod
     def process_excel(
         excel_content: bytes,
         year: int,
-        month: int
+        month: int,
+        stats: Optional[dict] = None
     ) -> pd.DataFrame:
         """
         Procesa un archivo Excel y aplica las transformaciones ETL de PowerQuery
+        Etapas: lectura en streaming -> filtro de filas -> transformación vectorizada
         
         Args:
             excel_content: Contenido del archivo Excel en bytes
             year: Año del reporte
             month: Mes del reporte (1-13, donde 13 es cierre)
+            stats: Si se pasa un dict, se llena con segundos por etapa (read,
+                filter, transform) y filas leídas / conservadas / descartadas
             
         Returns:
             DataFrame de pandas con los datos procesados
         """
-        # Leer el Excel
-        excel_file = io.BytesIO(excel_content)
-        excel_workbook = pd.ExcelFile(excel_file, engine='openpyxl')
-        
-        # Obtener la primera hoja
-        first_sheet = excel_workbook.sheet_names[0]
-        df = pd.read_excel(excel_file, sheet_name=first_sheet, header=None, engine='openpyxl')
-        
-        # ETL: Detectar fila de encabezados
-        # Buscar fila donde columna 0 = "Nivel" y columna 2 = "Código cuenta contable"
-        header_index = -1
-        for idx, row in df.iterrows():
-            if (pd.notna(row.iloc[0]) and str(row.iloc[0]).strip() == "Nivel" and
-                pd.notna(row.iloc[2]) and str(row.iloc[2]).strip() == "Código cuenta contable"):
-                header_index = idx
-                break
-        
-        # Si se encontró el encabezado, usar esa fila como header
-        if header_index != -1:
-            df = df.iloc[header_index + 1:].copy()
-            # Obtener los nombres de las columnas de la fila de encabezado
-            header_row = pd.read_excel(
-                excel_file, 
-                sheet_name=first_sheet, 
-                header=header_index,
-                nrows=0,
-                engine='openpyxl'
-            )
-            df.columns = header_row.columns
-        else:
-            # Si no se encuentra, usar la primera fila como header
-            df.columns = df.iloc[0]
-            df = df.iloc[1:].copy()
-        
-        # Limpiar: Eliminar filas completamente vacías
-        df = df.dropna(how='all')
-        
-        # Filtrar: Eliminar filas donde Nivel esté vacío
-        if 'Nivel' in df.columns:
-            df = df[df['Nivel'].astype(str).str.strip() != '']
-            df = df[df['Nivel'].astype(str).str.strip().notna()]
-        
-        # Filtrar: Solo filas donde Transaccional = "Sí" o "SI"
-        if 'Transaccional' in df.columns:
-            df['Transaccional_upper'] = df['Transaccional'].astype(str).str.upper().str.strip()
-            df = df[df['Transaccional_upper'].isin(['SÍ', 'SI'])]
-            df = df.drop(columns=['Transaccional_upper'])
-        
-        # Eliminar columnas Nivel y Transaccional
-        columns_to_drop = []
-        if 'Nivel' in df.columns:
-            columns_to_drop.append('Nivel')
-        if 'Transaccional' in df.columns:
-            columns_to_drop.append('Transaccional')
-        if columns_to_drop:
-            df = df.drop(columns=columns_to_drop)
-        
-        # Calcular Fecha: último día del mes
-        from calendar import monthrange
-        
-        if month == 13:
-            # Mes 13 = cierre = 31 de diciembre
-            fecha = date(year, 12, 31)
-        else:
-            # Último día del mes especificado
-            last_day = monthrange(year, month)[1]
-            fecha = date(year, month, last_day)
-        
-        # Agregar columnas calculadas
-        df['Fecha'] = fecha
-        df['Año'] = year
-        df['Periodo'] = year * 100 + month
-        
-        # Convertir tipos de datos
-        numeric_columns = [
-            'Código cuenta contable',
-            'Saldo Inicial',
-            'Movimiento Débito',
-            'Movimiento Crédito',
-            'Saldo final'
-        ]
-        
-        for col in numeric_columns:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-        
-        # Redondear valores numéricos a 2 decimales
-        for col in ['Saldo Inicial', 'Movimiento Débito', 'Movimiento Crédito', 'Saldo final']:
-            if col in df.columns:
-                df[col] = df[col].round(2)
-        
-        # Calcular Movimiento = Débito - Crédito
-        if 'Movimiento Débito' in df.columns and 'Movimiento Crédito' in df.columns:
-            df['Movimiento'] = (df['Movimiento Débito'] - df['Movimiento Crédito']).round(2)
-        
-        # Calcular Cod Relacional = primeros 6 caracteres del código cuenta
-        if 'Código cuenta contable' in df.columns:
-            df['Cod Relacional'] = df['Código cuenta contable'].astype(str).str[:6]
-        
-        # Renombrar columnas para que coincidan con el modelo de BD
-        column_mapping = {
-            'Código cuenta contable': 'codigo_cuenta_contable',
-            'Nombre Cuenta contable': 'nombre_cuenta_contable',
-            'Identificación': 'identificacion',
-            'Sucursal': 'sucursal',
-            'Nombre tercero': 'nombre_tercero',
-            'Saldo Inicial': 'saldo_inicial',
-            'Movimiento Débito': 'movimiento_debito',
-            'Movimiento Crédito': 'movimiento_credito',
-            'Saldo final': 'saldo_final',
-            'Movimiento': 'movimiento',
-            'Cod Relacional': 'cod_relacional',
-            'Fecha': 'fecha',
-            'Año': 'año',
-            'Periodo': 'periodo'
-        }
-        
-        df = df.rename(columns=column_mapping)
-        
-        # Asegurar que todas las columnas esperadas existan
-        expected_columns = [
-            'codigo_cuenta_contable', 'nombre_cuenta_contable', 'cod_relacional',
-            'identificacion', 'sucursal', 'nombre_tercero',
-            'saldo_inicial', 'movimiento_debito', 'movimiento_credito',
-            'movimiento', 'saldo_final',
-            'fecha', 'año', 'periodo'
-        ]
-        
-        for col in expected_columns:
-            if col not in df.columns:
-                df[col] = None
-        
-        # Seleccionar solo las columnas esperadas
-        df = df[expected_columns]
+        stats = {} if stats is None else stats
+        started = time.perf_counter()
+        # Leer el Excel en streaming: una sola pasada, solo las columnas usadas
+        columns = ExcelProcessor._stream_sheet_columns(excel_content)
+        read_done = time.perf_counter()
+        filtered = ExcelProcessor.filter_rows(columns)
+        filter_done = time.perf_counter()
+        df = ExcelProcessor.transform(filtered, year, month)
         
+        rows_read = len(next(iter(columns.values()))) if columns else 0
+        stats.update(
+            read=read_done - started,
+            filter=filter_done - read_done,
+            transform=time.perf_counter() - filter_done,
+            rows_read=rows_read,
+            rows_kept=len(df),
+            rows_dropped=rows_read - len(df)
+        )
         return df
-
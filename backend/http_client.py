@@ -0,0 +1,97 @@
+"""
+Cliente HTTP compartido (keep-alive) para Siigo y las descargas de Excel
+Un httpx.AsyncClient con pool de conexiones por event loop (en la aplicación,
+uno por proceso); FastAPI lo abre y lo cierra en su lifespan
+"""
+import asyncio
+import threading
+from typing import Dict, Optional
+import httpx
+from config import get_settings
+
+
+# Un cliente por event loop (None = creado fuera de un loop) y la tarea que lo cierra
+_clients: Dict[Optional[asyncio.AbstractEventLoop], httpx.AsyncClient] = {}
+_closers: Dict[asyncio.AbstractEventLoop, asyncio.Task] = {}
+_clients_lock = threading.Lock()
+
+
+def http2_available() -> bool:
+    """HTTP/2 requiere el paquete opcional h2 (pip install httpx[http2])"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _build_client() -> httpx.AsyncClient:
+    settings = get_settings()
+    return httpx.AsyncClient(
+        http2=settings.http2_enabled and http2_available(),
+        limits=httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry
+        ),
+        timeout=httpx.Timeout(
+            settings.http_timeout,
+            connect=settings.http_connect_timeout
+        )
+    )
+
+
+async def _close_with_loop(loop: asyncio.AbstractEventLoop, client: httpx.AsyncClient):
+    """
+    Espera hasta ser cancelada y cierra el cliente en su propio loop: asyncio.run
+    cancela las tareas pendientes antes de cerrar el loop, así los scripts que no
+    llaman a close_http_client no dejan conexiones abiertas
+    """
+    try:
+        await loop.create_future()
+    finally:
+        with _clients_lock:
+            if _clients.get(loop) is client:
+                del _clients[loop]
+            _closers.pop(loop, None)
+        await client.aclose()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Retorna el cliente compartido del event loop actual
+    Las conexiones del pool quedan ligadas al loop que las abrió: desde otro loop
+    (scripts con asyncio.run) se usa otro cliente, que se cierra al terminar su loop
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    with _clients_lock:
+        # Loops cerrados sin cancelar sus tareas (loop.close() manual): ya no se pueden cerrar
+        for closed in [other for other in _clients if other is not None and other.is_closed()]:
+            del _clients[closed]
+            _closers.pop(closed, None)
+
+        client = _clients.get(loop)
+        if client is None or client.is_closed:
+            client = _clients[loop] = _build_client()
+            if loop is not None:
+                _closers[loop] = loop.create_task(_close_with_loop(loop, client))
+    return client
+
+
+async def close_http_client():
+    """Cierra el cliente del loop actual (y el creado fuera de un loop) y sus conexiones keep-alive"""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        closer = _closers.pop(loop, None)
+        clients = [_clients.pop(key) for key in (loop, None) if key in _clients]
+
+    if closer is not None:
+        closer.cancel()
+        await asyncio.gather(closer, return_exceptions=True)
+    for client in clients:
+        if not client.is_closed:
+            await client.aclose()
@@ -1,9 +1,16 @@
-from fastapi import FastAPI, HTTPException, Query, Depends
+from fastapi import FastAPI, HTTPException, Query, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import uvicorn
+from contextlib import asynccontextmanager
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
-from typing import Optional, List
+from typing import Awaitable, Callable, Optional, List, Tuple
+import asyncio
+import base64
+import json
+import time
+from datetime import datetime
 from siigo_client import SiigoClient
 from models import (
     BalanceReportRequest, 
@@ -11,16 +18,74 @@ from models import (
     ETLProcessRequest,
     ETLPreviousYearRequest,
     ETLProcessDateRangeRequest,
-    PowerBIQueryParams
+    PowerBIQueryParams,
+    BalanceAtDateRequest
 )
 from config import get_settings
-from database import get_db, BalanceReport, init_db
+from database import BalanceReport, init_db, dispose_engine, get_pool_stats
+from async_database import (
+    AsyncDB, dispose_async_engine, get_async_db, get_async_pool_stats, run_with_session
+)
 from etl_service import ETLService
+from etl_jobs import (
+    FINISHED_STATUSES, ETLJobRunner, JobQueueFull, enqueue_job, get_job, job_to_dict, list_jobs,
+    request_cancel
+)
+from http_client import get_http_client, close_http_client
+from parse_pool import shutdown_parse_executor
+from period_summary import summary_stats
+from balance_timeline import balances, periodo_for_date
+from star_schema import dim_cuenta_rows, dim_tercero_rows, facts_page
+from columnar_snapshot import ColumnarSnapshot, get_columnar_snapshot
+from powerbi_aggregate import (
+    aggregate_rows_to_dicts, aggregate_statement, measure_label, parse_group_by, parse_measures
+)
+from data_versions import version_token
+from excel_cache import get_excel_cache
+from metrics import (
+    CONTENT_TYPE_LATEST, POWERBI_CACHE, POWERBI_QUERY_SECONDS, POWERBI_ROWS_RETURNED,
+    POWERBI_SERIALIZATION_SECONDS, mark_process_dead, metrics_available, metrics_payload, timed
+)
+from response_cache import CachedResponse, cache_key, etag_for, etag_matches, get_response_cache
+from powerbi_export import (
+    FILE_EXTENSIONS, MEDIA_TYPES, columnar_available, export_statement,
+    rows_to_columnar_bytes, select_columns, stream_export
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Arranque: inicializar BD (puede fallar si PostgreSQL no está corriendo)
+    # Se hace aquí y no al importar el módulo para que los procesos del pool
+    # de parseo (spawn) no repitan la inicialización
+    try:
+        init_db()
+        print("✅ Base de datos inicializada")
+    except Exception as e:
+        print(f"⚠️  Base de datos no disponible: {e}")
+        print("   Los endpoints ETL no estarán disponibles hasta configurar PostgreSQL")
+    # Cliente HTTP keep-alive compartido por Siigo y las descargas
+    get_http_client()
+    # Workers de jobs ETL en segundo plano de este proceso
+    if job_runner is not None:
+        await job_runner.start()
+    yield
+    # Apagado: los jobs en curso vuelven a la cola; cerrar conexiones HTTP,
+    # procesos de parseo y el pool de base de datos
+    if job_runner is not None:
+        await job_runner.stop()
+    await close_http_client()
+    shutdown_parse_executor()
+    await dispose_async_engine()
+    dispose_engine()
+    mark_process_dead()
+
 
 app = FastAPI(
     title="Siigo API Integration",
     description="API para integración con Siigo - Reportes y Consultas",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -45,20 +110,15 @@ app.add_middleware(
 
 siigo_client = SiigoClient()
 
-# Inicializar ETL service y BD solo si PostgreSQL está disponible
+# Inicializar ETL service (la BD se inicializa en el arranque, ver lifespan)
 try:
-    etl_service = ETLService()
-    # Intentar inicializar BD (puede fallar si PostgreSQL no está corriendo)
-    try:
-        init_db()
-        print("✅ Base de datos inicializada")
-    except Exception as e:
-        print(f"⚠️  Base de datos no disponible: {e}")
-        print("   Los endpoints ETL no estarán disponibles hasta configurar PostgreSQL")
+    etl_service = ETLService(siigo_client=siigo_client)
 except Exception as e:
     print(f"⚠️  ETL Service no disponible: {e}")
     etl_service = None
 
+job_runner = ETLJobRunner(etl_service) if etl_service is not None else None
+
 
 @app.get("/")
 async def root():
@@ -77,6 +137,55 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    Métricas en formato Prometheus: llamadas a Siigo (latencia, 429), descarga y
+    parseo de Excel por etapa, carga por periodo y consultas de Power BI
+    Con varios workers de uvicorn definir PROMETHEUS_MULTIPROC_DIR
+    """
+    if not metrics_available():
+        raise HTTPException(status_code=501, detail="Métricas no disponibles: instale prometheus-client")
+    # Content-Type explícito: con media_type Starlette agregaría un segundo charset
+    return Response(content=metrics_payload(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+@app.get("/api/db/pool-stats")
+async def db_pool_stats():
+    """
+    Estado del pool de conexiones del proceso (checkouts, esperas, overflow)
+    Útil para dimensionar DB_POOL_SIZE / DB_MAX_OVERFLOW según los workers de uvicorn
+    async_pool es el pool aparte de los endpoints (asyncpg / aiosqlite)
+    """
+    try:
+        return {**get_pool_stats(), "async_pool": get_async_pool_stats()}
+    except Exception as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Base de datos no disponible: {str(e)}"
+        )
+
+
+@app.get("/api/cache/stats")
+async def response_cache_stats():
+    """
+    Contadores de la caché de respuestas de Power BI (hits, misses, evictions),
+    de la caché en disco de Excel descargados (excel_cache) y memoria del
+    snapshot columnar (columnar_snapshot)
+    """
+    cache = get_response_cache()
+    stats = {"enabled": True, **cache.stats()} if cache is not None else {"enabled": False}
+    excel_cache = get_excel_cache()
+    stats["excel_cache"] = (
+        {"enabled": True, **excel_cache.stats()} if excel_cache is not None else {"enabled": False}
+    )
+    snapshot = get_columnar_snapshot()
+    stats["columnar_snapshot"] = (
+        {"enabled": True, **snapshot.memory_stats()} if snapshot is not None else {"enabled": False}
+    )
+    return stats
+
+
 @app.post("/api/balance-report-by-thirdparty", response_model=dict)
 async def get_balance_report(request: BalanceReportRequest):
     """
@@ -145,27 +254,58 @@ async def get_balance_report(request: BalanceReportRequest):
 # Endpoints ETL
 # ==========================
 
+async def _enqueue_etl_job(db: AsyncDB, kind: str, params: dict) -> JSONResponse:
+    """Encola un job ETL y responde 202 con su id (429 si la cola está llena)"""
+    queue_size = get_settings().etl_job_queue_size
+    try:
+        job = await db.run_sync(lambda session: job_to_dict(enqueue_job(session, kind, params, queue_size)))
+        await db.commit()
+    except JobQueueFull as e:
+        await db.rollback()
+        raise HTTPException(status_code=429, detail=str(e))
+    if job_runner is not None:
+        job_runner.notify()
+    return JSONResponse(
+        status_code=202,
+        content={
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "status_url": f"/api/etl/jobs/{job['job_id']}",
+        }
+    )
+
+
 @app.post("/api/etl/process-year", response_model=dict)
-async def process_year_etl(request: ETLProcessRequest):
+async def process_year_etl(
+    request: ETLProcessRequest,
+    background: bool = Query(False, description="Encolar como job y responder de inmediato con su id"),
+    db: AsyncDB = Depends(get_async_db)
+):
     """
     Procesa reportes de Siigo mes por mes para un año y los guarda en PostgreSQL
     Replica la primera query de PowerQuery
+    Con background=true responde 202 con el id del job (ver /api/etl/jobs/{job_id})
     """
     if etl_service is None:
         raise HTTPException(
             status_code=503,
             detail="Servicio ETL no disponible. PostgreSQL no está configurado o no está corriendo."
         )
+    params = {
+        "year": request.year,
+        "month_start": request.month_start or 1,
+        "month_end": request.month_end or 12,
+        "account_start": request.account_start,
+        "account_end": request.account_end,
+        "includes_tax_diff": request.includes_tax_diff,
+        "clear_existing": request.clear_existing,
+        "force": request.force,
+        "replay": request.replay,
+    }
+    if background:
+        return await _enqueue_etl_job(db, "process-year", params)
     try:
-        result = await etl_service.process_year_report(
-            year=request.year,
-            month_start=request.month_start or 1,
-            month_end=request.month_end or 12,
-            account_start=request.account_start,
-            account_end=request.account_end,
-            includes_tax_diff=request.includes_tax_diff,
-            clear_existing=request.clear_existing
-        )
+        result = await etl_service.process_year_report(**params)
         return result
     except Exception as e:
         raise HTTPException(
@@ -175,24 +315,34 @@ async def process_year_etl(request: ETLProcessRequest):
 
 
 @app.post("/api/etl/process-previous-year", response_model=dict)
-async def process_previous_year_etl(request: ETLPreviousYearRequest):
+async def process_previous_year_etl(
+    request: ETLPreviousYearRequest,
+    background: bool = Query(False, description="Encolar como job y responder de inmediato con su id"),
+    db: AsyncDB = Depends(get_async_db)
+):
     """
     Procesa el año anterior completo (12 meses)
     Replica la segunda y tercera query de PowerQuery
+    Con background=true responde 202 con el id del job (ver /api/etl/jobs/{job_id})
     """
     if etl_service is None:
         raise HTTPException(
             status_code=503,
             detail="Servicio ETL no disponible. PostgreSQL no está configurado o no está corriendo."
         )
+    params = {
+        "year_base": request.year_base,
+        "account_start": request.account_start,
+        "account_end": request.account_end,
+        "includes_tax_diff": request.includes_tax_diff,
+        "clear_existing": request.clear_existing,
+        "force": request.force,
+        "replay": request.replay,
+    }
+    if background:
+        return await _enqueue_etl_job(db, "process-previous-year", params)
     try:
-        result = await etl_service.process_previous_year(
-            year_base=request.year_base,
-            account_start=request.account_start,
-            account_end=request.account_end,
-            includes_tax_diff=request.includes_tax_diff,
-            clear_existing=request.clear_existing
-        )
+        result = await etl_service.process_previous_year(**params)
         return result
     except Exception as e:
         raise HTTPException(
@@ -202,28 +352,43 @@ async def process_previous_year_etl(request: ETLPreviousYearRequest):
 
 
 @app.post("/api/etl/process-date-range", response_model=dict)
-async def process_date_range_etl(request: ETLProcessDateRangeRequest):
+async def process_date_range_etl(
+    request: ETLProcessDateRangeRequest,
+    background: bool = Query(False, description="Encolar como job y responder de inmediato con su id"),
+    db: AsyncDB = Depends(get_async_db)
+):
     """
     Procesa reportes desde fecha_inicio hasta fecha_fin
     Replica la lógica de PowerQuery con rango de fechas
     
     Ejemplo: Si fecha_inicio es 2024-01-31 y fecha_fin es 2025-09-30, 
     procesa todos los periodos entre esas fechas
+    Con background=true responde 202 con el id del job (ver /api/etl/jobs/{job_id})
     """
     if etl_service is None:
         raise HTTPException(
             status_code=503,
             detail="Servicio ETL no disponible. PostgreSQL no está configurado o no está corriendo."
         )
+    params = {
+        "fecha_inicio": request.fecha_inicio,
+        "fecha_fin": request.fecha_fin,
+        "account_start": request.account_start,
+        "account_end": request.account_end,
+        "includes_tax_diff": request.includes_tax_diff,
+        "clear_existing": request.clear_existing,
+        "force": request.force,
+        "replay": request.replay,
+    }
+    if background:
+        # Validar las fechas antes de encolar: el error se ve en esta respuesta
+        try:
+            etl_service.plan_date_range(request.fecha_inicio, request.fecha_fin)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return await _enqueue_etl_job(db, "process-date-range", params)
     try:
-        result = await etl_service.process_date_range(
-            fecha_inicio=request.fecha_inicio,
-            fecha_fin=request.fecha_fin,
-            account_start=request.account_start,
-            account_end=request.account_end,
-            includes_tax_diff=request.includes_tax_diff,
-            clear_existing=request.clear_existing
-        )
+        result = await etl_service.process_date_range(**params)
         return result
     except ValueError as e:
         raise HTTPException(
@@ -237,12 +402,286 @@ async def process_date_range_etl(request: ETLProcessDateRangeRequest):
         )
 
 
+@app.get("/api/etl/jobs")
+async def list_etl_jobs(
+    status: Optional[str] = Query(None, description="queued | running | cancelling | succeeded | failed | cancelled"),
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncDB = Depends(get_async_db)
+):
+    """Jobs ETL más recientes (todos los workers)"""
+    jobs = await db.run_sync(
+        lambda session: [job_to_dict(job) for job in list_jobs(session, status, limit)]
+    )
+    return {"jobs": jobs}
+
+
+def _job_dict(db: Session, job_id: str) -> Optional[dict]:
+    job = get_job(db, job_id)
+    return job_to_dict(job) if job is not None else None
+
+
+@app.get("/api/etl/jobs/{job_id}")
+async def get_etl_job(job_id: str, db: AsyncDB = Depends(get_async_db)):
+    """Estado de un job: avance por periodo (filas, tiempos, errores) y resultado final"""
+    job = await db.run_sync(_job_dict, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job no encontrado: {job_id}")
+    return job
+
+
+@app.post("/api/etl/jobs/{job_id}/cancel")
+async def cancel_etl_job(job_id: str, db: AsyncDB = Depends(get_async_db)):
+    """
+    Cancela un job: si está en cola no llega a ejecutarse; si está corriendo se
+    detiene en su próximo latido (los periodos ya cargados se conservan). Una
+    escritura en curso se revierte antes del commit; mientras su hilo termina el
+    job figura como cancelling
+    """
+    job = await db.run_sync(_job_dict, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job no encontrado: {job_id}")
+    if job["status"] in FINISHED_STATUSES:
+        raise HTTPException(status_code=409, detail=f"El job ya terminó ({job['status']})")
+
+    job = await db.run_sync(lambda session: job_to_dict(request_cancel(session, job_id)))
+    await db.commit()
+    if job_runner is not None:
+        job_runner.cancel_local(job_id)
+    return job
+
+
 # ==========================
 # Endpoints para Power BI
 # ==========================
 
+def _apply_powerbi_filters(
+    query,
+    año: Optional[int] = None,
+    periodo: Optional[int] = None,
+    codigo_cuenta: Optional[int] = None,
+    cod_relacional: Optional[str] = None,
+    identificacion: Optional[str] = None
+):
+    """
+    Filtros comunes de los endpoints de Power BI
+    El año se traduce además al rango de periodos AAAA00..AAAA99: así lo resuelven
+    los índices (..., periodo, id) y la poda de particiones en PostgreSQL
+    """
+    if año is not None:
+        query = query.filter(BalanceReport.año == año)
+        if periodo is None:
+            query = query.filter(BalanceReport.periodo.between(año * 100, año * 100 + 99))
+    if periodo is not None:
+        query = query.filter(BalanceReport.periodo == periodo)
+    if codigo_cuenta is not None:
+        query = query.filter(BalanceReport.codigo_cuenta_contable == codigo_cuenta)
+    if cod_relacional is not None:
+        query = query.filter(BalanceReport.cod_relacional == cod_relacional)
+    if identificacion is not None:
+        query = query.filter(BalanceReport.identificacion == identificacion)
+    return query
+
+
+def _encode_cursor(periodo: int, record_id: int) -> str:
+    """Cursor opaco con la última posición (periodo, id) entregada"""
+    raw = json.dumps([periodo, record_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[int, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        periodo, record_id = json.loads(base64.urlsafe_b64decode(padded))
+        return int(periodo), int(record_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def _balance_report_to_dict(record: BalanceReport) -> dict:
+    return {
+        "id": record.id,
+        "codigo_cuenta_contable": record.codigo_cuenta_contable,
+        "nombre_cuenta_contable": record.nombre_cuenta_contable,
+        "cod_relacional": record.cod_relacional,
+        "identificacion": record.identificacion,
+        "sucursal": record.sucursal,
+        "nombre_tercero": record.nombre_tercero,
+        "saldo_inicial": float(record.saldo_inicial) if record.saldo_inicial else None,
+        "movimiento_debito": float(record.movimiento_debito) if record.movimiento_debito else None,
+        "movimiento_credito": float(record.movimiento_credito) if record.movimiento_credito else None,
+        "movimiento": float(record.movimiento) if record.movimiento else None,
+        "saldo_final": float(record.saldo_final) if record.saldo_final else None,
+        "fecha": record.fecha.isoformat() if record.fecha else None,
+        "año": record.año,
+        "periodo": record.periodo,
+        "created_at": record.created_at.isoformat() if record.created_at else None
+    }
+
+
+async def _cached_powerbi_response(
+    request: Request,
+    db: AsyncDB,
+    endpoint: str,
+    params: dict,
+    build: Callable[[], Awaitable[CachedResponse]],
+    año: Optional[int] = None,
+    periodo: Optional[int] = None
+) -> Response:
+    """
+    Sirve una respuesta de Power BI desde la caché cuando la versión de datos de
+    los periodos consultados no cambió; responde 304 si el ETag coincide
+    endpoint es la etiqueta de las métricas (hit / miss / not_modified)
+    """
+    cache = get_response_cache()
+    token = await db.run_sync(version_token, año=año, periodo=periodo)
+    key = cache_key(request.url.path, params, token)
+    etag = etag_for(key)
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        POWERBI_CACHE.labels(endpoint=endpoint, result="not_modified").inc()
+        return Response(status_code=304, headers={"ETag": etag})
+
+    cached = cache.get(key) if cache is not None else None
+    status = "HIT" if cached is not None else "MISS"
+    POWERBI_CACHE.labels(endpoint=endpoint, result=status.lower()).inc()
+    if cached is None:
+        cached = await build()
+        if cache is not None:
+            cache.set(key, cached)
+
+    return Response(
+        content=cached.body,
+        media_type=cached.media_type,
+        headers={**cached.headers, "ETag": etag, "X-Cache": status}
+    )
+
+
+def _json_body(content) -> bytes:
+    return JSONResponse(content=content).body
+
+
+async def _serialize_json(endpoint: str, build_content: Callable[[], dict]) -> bytes:
+    """
+    Arma y serializa el JSON en un hilo: con miles de filas son decenas de ms
+    de CPU que no deben frenar el event loop
+    """
+    with timed(POWERBI_SERIALIZATION_SECONDS, endpoint=endpoint, format="json"):
+        return await asyncio.to_thread(lambda: _json_body(build_content()))
+
+
+def _balance_reports_query(
+    db: Session,
+    filters: dict,
+    limit: int,
+    offset: int,
+    keyset: bool,
+    after: Optional[Tuple[int, int]],
+    include_total: bool,
+    format: str
+) -> Tuple[list, Optional[int], bool]:
+    """Consulta una página de la vista balance_reports_flat: (filas, total, has_more)"""
+    columnar = format != "json"
+    base_query = db.query(*select_columns(format)) if columnar else db.query(BalanceReport)
+    query = _apply_powerbi_filters(base_query, **filters)
+    total = query.order_by(None).count() if include_total else None
+
+    query = query.order_by(BalanceReport.periodo, BalanceReport.id)
+    if keyset:
+        if after:
+            query = query.filter(
+                tuple_(BalanceReport.periodo, BalanceReport.id) > tuple_(*after)
+            )
+        # Pedir una fila extra para saber si hay más sin contar
+        results = query.limit(limit + 1).all()
+    else:
+        results = query.offset(offset).limit(limit + 1).all()
+    return results[:limit], total, len(results) > limit
+
+
+async def _balance_reports_page(
+    db: AsyncDB,
+    snapshot: Optional[ColumnarSnapshot],
+    filters: dict,
+    limit: int,
+    offset: int,
+    keyset: bool,
+    cursor: Optional[str],
+    include_total: bool,
+    format: str
+) -> CachedResponse:
+    """
+    Consulta y serializa una página de balance_reports_flat
+    Con snapshot se filtra en memoria; si no, la consulta va por la sesión asíncrona
+    """
+    started = time.perf_counter()
+    after = _decode_cursor(cursor) if (keyset and cursor) else None
+    if snapshot is not None:
+        # sync lee de la base los periodos que cambiaron: en un hilo con su Session
+        await asyncio.to_thread(run_with_session, snapshot.sync)
+        results, total, has_more = snapshot.page(
+            **filters, limit=limit, offset=offset, after=after, include_total=include_total
+        )
+    else:
+        results, total, has_more = await db.run_sync(
+            _balance_reports_query, filters, limit, offset, keyset, after, include_total, format
+        )
+
+    last = results[-1] if results else None
+    next_cursor = _encode_cursor(last.periodo, last.id) if (keyset and last and has_more) else None
+    POWERBI_QUERY_SECONDS.labels(endpoint="balance-reports").observe(time.perf_counter() - started)
+    POWERBI_ROWS_RETURNED.labels(endpoint="balance-reports").observe(len(results))
+
+    with timed(POWERBI_SERIALIZATION_SECONDS, endpoint="balance-reports", format=format):
+        return await asyncio.to_thread(
+            _serialize_page, results, format, total, limit, offset, has_more, keyset, next_cursor
+        )
+
+
+def _serialize_page(
+    results: list,
+    format: str,
+    total: Optional[int],
+    limit: int,
+    offset: int,
+    has_more: bool,
+    keyset: bool,
+    next_cursor: Optional[str]
+) -> CachedResponse:
+    """Cuerpo y cabeceras de una página ya consultada (JSON o columnar)"""
+    if format != "json":
+        headers = {"X-Has-More": str(has_more).lower()}
+        if total is not None:
+            headers["X-Total-Count"] = str(total)
+        if keyset:
+            if next_cursor:
+                headers["X-Next-Cursor"] = next_cursor
+        else:
+            headers["X-Offset"] = str(offset)
+        return CachedResponse(
+            body=rows_to_columnar_bytes(results, format),
+            media_type=MEDIA_TYPES[format],
+            headers=headers
+        )
+
+    # Convertir a diccionarios
+    data = [_balance_report_to_dict(record) for record in results]
+
+    response = {
+        "data": data,
+        "total": total,
+        "limit": limit,
+        "has_more": has_more
+    }
+    if keyset:
+        response["next_cursor"] = next_cursor
+    else:
+        response["offset"] = offset
+    return CachedResponse(body=_json_body(response), media_type="application/json")
+
+
 @app.get("/api/powerbi/balance-reports")
 async def get_balance_reports_powerbi(
+    request: Request,
     año: Optional[int] = Query(None, description="Filtrar por año"),
     periodo: Optional[int] = Query(None, description="Filtrar por periodo (AAAAMM)"),
     codigo_cuenta: Optional[int] = Query(None, description="Filtrar por código de cuenta"),
@@ -250,59 +689,63 @@ async def get_balance_reports_powerbi(
     identificacion: Optional[str] = Query(None, description="Filtrar por identificación"),
     limit: int = Query(1000, ge=1, le=10000, description="Límite de registros"),
     offset: int = Query(0, ge=0, description="Offset para paginación"),
-    db: Session = Depends(get_db)
+    use_cursor: bool = Query(False, description="Paginación por cursor (keyset) ordenada por (periodo, id)"),
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior (implica use_cursor)"),
+    include_total: Optional[bool] = Query(None, description="Calcular total (por defecto sí con offset, no con cursor)"),
+    format: str = Query("json", pattern="^(json|arrow|parquet)$", description="Formato: json, arrow o parquet"),
+    db: AsyncDB = Depends(get_async_db)
 ):
     """
     Endpoint para Power BI - Obtiene datos de balance reports con filtros
+
+    Dos modos de paginación, ambos ordenados por (periodo, id):
+    - offset/limit (compatibilidad): el costo crece con el offset
+    - cursor: enviar use_cursor=true en la primera página y luego el next_cursor
+      recibido; el costo por página es constante sin importar la profundidad
+
+    Con format=arrow|parquet la página se envía como binario columnar y los
+    metadatos de paginación van en las cabeceras X-Total-Count, X-Has-More,
+    X-Next-Cursor y X-Offset
+
+    Las respuestas se cachean hasta que el ETL vuelve a cargar alguno de los
+    periodos consultados; con If-None-Match se responde 304 sin cuerpo.
+    Con SNAPSHOT_ENABLED se responde desde el snapshot columnar en memoria
     """
+    keyset = use_cursor or cursor is not None
+    if include_total is None:
+        include_total = not keyset
+    if format != "json" and not columnar_available():
+        raise HTTPException(status_code=501, detail="Formato no disponible: instale pyarrow")
+
+    filters = {
+        "año": año,
+        "periodo": periodo,
+        "codigo_cuenta": codigo_cuenta,
+        "cod_relacional": cod_relacional,
+        "identificacion": identificacion,
+    }
+    params = {
+        **filters,
+        "limit": limit,
+        "offset": None if keyset else offset,
+        "keyset": keyset,
+        "cursor": cursor,
+        "include_total": include_total,
+        "format": format,
+    }
+
     try:
-        query = db.query(BalanceReport)
-        
-        # Aplicar filtros
-        if año is not None:
-            query = query.filter(BalanceReport.año == año)
-        if periodo is not None:
-            query = query.filter(BalanceReport.periodo == periodo)
-        if codigo_cuenta is not None:
-            query = query.filter(BalanceReport.codigo_cuenta_contable == codigo_cuenta)
-        if cod_relacional is not None:
-            query = query.filter(BalanceReport.cod_relacional == cod_relacional)
-        if identificacion is not None:
-            query = query.filter(BalanceReport.identificacion == identificacion)
-        
-        # Aplicar paginación
-        total = query.count()
-        results = query.offset(offset).limit(limit).all()
-        
-        # Convertir a diccionarios
-        data = []
-        for record in results:
-            data.append({
-                "id": record.id,
-                "codigo_cuenta_contable": record.codigo_cuenta_contable,
-                "nombre_cuenta_contable": record.nombre_cuenta_contable,
-                "cod_relacional": record.cod_relacional,
-                "identificacion": record.identificacion,
-                "sucursal": record.sucursal,
-                "nombre_tercero": record.nombre_tercero,
-                "saldo_inicial": float(record.saldo_inicial) if record.saldo_inicial else None,
-                "movimiento_debito": float(record.movimiento_debito) if record.movimiento_debito else None,
-                "movimiento_credito": float(record.movimiento_credito) if record.movimiento_credito else None,
-                "movimiento": float(record.movimiento) if record.movimiento else None,
-                "saldo_final": float(record.saldo_final) if record.saldo_final else None,
-                "fecha": record.fecha.isoformat() if record.fecha else None,
-                "año": record.año,
-                "periodo": record.periodo,
-                "created_at": record.created_at.isoformat() if record.created_at else None
-            })
-        
-        return {
-            "data": data,
-            "total": total,
-            "limit": limit,
-            "offset": offset,
-            "has_more": (offset + limit) < total
-        }
+        snapshot = get_columnar_snapshot()
+        return await _cached_powerbi_response(
+            request, db, "balance-reports", params,
+            lambda: _balance_reports_page(
+                db, snapshot, filters, limit, offset, keyset, cursor, include_total, format
+            ),
+            año=año,
+            periodo=periodo
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -310,41 +753,202 @@ async def get_balance_reports_powerbi(
         )
 
 
+async def _aggregate_response(
+    db: AsyncDB,
+    dimensions: List[str],
+    measures: List[Tuple[str, str]],
+    filters: dict,
+    limit: int
+) -> CachedResponse:
+    """Ejecuta el GROUP BY (una sola consulta) y serializa los grupos"""
+    statement = _apply_powerbi_filters(aggregate_statement(dimensions, measures), **filters)
+    with timed(POWERBI_QUERY_SECONDS, endpoint="aggregate"):
+        # Un grupo extra para saber si hay más sin contar
+        rows = await db.run_sync(lambda session: session.execute(statement.limit(limit + 1)).all())
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    POWERBI_ROWS_RETURNED.labels(endpoint="aggregate").observe(len(rows))
+
+    body = await _serialize_json("aggregate", lambda: {
+        "group_by": dimensions,
+        "measures": ["row_count", *[measure_label(f, m) for f, m in measures]],
+        "data": aggregate_rows_to_dicts(rows),
+        "has_more": has_more,
+    })
+    return CachedResponse(body=body, media_type="application/json")
+
+
+@app.get("/api/powerbi/balance-reports/aggregate")
+async def aggregate_balance_reports_powerbi(
+    request: Request,
+    group_by: str = Query("periodo", description="Dimensiones separadas por coma: año, periodo, codigo_cuenta_contable, cod_relacional, identificacion"),
+    measures: Optional[str] = Query(None, description="función:columna separadas por coma (sum|count|min|max); por defecto la suma de los cinco montos"),
+    año: Optional[int] = Query(None, description="Filtrar por año"),
+    periodo: Optional[int] = Query(None, description="Filtrar por periodo (AAAAMM)"),
+    codigo_cuenta: Optional[int] = Query(None, description="Filtrar por código de cuenta"),
+    cod_relacional: Optional[str] = Query(None, description="Filtrar por código relacional"),
+    identificacion: Optional[str] = Query(None, description="Filtrar por identificación"),
+    limit: int = Query(10000, ge=1, le=100000, description="Máximo de grupos"),
+    db: AsyncDB = Depends(get_async_db)
+):
+    """
+    Endpoint para Power BI - Totales agrupados calculados en la base
+
+    Un solo GROUP BY con los mismos filtros que /api/powerbi/balance-reports:
+    se transfieren los grupos (KB) en lugar de todas las filas (MB). Cada grupo
+    trae row_count y las medidas pedidas, con nombre función_columna
+    (ej: sum_saldo_final). Sin group_by se obtiene un único total
+
+    Ejemplo: group_by=periodo,codigo_cuenta_contable&measures=sum:saldo_final,max:movimiento
+    """
+    try:
+        dimensions = parse_group_by(group_by)
+        measure_list = parse_measures(measures)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    filters = {
+        "año": año,
+        "periodo": periodo,
+        "codigo_cuenta": codigo_cuenta,
+        "cod_relacional": cod_relacional,
+        "identificacion": identificacion,
+    }
+    params = {
+        **filters,
+        "group_by": dimensions,
+        "measures": [measure_label(f, m) for f, m in measure_list],
+        "limit": limit,
+    }
+
+    try:
+        return await _cached_powerbi_response(
+            request, db, "aggregate", params,
+            lambda: _aggregate_response(db, dimensions, measure_list, filters, limit),
+            año=año,
+            periodo=periodo
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error al agregar datos: {str(e)}"
+        )
+
+
+async def _balances_response(db: AsyncDB, keys: list, hasta: int, desde: Optional[int]) -> CachedResponse:
+    with timed(POWERBI_QUERY_SECONDS, endpoint="balances"):
+        data = await db.run_sync(
+            balances, keys, hasta, desde, chunk_size=get_settings().balance_query_chunk_keys
+        )
+    POWERBI_ROWS_RETURNED.labels(endpoint="balances").observe(len(data))
+    body = await _serialize_json("balances", lambda: {"hasta": hasta, "desde": desde, "data": data})
+    return CachedResponse(body=body, media_type="application/json")
+
+
+@app.post("/api/powerbi/balances")
+async def get_balances_powerbi(request: Request, body: BalanceAtDateRequest, db: AsyncDB = Depends(get_async_db)):
+    """
+    Endpoint para Power BI - Saldos a una fecha de muchas claves en una sola llamada
+
+    Cada clave es (codigo_cuenta_contable, identificacion, sucursal); sin sucursal
+    se devuelve una fila por cada sucursal de la cuenta y tercero. Se toma el
+    último periodo <= fecha_fin de cada clave (el saldo se arrastra en los meses
+    en que la clave no aparece). Con fecha_inicio se agregan el saldo de apertura
+    (antes del mes de fecha_inicio) y los débitos / créditos del rango
+    """
+    try:
+        fecha_fin = datetime.strptime(body.fecha_fin, "%Y-%m-%d").date()
+        fecha_inicio = (
+            datetime.strptime(body.fecha_inicio, "%Y-%m-%d").date() if body.fecha_inicio else None
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha inválido. Use YYYY-MM-DD")
+    if fecha_inicio is not None and fecha_inicio > fecha_fin:
+        raise HTTPException(status_code=400, detail="fecha_inicio debe ser anterior o igual a fecha_fin")
+
+    hasta = periodo_for_date(fecha_fin, body.include_closing)
+    desde = fecha_inicio.year * 100 + fecha_inicio.month if fecha_inicio else None
+    keys = [
+        (key.codigo_cuenta_contable, key.identificacion or "", key.sucursal)
+        for key in body.keys
+    ]
+    params = {"hasta": hasta, "desde": desde, "keys": keys}
+
+    try:
+        return await _cached_powerbi_response(
+            request, db, "balances", params,
+            lambda: _balances_response(db, keys, hasta, desde)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error al consultar saldos: {str(e)}"
+        )
+
+
+@app.get("/api/powerbi/balance-reports/export")
+async def export_balance_reports_powerbi(
+    format: str = Query("ndjson", pattern="^(ndjson|csv|arrow|parquet)$", description="Formato: ndjson, csv, arrow o parquet"),
+    año: Optional[int] = Query(None, description="Filtrar por año"),
+    periodo: Optional[int] = Query(None, description="Filtrar por periodo (AAAAMM)"),
+    codigo_cuenta: Optional[int] = Query(None, description="Filtrar por código de cuenta"),
+    cod_relacional: Optional[str] = Query(None, description="Filtrar por código relacional"),
+    identificacion: Optional[str] = Query(None, description="Filtrar por identificación"),
+):
+    """
+    Endpoint para Power BI - Exporta todo el resultado en una sola respuesta en streaming
+
+    Reemplaza cientos de llamadas paginadas: las filas se leen con un cursor del
+    servidor y se envían a medida que llegan (memoria constante). En arrow cada
+    lote es un RecordBatch del stream IPC; en parquet, un row group
+    """
+    if format in ("arrow", "parquet") and not columnar_available():
+        raise HTTPException(status_code=501, detail="Formato no disponible: instale pyarrow")
+
+    statement = _apply_powerbi_filters(
+        export_statement(format), año, periodo, codigo_cuenta, cod_relacional, identificacion
+    )
+    extension = FILE_EXTENSIONS[format]
+    return StreamingResponse(
+        stream_export(statement, format, get_settings().export_chunk_rows),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="balance_reports.{extension}"'}
+    )
+
+
+async def _stats_response(db: AsyncDB, año: Optional[int]) -> CachedResponse:
+    snapshot = get_columnar_snapshot()
+    with timed(POWERBI_QUERY_SECONDS, endpoint="stats"):
+        if snapshot is not None:
+            await asyncio.to_thread(run_with_session, snapshot.sync)
+            stats = snapshot.summary_stats(año)
+        else:
+            stats = await db.run_sync(summary_stats, año)
+    with timed(POWERBI_SERIALIZATION_SECONDS, endpoint="stats", format="json"):
+        body = JSONResponse(content=stats).body
+    return CachedResponse(body=body, media_type="application/json")
+
+
 @app.get("/api/powerbi/stats")
 async def get_stats_powerbi(
+    request: Request,
     año: Optional[int] = Query(None, description="Filtrar por año"),
-    db: Session = Depends(get_db)
+    db: AsyncDB = Depends(get_async_db)
 ):
     """
     Endpoint para Power BI - Estadísticas agregadas
+    Se leen de balance_period_summary (una fila por periodo), no de fact_balance
     """
     try:
-        query = db.query(BalanceReport)
-        
-        if año is not None:
-            query = query.filter(BalanceReport.año == año)
-        
-        from sqlalchemy import func
-        
-        total_records = query.count()
-        total_saldo_final = query.with_entities(
-            func.sum(BalanceReport.saldo_final)
-        ).scalar() or 0
-        
-        # Agrupar por año
-        years = db.query(BalanceReport.año).distinct().all()
-        years_list = [y[0] for y in years if y[0] is not None]
-        
-        # Agrupar por periodo
-        periods = db.query(BalanceReport.periodo).distinct().all()
-        periods_list = [p[0] for p in periods if p[0] is not None]
-        
-        return {
-            "total_records": total_records,
-            "total_saldo_final": float(total_saldo_final),
-            "years": sorted(years_list),
-            "periods": sorted(periods_list)
-        }
+        # years/periods abarcan todos los periodos: la versión no se filtra por año
+        return await _cached_powerbi_response(
+            request, db, "stats", {"año": año},
+            lambda: _stats_response(db, año)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -352,6 +956,106 @@ async def get_stats_powerbi(
         )
 
 
+async def _dimension_response(db: AsyncDB, endpoint: str, load: Callable[[Session], list]) -> CachedResponse:
+    with timed(POWERBI_QUERY_SECONDS, endpoint=endpoint):
+        data = await db.run_sync(load)
+    POWERBI_ROWS_RETURNED.labels(endpoint=endpoint).observe(len(data))
+    body = await _serialize_json(endpoint, lambda: {"data": data, "total": len(data)})
+    return CachedResponse(body=body, media_type="application/json")
+
+
+@app.get("/api/powerbi/dim/cuentas")
+async def get_dim_cuentas_powerbi(request: Request, db: AsyncDB = Depends(get_async_db)):
+    """
+    Endpoint para Power BI - Dimensión de cuentas (esquema estrella)
+    Una fila por codigo_cuenta_contable con su clave cuenta_id; se descarga una
+    vez y se relaciona con /api/powerbi/facts por cuenta_id
+    """
+    try:
+        return await _cached_powerbi_response(
+            request, db, "dim_cuentas", {},
+            lambda: _dimension_response(db, "dim_cuentas", dim_cuenta_rows)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error al obtener cuentas: {str(e)}"
+        )
+
+
+@app.get("/api/powerbi/dim/terceros")
+async def get_dim_terceros_powerbi(request: Request, db: AsyncDB = Depends(get_async_db)):
+    """
+    Endpoint para Power BI - Dimensión de terceros (esquema estrella)
+    Una fila por (identificacion, sucursal) con su clave tercero_id; sin
+    identificación o sucursal el valor es cadena vacía
+    """
+    try:
+        return await _cached_powerbi_response(
+            request, db, "dim_terceros", {},
+            lambda: _dimension_response(db, "dim_terceros", dim_tercero_rows)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error al obtener terceros: {str(e)}"
+        )
+
+
+async def _facts_response(db: AsyncDB, filters: dict, limit: int, cursor: Optional[str]) -> CachedResponse:
+    after = _decode_cursor(cursor) if cursor else None
+    with timed(POWERBI_QUERY_SECONDS, endpoint="facts"):
+        data, has_more = await db.run_sync(facts_page, limit=limit, after=after, **filters)
+    POWERBI_ROWS_RETURNED.labels(endpoint="facts").observe(len(data))
+    last = data[-1] if data else None
+    next_cursor = _encode_cursor(last["periodo"], last["balance_id"]) if (last and has_more) else None
+    body = await _serialize_json("facts", lambda: {
+        "data": data,
+        "limit": limit,
+        "has_more": has_more,
+        "next_cursor": next_cursor,
+    })
+    return CachedResponse(body=body, media_type="application/json")
+
+
+@app.get("/api/powerbi/facts")
+async def get_facts_powerbi(
+    request: Request,
+    año: Optional[int] = Query(None, description="Filtrar por año"),
+    periodo: Optional[int] = Query(None, description="Filtrar por periodo (AAAAMM)"),
+    cuenta_id: Optional[int] = Query(None, description="Filtrar por clave de dim_cuenta"),
+    tercero_id: Optional[int] = Query(None, description="Filtrar por clave de dim_tercero"),
+    limit: int = Query(10000, ge=1, le=50000, description="Límite de registros"),
+    cursor: Optional[str] = Query(None, description="Cursor next_cursor de la página anterior"),
+    db: AsyncDB = Depends(get_async_db)
+):
+    """
+    Endpoint para Power BI - Hechos del esquema estrella (fact_balance)
+
+    Solo claves enteras y montos: los nombres de cuentas y terceros se obtienen
+    de /api/powerbi/dim/cuentas y /api/powerbi/dim/terceros. Paginación por
+    cursor sobre la clave primaria (periodo, balance_id); balance_id es el id
+    de fact_balance (el mismo id de la vista balance_reports_flat)
+    """
+    filters = {"año": año, "periodo": periodo, "cuenta_id": cuenta_id, "tercero_id": tercero_id}
+    params = {**filters, "limit": limit, "cursor": cursor}
+
+    try:
+        return await _cached_powerbi_response(
+            request, db, "facts", params,
+            lambda: _facts_response(db, filters, limit, cursor),
+            año=año,
+            periodo=periodo
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error al obtener hechos: {str(e)}"
+        )
+
+
 if __name__ == "__main__":
     settings = get_settings()
     uvicorn.run(
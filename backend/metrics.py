@@ -0,0 +1,180 @@
+"""
+Métricas Prometheus y trazas opcionales (OpenTelemetry) del ETL y de la API
+Las métricas se exponen en GET /metrics. Con varios workers de uvicorn se debe
+definir PROMETHEUS_MULTIPROC_DIR (directorio vacío al arrancar) para que /metrics
+sume los valores de todos los procesos.
+Los procesos del pool de parseo no registran métricas: devuelven sus tiempos y
+el proceso padre los registra (ver parse_pool)
+Sin prometheus_client las métricas no hacen nada; sin opentelemetry, span() tampoco
+"""
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Iterator, Optional, Tuple
+
+try:
+    # pip install prometheus-client
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+    )
+    from prometheus_client import multiprocess
+except ImportError:
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+    Counter = Histogram = None
+
+try:
+    # Trazas opcionales: pip install opentelemetry-api (y un SDK/exportador configurado)
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+
+NAMESPACE = "siigo"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES_BUCKETS = (1e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7, 1e8)
+ROWS_BUCKETS = (0, 10, 100, 1000, 5000, 10000, 50000, 100000, 500000, 1000000)
+THROUGHPUT_BUCKETS = (1e2, 1e3, 5e3, 1e4, 2.5e4, 5e4, 1e5, 2.5e5, 5e5, 1e6)
+
+
+class _NoopMetric:
+    """Reemplazo de Counter/Histogram cuando prometheus_client no está instalado"""
+
+    def labels(self, *args, **kwargs) -> "_NoopMetric":
+        return self
+
+    def inc(self, amount: float = 1):
+        pass
+
+    def observe(self, amount: float):
+        pass
+
+
+def metrics_available() -> bool:
+    return Counter is not None
+
+
+def _counter(name: str, documentation: str, labels: Tuple[str, ...] = ()):
+    if Counter is None:
+        return _NoopMetric()
+    return Counter(name, documentation, labels, namespace=NAMESPACE)
+
+
+def _histogram(name: str, documentation: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+    if Histogram is None:
+        return _NoopMetric()
+    return Histogram(name, documentation, labels, namespace=NAMESPACE, buckets=buckets)
+
+
+# SiigoClient
+SIIGO_REQUEST_SECONDS = _histogram(
+    "api_request_seconds", "Latencia de las llamadas a la API de Siigo", ("endpoint", "status")
+)
+SIIGO_REQUESTS = _counter(
+    "api_requests", "Llamadas a la API de Siigo por código de estado (429 = rate limit)", ("endpoint", "status")
+)
+SIIGO_RATE_LIMIT_RETRIES = _counter(
+    "api_rate_limit_retries", "Reintentos del ETL por rate limit (429) de Siigo"
+)
+
+# ExcelProcessor
+EXCEL_DOWNLOAD_SECONDS = _histogram("excel_download_seconds", "Tiempo de descarga del Excel")
+EXCEL_DOWNLOAD_BYTES = _histogram(
+    "excel_download_bytes", "Tamaño del Excel descargado", buckets=BYTES_BUCKETS
+)
+EXCEL_PARSE_SECONDS = _histogram(
+    "excel_parse_seconds", "Tiempo de parseo del Excel por etapa", ("stage",)
+)
+EXCEL_ROWS = _counter(
+    "excel_rows", "Filas leídas del Excel: kept (transaccionales) o dropped", ("outcome",)
+)
+
+# ETLService
+ETL_LOAD_SECONDS = _histogram(
+    "etl_load_seconds", "Tiempo de escritura de un periodo en la base", ("mode",)
+)
+ETL_LOAD_ROWS_PER_SECOND = _histogram(
+    "etl_load_rows_per_second", "Filas por segundo de la escritura de un periodo",
+    ("mode",), buckets=THROUGHPUT_BUCKETS
+)
+ETL_ROWS_LOADED = _counter("etl_rows_loaded", "Filas escritas por el ETL")
+ETL_PERIOD_SECONDS = _histogram(
+    "etl_period_seconds", "Duración total de un periodo del ETL", ("outcome",),
+    buckets=LATENCY_BUCKETS + (300, 600)
+)
+ETL_PERIOD_ROWS = _histogram(
+    "etl_period_rows", "Filas cargadas por periodo", buckets=ROWS_BUCKETS
+)
+ETL_PERIODS = _counter(
+    "etl_periods", "Periodos procesados por resultado (loaded, skipped, failed)", ("outcome",)
+)
+
+# Endpoints de Power BI
+POWERBI_QUERY_SECONDS = _histogram(
+    "powerbi_query_seconds", "Tiempo de consulta a la base de los endpoints de Power BI", ("endpoint",)
+)
+POWERBI_SERIALIZATION_SECONDS = _histogram(
+    "powerbi_serialization_seconds", "Tiempo de serialización de la respuesta", ("endpoint", "format")
+)
+POWERBI_ROWS_RETURNED = _histogram(
+    "powerbi_rows_returned", "Filas devueltas por respuesta", ("endpoint",), buckets=ROWS_BUCKETS
+)
+POWERBI_CACHE = _counter(
+    "powerbi_cache_requests", "Respuestas de Power BI por resultado de la caché (hit, miss, not_modified)",
+    ("endpoint", "result")
+)
+SNAPSHOT_REFRESH_ERRORS = _counter(
+    "snapshot_refresh_errors", "Recargas del snapshot columnar tras el ETL que fallaron (se corrigen en la próxima sincronización)"
+)
+
+
+@contextmanager
+def timed(histogram, **labels) -> Iterator[None]:
+    """Observa en histogram los segundos que tarda el bloque"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metric = histogram.labels(**labels) if labels else histogram
+        metric.observe(time.perf_counter() - started)
+
+
+def span(name: str, **attributes):
+    """Span de OpenTelemetry (contexto actual como padre); sin opentelemetry no hace nada"""
+    if trace is None:
+        return nullcontext()
+    return trace.get_tracer("siigo-backend").start_as_current_span(name, attributes=attributes)
+
+
+def set_span_attributes(**attributes):
+    """Agrega atributos al span actual (ej: filas cargadas al terminar un periodo)"""
+    if trace is not None:
+        trace.get_current_span().set_attributes(attributes)
+
+
+def record_parse_stats(stats: dict):
+    """Registra en el proceso padre los tiempos y filas que devolvió el parseo"""
+    for stage in ("read", "filter", "transform", "prepare"):
+        if stage in stats:
+            EXCEL_PARSE_SECONDS.labels(stage=stage).observe(stats[stage])
+    EXCEL_ROWS.labels(outcome="kept").inc(stats.get("rows_kept", 0))
+    EXCEL_ROWS.labels(outcome="dropped").inc(stats.get("rows_dropped", 0))
+
+
+def _multiprocess_dir() -> Optional[str]:
+    return os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.environ.get("prometheus_multiproc_dir")
+
+
+def metrics_payload() -> bytes:
+    """Texto de exposición de Prometheus (agregado de todos los procesos en modo multiproceso)"""
+    if _multiprocess_dir():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def mark_process_dead():
+    """Al apagar un worker en modo multiproceso: descarta sus gauges activos"""
+    if metrics_available() and _multiprocess_dir():
+        multiprocess.mark_process_dead(os.getpid())
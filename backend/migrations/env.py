@@ -0,0 +1,66 @@
+"""
+Entorno de Alembic
+init_db() pasa su propia conexión en config.attributes["connection"]; desde la
+línea de comandos (alembic upgrade head) se usa el engine de database.py
+"""
+from logging.config import fileConfig
+from alembic import context
+from sqlalchemy import text
+from database import Base, get_db_engine
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    """Las vistas (ej: balance_reports_flat) se crean con SQL en las migraciones"""
+    return not (type_ == "table" and obj.info.get("is_view"))
+
+
+# Clave del advisory lock: evita que dos workers migren a la vez en PostgreSQL
+MIGRATION_LOCK_KEY = 7_351_042
+
+
+def _run_migrations(connection):
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_object=include_object,
+        render_as_batch=connection.dialect.name == "sqlite"
+    )
+    with context.begin_transaction():
+        if connection.dialect.name == "postgresql":
+            connection.execute(text(f"SELECT pg_advisory_xact_lock({MIGRATION_LOCK_KEY})"))
+        context.run_migrations()
+
+
+def run_migrations_offline():
+    context.configure(
+        url=str(get_db_engine().url),
+        target_metadata=target_metadata,
+        include_object=include_object,
+        literal_binds=True
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        _run_migrations(connection)
+        return
+
+    with get_db_engine().connect() as connection:
+        _run_migrations(connection)
+        connection.commit()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,78 @@
+"""Esquema inicial: balance_reports, balance_period_summary y data_versions
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+
+Las bases creadas antes con Base.metadata.create_all() ya tienen estas tablas:
+todo se crea con checkfirst para que la migración sea un no-op sobre ellas
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+metadata = sa.MetaData()
+
+balance_reports = sa.Table(
+    "balance_reports",
+    metadata,
+    sa.Column("id", sa.Integer, primary_key=True, index=True),
+    sa.Column("codigo_cuenta_contable", sa.Integer, index=True),
+    sa.Column("nombre_cuenta_contable", sa.Text),
+    sa.Column("cod_relacional", sa.String(10), index=True),
+    sa.Column("identificacion", sa.String(50), index=True),
+    sa.Column("sucursal", sa.String(100)),
+    sa.Column("nombre_tercero", sa.Text),
+    sa.Column("saldo_inicial", sa.Numeric(18, 2)),
+    sa.Column("movimiento_debito", sa.Numeric(18, 2)),
+    sa.Column("movimiento_credito", sa.Numeric(18, 2)),
+    sa.Column("movimiento", sa.Numeric(18, 2)),
+    sa.Column("saldo_final", sa.Numeric(18, 2)),
+    sa.Column("fecha", sa.Date, index=True),
+    sa.Column("año", sa.Integer, index=True),
+    sa.Column("periodo", sa.Integer, index=True),
+    sa.Column("created_at", sa.DateTime),
+    sa.Column("updated_at", sa.DateTime),
+    sa.Index("ix_balance_reports_periodo_id", "periodo", "id"),
+)
+
+balance_period_summary = sa.Table(
+    "balance_period_summary",
+    metadata,
+    sa.Column("año", sa.Integer, primary_key=True),
+    sa.Column("periodo", sa.Integer, primary_key=True),
+    sa.Column("row_count", sa.Integer, nullable=False),
+    sa.Column("saldo_inicial", sa.Numeric(20, 2)),
+    sa.Column("movimiento_debito", sa.Numeric(20, 2)),
+    sa.Column("movimiento_credito", sa.Numeric(20, 2)),
+    sa.Column("movimiento", sa.Numeric(20, 2)),
+    sa.Column("saldo_final", sa.Numeric(20, 2)),
+    sa.Column("updated_at", sa.DateTime),
+)
+
+data_versions = sa.Table(
+    "data_versions",
+    metadata,
+    sa.Column("periodo", sa.Integer, primary_key=True),
+    sa.Column("version", sa.Integer, nullable=False),
+    sa.Column("updated_at", sa.DateTime),
+)
+
+
+def upgrade():
+    bind = op.get_bind()
+    for table in metadata.sorted_tables:
+        table.create(bind=bind, checkfirst=True)
+        # Tablas existentes a las que create_all no les agregó índices nuevos
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+
+def downgrade():
+    bind = op.get_bind()
+    for table in reversed(metadata.sorted_tables):
+        table.drop(bind=bind, checkfirst=True)
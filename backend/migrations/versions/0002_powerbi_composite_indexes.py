@@ -0,0 +1,45 @@
+"""Índices compuestos para los filtros de Power BI
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+Cada filtro por igualdad (cuenta, código relacional, identificación) va seguido
+de (periodo, id): el mismo índice resuelve el filtro, el rango de periodos de un
+año y el ORDER BY periodo, id de la paginación. Los índices de una sola columna
+quedan cubiertos como prefijo y se eliminan para abaratar la carga
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+COMPOSITE_INDEXES = {
+    "ix_balance_reports_cuenta_periodo_id": ["codigo_cuenta_contable", "periodo", "id"],
+    "ix_balance_reports_cod_relacional_periodo_id": ["cod_relacional", "periodo", "id"],
+    "ix_balance_reports_identificacion_periodo_id": ["identificacion", "periodo", "id"],
+}
+
+SINGLE_COLUMN_INDEXES = {
+    "ix_balance_reports_codigo_cuenta_contable": "codigo_cuenta_contable",
+    "ix_balance_reports_cod_relacional": "cod_relacional",
+    "ix_balance_reports_identificacion": "identificacion",
+    "ix_balance_reports_año": "año",
+    "ix_balance_reports_periodo": "periodo",
+}
+
+
+def upgrade():
+    for name, columns in COMPOSITE_INDEXES.items():
+        op.create_index(name, "balance_reports", columns, if_not_exists=True)
+    for name in SINGLE_COLUMN_INDEXES:
+        op.drop_index(name, table_name="balance_reports", if_exists=True)
+
+
+def downgrade():
+    for name, column in SINGLE_COLUMN_INDEXES.items():
+        op.create_index(name, "balance_reports", [column], if_not_exists=True)
+    for name in COMPOSITE_INDEXES:
+        op.drop_index(name, table_name="balance_reports", if_exists=True)
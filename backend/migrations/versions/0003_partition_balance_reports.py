@@ -0,0 +1,95 @@
+"""Particionar balance_reports por LIST (periodo) en PostgreSQL
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+
+Se crea la tabla particionada con la misma estructura, una partición por cada
+periodo existente (balance_reports_pAAAAMM), se copian los datos y se reemplaza
+la tabla original. La PK pasa a ser (id, periodo), requisito de PostgreSQL para
+tablas particionadas; la secuencia de id se conserva. Las filas sin periodo no
+tienen partición posible: si hay alguna la migración falla indicando cuántas
+(el ETL siempre lo asigna), en lugar de descartarlas.
+En SQLite no hace nada
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    "ix_balance_reports_id": ["id"],
+    "ix_balance_reports_fecha": ["fecha"],
+    "ix_balance_reports_periodo_id": ["periodo", "id"],
+    "ix_balance_reports_cuenta_periodo_id": ["codigo_cuenta_contable", "periodo", "id"],
+    "ix_balance_reports_cod_relacional_periodo_id": ["cod_relacional", "periodo", "id"],
+    "ix_balance_reports_identificacion_periodo_id": ["identificacion", "periodo", "id"],
+}
+
+
+def _relkind(bind) -> str:
+    return bind.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass('balance_reports')")).scalar()
+
+
+def _sequence(bind):
+    return bind.execute(text("SELECT pg_get_serial_sequence('balance_reports', 'id')")).scalar()
+
+
+def _create_indexes():
+    for name, columns in INDEXES.items():
+        op.create_index(name, "balance_reports", columns)
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql" or _relkind(bind) == "p":
+        return
+
+    missing_period = bind.execute(text("SELECT count(*) FROM balance_reports WHERE periodo IS NULL")).scalar()
+    if missing_period:
+        raise RuntimeError(
+            f"balance_reports tiene {missing_period} filas sin periodo: asígnelo o elimínelas "
+            "antes de particionar (la PK (id, periodo) no admite NULL)"
+        )
+
+    sequence = _sequence(bind)
+    op.execute(
+        "CREATE TABLE balance_reports_partitioned "
+        "(LIKE balance_reports INCLUDING DEFAULTS) PARTITION BY LIST (periodo)"
+    )
+    periods = bind.execute(text(
+        "SELECT DISTINCT periodo FROM balance_reports ORDER BY periodo"
+    )).scalars().all()
+    for periodo in periods:
+        op.execute(
+            f'CREATE TABLE "balance_reports_p{int(periodo)}" '
+            f"PARTITION OF balance_reports_partitioned FOR VALUES IN ({int(periodo)})"
+        )
+    op.execute("INSERT INTO balance_reports_partitioned SELECT * FROM balance_reports")
+
+    if sequence:
+        op.execute(f"ALTER SEQUENCE {sequence} OWNED BY balance_reports_partitioned.id")
+    op.execute("DROP TABLE balance_reports")
+    op.execute("ALTER TABLE balance_reports_partitioned RENAME TO balance_reports")
+    op.execute("ALTER TABLE balance_reports ADD CONSTRAINT balance_reports_pkey PRIMARY KEY (id, periodo)")
+    _create_indexes()
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql" or _relkind(bind) != "p":
+        return
+
+    sequence = _sequence(bind)
+    op.execute("CREATE TABLE balance_reports_plain (LIKE balance_reports INCLUDING DEFAULTS)")
+    op.execute("ALTER TABLE balance_reports_plain ALTER COLUMN periodo DROP NOT NULL")
+    op.execute("INSERT INTO balance_reports_plain SELECT * FROM balance_reports")
+    if sequence:
+        op.execute(f"ALTER SEQUENCE {sequence} OWNED BY balance_reports_plain.id")
+    op.execute("DROP TABLE balance_reports CASCADE")
+    op.execute("ALTER TABLE balance_reports_plain RENAME TO balance_reports")
+    op.execute("ALTER TABLE balance_reports ADD CONSTRAINT balance_reports_pkey PRIMARY KEY (id)")
+    _create_indexes()
@@ -0,0 +1,36 @@
+"""Tabla etl_period_runs: hash del Excel cargado por periodo
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "etl_period_runs",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("year", sa.Integer, nullable=False),
+        sa.Column("month", sa.Integer, nullable=False),
+        sa.Column("account_start", sa.String(50), nullable=False),
+        sa.Column("account_end", sa.String(50), nullable=False),
+        sa.Column("includes_tax_diff", sa.Boolean, nullable=False),
+        sa.Column("content_hash", sa.String(64), nullable=False),
+        sa.Column("row_count", sa.Integer, nullable=False),
+        sa.Column("loaded_at", sa.DateTime),
+        sa.UniqueConstraint(
+            "year", "month", "account_start", "account_end", "includes_tax_diff",
+            name="uq_etl_period_runs_key"
+        ),
+    )
+
+
+def downgrade():
+    op.drop_table("etl_period_runs")
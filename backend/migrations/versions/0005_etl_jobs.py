@@ -0,0 +1,39 @@
+"""Tabla etl_jobs: cola persistente de ejecuciones del ETL en segundo plano
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "etl_jobs",
+        sa.Column("id", sa.String(32), primary_key=True),
+        sa.Column("kind", sa.String(30), nullable=False),
+        sa.Column("params", sa.JSON, nullable=False),
+        sa.Column("status", sa.String(20), nullable=False),
+        sa.Column("cancel_requested", sa.Boolean, nullable=False),
+        sa.Column("progress", sa.JSON),
+        sa.Column("result", sa.JSON),
+        sa.Column("error", sa.Text),
+        sa.Column("worker_id", sa.String(64)),
+        sa.Column("attempts", sa.Integer, nullable=False),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("started_at", sa.DateTime),
+        sa.Column("finished_at", sa.DateTime),
+        sa.Column("heartbeat_at", sa.DateTime),
+    )
+    op.create_index("ix_etl_jobs_status_created_at", "etl_jobs", ["status", "created_at"])
+
+
+def downgrade():
+    op.drop_index("ix_etl_jobs_status_created_at", table_name="etl_jobs")
+    op.drop_table("etl_jobs")
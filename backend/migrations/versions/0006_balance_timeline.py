@@ -0,0 +1,35 @@
+"""Tabla balance_timeline: saldos por cuenta / tercero / sucursal y periodo
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Se llena desde balance_reports al iniciar (backfill_balance_timeline)
+    op.create_table(
+        "balance_timeline",
+        sa.Column("codigo_cuenta_contable", sa.Integer, primary_key=True),
+        sa.Column("identificacion", sa.String(50), primary_key=True),
+        sa.Column("sucursal", sa.String(100), primary_key=True),
+        sa.Column("periodo", sa.Integer, primary_key=True),
+        sa.Column("año", sa.Integer, nullable=False),
+        sa.Column("saldo_inicial", sa.Numeric(20, 2)),
+        sa.Column("movimiento_debito", sa.Numeric(20, 2)),
+        sa.Column("movimiento_credito", sa.Numeric(20, 2)),
+        sa.Column("saldo_final", sa.Numeric(20, 2)),
+    )
+    op.create_index("ix_balance_timeline_periodo", "balance_timeline", ["periodo"])
+
+
+def downgrade():
+    op.drop_index("ix_balance_timeline_periodo", table_name="balance_timeline")
+    op.drop_table("balance_timeline")
@@ -0,0 +1,83 @@
+"""Esquema estrella: dim_cuenta, dim_tercero, fact_balance y la vista balance_reports_flat
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+
+balance_reports sigue siendo la tabla de aterrizaje del ETL. Las dimensiones y
+los hechos se llenan desde ella al iniciar (backfill_star_schema) y luego en
+cada carga; la vista devuelve la forma plana de balance_reports a partir de
+los hechos (created_at queda NULL: la fecha de carga no se guarda en los hechos)
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+FLAT_VIEW = """
+CREATE VIEW balance_reports_flat AS
+SELECT
+    f.balance_id AS id,
+    c.codigo_cuenta_contable,
+    c.nombre_cuenta_contable,
+    c.cod_relacional,
+    NULLIF(t.identificacion, '') AS identificacion,
+    NULLIF(t.sucursal, '') AS sucursal,
+    t.nombre_tercero,
+    f.saldo_inicial,
+    f.movimiento_debito,
+    f.movimiento_credito,
+    f.movimiento_debito - f.movimiento_credito AS movimiento,
+    f.saldo_final,
+    f.fecha,
+    f.año,
+    f.periodo,
+    CAST(NULL AS TIMESTAMP) AS created_at
+FROM fact_balance f
+LEFT JOIN dim_cuenta c ON c.cuenta_id = f.cuenta_id
+JOIN dim_tercero t ON t.tercero_id = f.tercero_id
+"""
+
+
+def upgrade():
+    op.create_table(
+        "dim_cuenta",
+        sa.Column("cuenta_id", sa.Integer, primary_key=True),
+        sa.Column("codigo_cuenta_contable", sa.Integer, nullable=False, unique=True),
+        sa.Column("nombre_cuenta_contable", sa.Text),
+        sa.Column("cod_relacional", sa.String(10)),
+        sa.Column("updated_at", sa.DateTime),
+    )
+    op.create_table(
+        "dim_tercero",
+        sa.Column("tercero_id", sa.Integer, primary_key=True),
+        sa.Column("identificacion", sa.String(50), nullable=False),
+        sa.Column("sucursal", sa.String(100), nullable=False),
+        sa.Column("nombre_tercero", sa.Text),
+        sa.Column("updated_at", sa.DateTime),
+        sa.UniqueConstraint("identificacion", "sucursal", name="uq_dim_tercero_identificacion_sucursal"),
+    )
+    op.create_table(
+        "fact_balance",
+        sa.Column("periodo", sa.Integer, primary_key=True),
+        sa.Column("balance_id", sa.Integer, primary_key=True),
+        sa.Column("año", sa.Integer, nullable=False),
+        sa.Column("fecha", sa.Date),
+        sa.Column("cuenta_id", sa.Integer),
+        sa.Column("tercero_id", sa.Integer, nullable=False),
+        sa.Column("saldo_inicial", sa.Numeric(18, 2)),
+        sa.Column("movimiento_debito", sa.Numeric(18, 2)),
+        sa.Column("movimiento_credito", sa.Numeric(18, 2)),
+        sa.Column("saldo_final", sa.Numeric(18, 2)),
+    )
+    op.execute(FLAT_VIEW)
+
+
+def downgrade():
+    op.execute("DROP VIEW balance_reports_flat")
+    op.drop_table("fact_balance")
+    op.drop_table("dim_tercero")
+    op.drop_table("dim_cuenta")
@@ -0,0 +1,304 @@
+"""fact_balance pasa a ser la tabla de los reportes; balance_reports_flat la vista plana
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+
+Las filas de balance_reports se mueven a fact_balance (claves de las dimensiones
++ montos) conservando id y created_at, y balance_reports se elimina: ya no se
+guarda cada fila dos veces ni los textos repetidos. En PostgreSQL fact_balance
+queda particionada por LIST (periodo) como lo estaba balance_reports (PK
+(id, periodo), la misma secuencia de id). dim_cuenta / dim_tercero guardan el
+periodo del que sale el nombre (ultimo_periodo): el del periodo más reciente.
+La vista balance_reports_flat devuelve la forma plana anterior, created_at incluido
+(movimiento redondeado a 2 decimales: en SQLite la resta de REAL no es exacta).
+Falla si hay filas sin periodo (no tienen partición ni lugar en fact_balance)
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import text
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+MEASURES = ["saldo_inicial", "movimiento_debito", "movimiento_credito", "saldo_final"]
+
+INDEXES = {
+    "ix_fact_balance_periodo_id": ["periodo", "id"],
+    "ix_fact_balance_cuenta_periodo_id": ["cuenta_id", "periodo", "id"],
+    "ix_fact_balance_tercero_periodo_id": ["tercero_id", "periodo", "id"],
+}
+TERCERO_INDEX = "ix_dim_tercero_identificacion"
+
+FLAT_VIEW = """
+CREATE VIEW balance_reports_flat AS
+SELECT
+    f.id,
+    c.codigo_cuenta_contable,
+    c.nombre_cuenta_contable,
+    c.cod_relacional,
+    NULLIF(t.identificacion, '') AS identificacion,
+    NULLIF(t.sucursal, '') AS sucursal,
+    t.nombre_tercero,
+    f.saldo_inicial,
+    f.movimiento_debito,
+    f.movimiento_credito,
+    ROUND(f.movimiento_debito - f.movimiento_credito, 2) AS movimiento,
+    f.saldo_final,
+    f.fecha,
+    f.año,
+    f.periodo,
+    f.created_at,
+    f.created_at AS updated_at
+FROM fact_balance f
+LEFT JOIN dim_cuenta c ON c.cuenta_id = f.cuenta_id
+JOIN dim_tercero t ON t.tercero_id = f.tercero_id
+"""
+
+# Dimensiones con el nombre de la fila más reciente de cada clave
+UPSERT_CUENTAS = """
+INSERT INTO dim_cuenta (codigo_cuenta_contable, nombre_cuenta_contable, cod_relacional, ultimo_periodo, updated_at)
+SELECT codigo_cuenta_contable, nombre_cuenta_contable, cod_relacional, periodo, CURRENT_TIMESTAMP
+FROM (
+    SELECT codigo_cuenta_contable, nombre_cuenta_contable, cod_relacional, periodo,
+           ROW_NUMBER() OVER (
+               PARTITION BY codigo_cuenta_contable ORDER BY periodo DESC, id DESC
+           ) AS fila
+    FROM balance_reports
+    WHERE codigo_cuenta_contable IS NOT NULL
+) ultimas
+WHERE fila = 1
+ON CONFLICT (codigo_cuenta_contable) DO UPDATE SET
+    nombre_cuenta_contable = excluded.nombre_cuenta_contable,
+    cod_relacional = excluded.cod_relacional,
+    ultimo_periodo = excluded.ultimo_periodo,
+    updated_at = excluded.updated_at
+"""
+
+UPSERT_TERCEROS = """
+INSERT INTO dim_tercero (identificacion, sucursal, nombre_tercero, ultimo_periodo, updated_at)
+SELECT identificacion, sucursal, nombre_tercero, periodo, CURRENT_TIMESTAMP
+FROM (
+    SELECT COALESCE(identificacion, '') AS identificacion, COALESCE(sucursal, '') AS sucursal,
+           nombre_tercero, periodo,
+           ROW_NUMBER() OVER (
+               PARTITION BY COALESCE(identificacion, ''), COALESCE(sucursal, '')
+               ORDER BY periodo DESC, id DESC
+           ) AS fila
+    FROM balance_reports
+) ultimas
+WHERE fila = 1
+ON CONFLICT (identificacion, sucursal) DO UPDATE SET
+    nombre_tercero = excluded.nombre_tercero,
+    ultimo_periodo = excluded.ultimo_periodo,
+    updated_at = excluded.updated_at
+"""
+
+COPY_FACTS = f"""
+INSERT INTO fact_balance_new (id, periodo, año, fecha, cuenta_id, tercero_id, {", ".join(MEASURES)}, created_at)
+SELECT b.id, b.periodo, b.año, b.fecha, c.cuenta_id, t.tercero_id,
+       {", ".join(f"b.{measure}" for measure in MEASURES)}, b.created_at
+FROM balance_reports b
+LEFT JOIN dim_cuenta c ON c.codigo_cuenta_contable = b.codigo_cuenta_contable
+JOIN dim_tercero t ON t.identificacion = COALESCE(b.identificacion, '')
+    AND t.sucursal = COALESCE(b.sucursal, '')
+"""
+
+
+def _fact_columns(partitioned: bool):
+    return [
+        sa.Column("id", sa.Integer, primary_key=not partitioned, nullable=False),
+        sa.Column("periodo", sa.Integer, nullable=False),
+        sa.Column("año", sa.Integer),
+        sa.Column("fecha", sa.Date),
+        sa.Column("cuenta_id", sa.Integer),
+        sa.Column("tercero_id", sa.Integer, nullable=False),
+        *[sa.Column(measure, sa.Numeric(18, 2)) for measure in MEASURES],
+        sa.Column("created_at", sa.DateTime),
+    ]
+
+
+def _create_fact_table(bind, periods):
+    """fact_balance_new vacía (particionada en PostgreSQL, con una partición por periodo)"""
+    partitioned = bind.dialect.name == "postgresql"
+    if partitioned:
+        op.create_table(
+            "fact_balance_new",
+            *_fact_columns(True),
+            sa.PrimaryKeyConstraint("id", "periodo", name="fact_balance_new_pkey"),
+            postgresql_partition_by="LIST (periodo)"
+        )
+        for periodo in periods:
+            op.execute(
+                f'CREATE TABLE "fact_balance_p{int(periodo)}" '
+                f"PARTITION OF fact_balance_new FOR VALUES IN ({int(periodo)})"
+            )
+    else:
+        op.create_table("fact_balance_new", *_fact_columns(False))
+
+
+def upgrade():
+    bind = op.get_bind()
+    missing_period = bind.execute(text("SELECT count(*) FROM balance_reports WHERE periodo IS NULL")).scalar()
+    if missing_period:
+        raise RuntimeError(
+            f"balance_reports tiene {missing_period} filas sin periodo: asígnelo o elimínelas "
+            "antes de migrar (fact_balance requiere periodo)"
+        )
+
+    op.execute("DROP VIEW balance_reports_flat")
+    op.add_column("dim_cuenta", sa.Column("ultimo_periodo", sa.Integer))
+    op.add_column("dim_tercero", sa.Column("ultimo_periodo", sa.Integer))
+    op.execute(UPSERT_CUENTAS)
+    op.execute(UPSERT_TERCEROS)
+
+    periods = bind.execute(text("SELECT DISTINCT periodo FROM balance_reports ORDER BY periodo")).scalars().all()
+    _create_fact_table(bind, periods)
+    op.execute(COPY_FACTS)
+
+    if bind.dialect.name == "postgresql":
+        # La secuencia de id pasa a la tabla nueva: los ids (y los cursores) se conservan
+        sequence = bind.execute(text("SELECT pg_get_serial_sequence('balance_reports', 'id')")).scalar()
+        if sequence:
+            op.execute(f"ALTER SEQUENCE {sequence} OWNED BY fact_balance_new.id")
+            op.execute(f"ALTER TABLE fact_balance_new ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+            op.execute(f"ALTER SEQUENCE {sequence} RENAME TO fact_balance_id_seq")
+        else:
+            op.execute("CREATE SEQUENCE fact_balance_id_seq OWNED BY fact_balance_new.id")
+            op.execute("SELECT setval('fact_balance_id_seq', COALESCE((SELECT max(id) FROM fact_balance_new), 0) + 1, false)")
+            op.execute("ALTER TABLE fact_balance_new ALTER COLUMN id SET DEFAULT nextval('fact_balance_id_seq')")
+
+    op.drop_table("fact_balance")
+    op.drop_table("balance_reports")
+    op.rename_table("fact_balance_new", "fact_balance")
+    if bind.dialect.name == "postgresql":
+        op.execute("ALTER TABLE fact_balance RENAME CONSTRAINT fact_balance_new_pkey TO fact_balance_pkey")
+    for name, columns in INDEXES.items():
+        op.create_index(name, "fact_balance", columns)
+    # Filtros de Power BI por dimensión: la vista expone NULLIF(identificacion, ''),
+    # el índice de expresión es el que permite resolverlo sin recorrer dim_tercero
+    op.create_index("ix_dim_cuenta_cod_relacional", "dim_cuenta", ["cod_relacional"])
+    op.execute(f"CREATE INDEX {TERCERO_INDEX} ON dim_tercero (NULLIF(identificacion, ''))")
+    op.execute(FLAT_VIEW)
+
+
+# ---------- downgrade: vuelve a balance_reports + fact_balance de 0007 ----------
+
+OLD_FLAT_VIEW = """
+CREATE VIEW balance_reports_flat AS
+SELECT
+    f.balance_id AS id,
+    c.codigo_cuenta_contable,
+    c.nombre_cuenta_contable,
+    c.cod_relacional,
+    NULLIF(t.identificacion, '') AS identificacion,
+    NULLIF(t.sucursal, '') AS sucursal,
+    t.nombre_tercero,
+    f.saldo_inicial,
+    f.movimiento_debito,
+    f.movimiento_credito,
+    f.movimiento_debito - f.movimiento_credito AS movimiento,
+    f.saldo_final,
+    f.fecha,
+    f.año,
+    f.periodo,
+    CAST(NULL AS TIMESTAMP) AS created_at
+FROM fact_balance f
+LEFT JOIN dim_cuenta c ON c.cuenta_id = f.cuenta_id
+JOIN dim_tercero t ON t.tercero_id = f.tercero_id
+"""
+
+WIDE_COLUMNS = [
+    "id", "codigo_cuenta_contable", "nombre_cuenta_contable", "cod_relacional",
+    "identificacion", "sucursal", "nombre_tercero",
+    "saldo_inicial", "movimiento_debito", "movimiento_credito", "movimiento", "saldo_final",
+    "fecha", "año", "periodo", "created_at", "updated_at",
+]
+
+OLD_INDEXES = {
+    "ix_balance_reports_id": ["id"],
+    "ix_balance_reports_fecha": ["fecha"],
+    "ix_balance_reports_periodo_id": ["periodo", "id"],
+    "ix_balance_reports_cuenta_periodo_id": ["codigo_cuenta_contable", "periodo", "id"],
+    "ix_balance_reports_cod_relacional_periodo_id": ["cod_relacional", "periodo", "id"],
+    "ix_balance_reports_identificacion_periodo_id": ["identificacion", "periodo", "id"],
+}
+
+
+def _wide_columns(partitioned: bool):
+    return [
+        sa.Column("id", sa.Integer, primary_key=not partitioned, nullable=False),
+        sa.Column("codigo_cuenta_contable", sa.Integer),
+        sa.Column("nombre_cuenta_contable", sa.Text),
+        sa.Column("cod_relacional", sa.String(10)),
+        sa.Column("identificacion", sa.String(50)),
+        sa.Column("sucursal", sa.String(100)),
+        sa.Column("nombre_tercero", sa.Text),
+        *[sa.Column(measure, sa.Numeric(18, 2)) for measure in [*MEASURES[:3], "movimiento", MEASURES[3]]],
+        sa.Column("fecha", sa.Date),
+        sa.Column("año", sa.Integer),
+        sa.Column("periodo", sa.Integer, nullable=not partitioned),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("updated_at", sa.DateTime),
+    ]
+
+
+def downgrade():
+    bind = op.get_bind()
+    partitioned = bind.dialect.name == "postgresql"
+    periods = bind.execute(text("SELECT DISTINCT periodo FROM fact_balance ORDER BY periodo")).scalars().all()
+
+    if partitioned:
+        op.create_table(
+            "balance_reports",
+            *_wide_columns(True),
+            sa.PrimaryKeyConstraint("id", "periodo", name="balance_reports_pkey"),
+            postgresql_partition_by="LIST (periodo)"
+        )
+        for periodo in periods:
+            op.execute(
+                f'CREATE TABLE "balance_reports_p{int(periodo)}" '
+                f"PARTITION OF balance_reports FOR VALUES IN ({int(periodo)})"
+            )
+    else:
+        op.create_table("balance_reports", *_wide_columns(False))
+    columns = ", ".join(WIDE_COLUMNS)
+    op.execute(f"INSERT INTO balance_reports ({columns}) SELECT {columns} FROM balance_reports_flat")
+    op.execute("DROP VIEW balance_reports_flat")
+
+    if partitioned:
+        op.execute("ALTER SEQUENCE fact_balance_id_seq OWNED BY balance_reports.id")
+        op.execute("ALTER TABLE balance_reports ALTER COLUMN id SET DEFAULT nextval('fact_balance_id_seq')")
+        op.execute("ALTER SEQUENCE fact_balance_id_seq RENAME TO balance_reports_id_seq")
+    for name, index_columns in OLD_INDEXES.items():
+        op.create_index(name, "balance_reports", index_columns)
+
+    # fact_balance de 0007: copia de balance_reports con las claves de las dimensiones
+    op.create_table(
+        "fact_balance_old",
+        sa.Column("periodo", sa.Integer, primary_key=True),
+        sa.Column("balance_id", sa.Integer, primary_key=True),
+        sa.Column("año", sa.Integer, nullable=False),
+        sa.Column("fecha", sa.Date),
+        sa.Column("cuenta_id", sa.Integer),
+        sa.Column("tercero_id", sa.Integer, nullable=False),
+        *[sa.Column(measure, sa.Numeric(18, 2)) for measure in MEASURES],
+    )
+    op.execute(
+        "INSERT INTO fact_balance_old (periodo, balance_id, año, fecha, cuenta_id, tercero_id, "
+        f"{', '.join(MEASURES)}) SELECT periodo, id, año, fecha, cuenta_id, tercero_id, "
+        f"{', '.join(MEASURES)} FROM fact_balance WHERE año IS NOT NULL"
+    )
+    op.drop_table("fact_balance")
+    op.rename_table("fact_balance_old", "fact_balance")
+
+    op.drop_index(TERCERO_INDEX, table_name="dim_tercero")
+    op.drop_index("ix_dim_cuenta_cod_relacional", table_name="dim_cuenta")
+    # Antes de la vista: en SQLite batch_alter_table recrea las tablas de las dimensiones
+    with op.batch_alter_table("dim_tercero") as batch:
+        batch.drop_column("ultimo_periodo")
+    with op.batch_alter_table("dim_cuenta") as batch:
+        batch.drop_column("ultimo_periodo")
+    op.execute(OLD_FLAT_VIEW)
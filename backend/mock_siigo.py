@@ -0,0 +1,252 @@
+"""
+Servidor local que imita la API de Siigo para benchmarks y pruebas del ETL
+Implementa POST /auth, POST /v1/test-balance-report-by-thirdparty y la descarga
+del Excel (GET /files/<año>-<mes>.xlsx), con latencia, respuestas 429 y fallos
+configurables. Los libros siguen el formato del reporte "balance por tercero"
+
+Uso independiente (el backend real apuntando a él con SIIGO_BASE_URL):
+    python mock_siigo.py --port 8100 --rows 20000 --latency 0.2 --rate-429 0.05
+"""
+import argparse
+import io
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+import numpy as np
+from openpyxl import Workbook
+
+
+SIIGO_HEADER = [
+    "Nivel", "Transaccional", "Código cuenta contable", "Nombre Cuenta contable",
+    "Identificación", "Sucursal", "Nombre tercero",
+    "Saldo Inicial", "Movimiento Débito", "Movimiento Crédito", "Saldo final"
+]
+
+
+def synthetic_workbook(rows: int, year: int = 2024, month: int = 3, seed: int = 0,
+                       rollup_every: int = 10) -> bytes:
+    """
+    Libro con el formato del reporte "balance por tercero" de Siigo:
+    preámbulo, fila de encabezado (Nivel/Transaccional) y filas transaccionales
+    intercaladas con filas de totales (Clase/Grupo/Cuenta) no transaccionales
+    """
+    rng = np.random.default_rng(seed)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Balance por tercero")
+
+    sheet.append(["EMPRESA DE PRUEBA S.A.S."])
+    sheet.append(["Balance de prueba por tercero"])
+    sheet.append([f"Periodo: {year}-{month:02d}"])
+    sheet.append([])
+    sheet.append(SIIGO_HEADER)
+
+    cuenta = 11050500
+    for i in range(rows):
+        if i % rollup_every == 0:
+            cuenta = int(rng.integers(1105, 2815)) * 10000 + int(rng.integers(0, 100)) * 100
+            total = float(rng.uniform(-1e9, 1e9))
+            sheet.append(["Grupo", "No", cuenta // 10000, f"Grupo {cuenta // 10000}", None, None, None,
+                          total, 0.0, 0.0, total])
+            sheet.append(["Cuenta", "No", cuenta // 100, f"Cuenta {cuenta // 100}", None, None, None,
+                          total, 0.0, 0.0, total])
+        debito = round(float(rng.uniform(0, 1e7)), 2)
+        credito = round(float(rng.uniform(0, 1e7)), 2)
+        inicial = round(float(rng.uniform(-1e8, 1e8)), 2)
+        sheet.append([
+            "Auxiliar", "Sí", cuenta + int(rng.integers(1, 99)), f"Auxiliar {cuenta % 997}",
+            int(rng.integers(800000000, 999999999)), int(rng.integers(0, 5)), f"Tercero {i % 5003}",
+            inicial, debito, credito, round(inicial + debito - credito, 2)
+        ])
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+@dataclass
+class MockSiigoConfig:
+    rows: int = 5000  # filas transaccionales por libro
+    latency: float = 0.0  # segundos agregados a cada respuesta
+    rate_429: float = 0.0  # probabilidad de 429 en la solicitud del reporte
+    failure_rate: float = 0.0  # probabilidad de 500 en el reporte y en la descarga
+    retry_after: int = 1  # encabezado Retry-After de los 429
+    token_ttl: int = 86400  # expires_in de /auth
+    distinct_workbooks: bool = False  # un libro generado por periodo (lento) o uno compartido
+    seed: int = 0
+
+
+class _MockSiigoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _reply(self, status: int, body: bytes, content_type: str = "application/json",
+               headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, payload: dict, headers: Optional[Dict[str, str]] = None):
+        self._reply(status, json.dumps(payload).encode(), headers=headers)
+
+    def do_POST(self):
+        mock: MockSiigoServer = self.server.mock
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        mock.wait()
+
+        if self.path == "/auth":
+            mock.count("auth")
+            credentials = json.loads(body or b"{}")
+            if not credentials.get("username") or not credentials.get("access_key"):
+                self._json(400, {"Errors": [{"Code": "invalid_request", "Message": "Credenciales incompletas"}]})
+                return
+            self._json(200, {"access_token": mock.token, "expires_in": mock.config.token_ttl})
+            return
+
+        if self.path == "/v1/test-balance-report-by-thirdparty":
+            mock.count("report")
+            if self.headers.get("Authorization") != f"Bearer {mock.token}":
+                mock.count("401")
+                self._json(401, {"Errors": [{"Code": "unauthorized", "Message": "Token inválido"}]})
+                return
+            if mock.roll(mock.config.rate_429):
+                mock.count("429")
+                self._json(
+                    429,
+                    {"Errors": [{"Code": "too_many_requests", "Message": "Rate limit exceeded"}]},
+                    headers={"Retry-After": str(mock.config.retry_after)}
+                )
+                return
+            if mock.roll(mock.config.failure_rate):
+                mock.count("500")
+                self._json(500, {"Errors": [{"Code": "internal_error", "Message": "Falla simulada"}]})
+                return
+            request = json.loads(body or b"{}")
+            year, month = int(request["year"]), int(request["month_start"])
+            file_id = f"{year}-{month:02d}"
+            self._json(200, {"file_id": file_id, "file_url": f"{mock.url}/files/{file_id}.xlsx"})
+            return
+
+        self._json(404, {"Errors": [{"Code": "not_found", "Message": self.path}]})
+
+    def do_GET(self):
+        mock: MockSiigoServer = self.server.mock
+        match = re.fullmatch(r"/files/(\d{4})-(\d{2})\.xlsx", self.path)
+        if match is None:
+            self._json(404, {"Errors": [{"Code": "not_found", "Message": self.path}]})
+            return
+        mock.wait()
+        mock.count("download")
+        if mock.roll(mock.config.failure_rate):
+            mock.count("500")
+            self._json(500, {"Errors": [{"Code": "internal_error", "Message": "Falla simulada"}]})
+            return
+        content = mock.workbook(int(match.group(1)), int(match.group(2)))
+        self._reply(
+            200, content,
+            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockSiigoServer:
+    """Servidor HTTP en un hilo; url apunta a la raíz (equivalente a SIIGO_BASE_URL)"""
+
+    def __init__(self, config: Optional[MockSiigoConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or MockSiigoConfig()
+        self.token = "mock-token"
+        self._httpd = ThreadingHTTPServer((host, port), _MockSiigoHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.mock = self
+        self._thread: Optional[threading.Thread] = None
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._workbooks: Dict[Tuple[int, int], bytes] = {}
+        self.counters: Dict[str, int] = {}
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockSiigoServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """Atiende en el hilo actual (uso independiente)"""
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def count(self, name: str):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def roll(self, probability: float) -> bool:
+        if probability <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < probability
+
+    def wait(self):
+        if self.config.latency > 0:
+            time.sleep(self.config.latency)
+
+    def workbook(self, year: int, month: int) -> bytes:
+        """Libro del periodo (se genera una vez; compartido si distinct_workbooks es False)"""
+        key = (year, month) if self.config.distinct_workbooks else (0, 0)
+        with self._lock:
+            content = self._workbooks.get(key)
+            if content is None:
+                content = synthetic_workbook(
+                    self.config.rows, year or 2024, month or 1, seed=self.config.seed + month
+                )
+                self._workbooks[key] = content
+        return content
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que imita la API de Siigo")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--rows", type=int, default=5000, help="Filas transaccionales por libro")
+    parser.add_argument("--latency", type=float, default=0.0, help="Segundos por respuesta")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Probabilidad de 429 en el reporte")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Probabilidad de 500")
+    parser.add_argument("--distinct-workbooks", action="store_true", help="Un libro distinto por periodo")
+    args = parser.parse_args()
+
+    server = MockSiigoServer(
+        MockSiigoConfig(
+            rows=args.rows,
+            latency=args.latency,
+            rate_429=args.rate_429,
+            failure_rate=args.failure_rate,
+            distinct_workbooks=args.distinct_workbooks,
+        ),
+        host=args.host,
+        port=args.port,
+    )
+    print(f"Mock de Siigo en {server.url} (SIIGO_BASE_URL={server.url})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 
 
 class BalanceReportRequest(BaseModel):
@@ -37,6 +37,8 @@ class ETLProcessRequest(BaseModel):
     account_end: Optional[str] = Field(None, description="Código de cuenta final (opcional)")
     includes_tax_diff: bool = Field(False, description="Incluir diferencia de impuestos")
     clear_existing: bool = Field(True, description="Eliminar datos existentes antes de insertar")
+    force: bool = Field(False, description="Recargar aunque el Excel descargado no haya cambiado")
+    replay: bool = Field(False, description="Reprocesar con los Excel de la caché local, sin llamar a Siigo (implica force)")
 
 
 class ETLPreviousYearRequest(BaseModel):
@@ -46,6 +48,8 @@ class ETLPreviousYearRequest(BaseModel):
     account_end: Optional[str] = Field(None, description="Código de cuenta final (opcional)")
     includes_tax_diff: bool = Field(False, description="Incluir diferencia de impuestos")
     clear_existing: bool = Field(True, description="Eliminar datos existentes antes de insertar")
+    force: bool = Field(False, description="Recargar aunque el Excel descargado no haya cambiado")
+    replay: bool = Field(False, description="Reprocesar con los Excel de la caché local, sin llamar a Siigo (implica force)")
 
 
 class PowerBIQueryParams(BaseModel):
@@ -67,3 +71,32 @@ class ETLProcessDateRangeRequest(BaseModel):
     account_end: Optional[str] = Field(None, description="Código de cuenta final (opcional)")
     includes_tax_diff: bool = Field(False, description="Incluir diferencia de impuestos")
     clear_existing: bool = Field(True, description="Eliminar datos existentes antes de insertar")
+    force: bool = Field(False, description="Recargar aunque el Excel descargado no haya cambiado")
+    replay: bool = Field(False, description="Reprocesar con los Excel de la caché local, sin llamar a Siigo (implica force)")
+
+
+class BalanceKeyRequest(BaseModel):
+    """Clave de la línea de tiempo de saldos"""
+    codigo_cuenta_contable: int = Field(..., description="Código de cuenta contable")
+    identificacion: Optional[str] = Field("", description="Identificación del tercero ('' o null = sin tercero)")
+    sucursal: Optional[str] = Field(None, description="Sucursal (null = todas las sucursales de la cuenta y tercero)")
+
+
+class BalanceAtDateRequest(BaseModel):
+    """Request para consultar saldos a una fecha (o entre dos fechas) de muchas claves"""
+    fecha_fin: str = Field(..., description="Saldo a esta fecha, formato YYYY-MM-DD (granularidad mensual)")
+    fecha_inicio: Optional[str] = Field(None, description="Con fecha de inicio: saldo de apertura y movimientos del rango")
+    include_closing: bool = Field(False, description="Si fecha_fin cae en diciembre, incluir el periodo de cierre (13)")
+    keys: List[BalanceKeyRequest] = Field(..., min_length=1, max_length=10000, description="Claves a consultar")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "fecha_inicio": "2024-01-01",
+                "fecha_fin": "2024-06-30",
+                "include_closing": False,
+                "keys": [
+                    {"codigo_cuenta_contable": 13050501, "identificacion": "900123456", "sucursal": None}
+                ]
+            }
+        }
@@ -0,0 +1,88 @@
+"""
+Pool de procesos para el parseo de Excel
+process_excel y la preparación de filas para BulkLoader son CPU-bound; ejecutarlos
+en otros procesos mantiene libre el event loop de uvicorn y permite parsear varios
+periodos en núcleos distintos
+"""
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+import pandas as pd
+from config import get_settings
+from excel_processor import ExcelProcessor
+from bulk_loader import BulkLoader
+from metrics import EXCEL_PARSE_SECONDS, record_parse_stats
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def parse_for_load(excel_content: bytes, year: int, month: int) -> Tuple[pd.DataFrame, dict]:
+    """
+    Trabajo del proceso hijo: parsear el Excel y dejar las filas listas para BulkLoader
+    El DataFrame vuelve al proceso padre serializado por bloques numpy (pickle), junto
+    con los tiempos por etapa: las métricas se registran en el padre
+    """
+    stats = {}
+    df = ExcelProcessor.process_excel(excel_content, year, month, stats=stats)
+    started = time.perf_counter()
+    frame = BulkLoader.prepare_frame(df)
+    stats["prepare"] = time.perf_counter() - started
+    return frame, stats
+
+
+def get_parse_executor() -> Optional[ProcessPoolExecutor]:
+    """
+    Pool del proceso (se crea la primera vez); None si EXCEL_PARSE_WORKERS = 0
+    Se usa 'spawn' para no heredar conexiones ni hilos del servidor
+    """
+    global _executor
+
+    workers = get_settings().excel_parse_workers
+    if workers <= 0:
+        return None
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _executor
+
+
+def shutdown_parse_executor(wait: bool = False):
+    """Detiene los procesos del pool (apagado de la aplicación); wait=True espera a que terminen"""
+    global _executor
+
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait, cancel_futures=True)
+        _executor = None
+
+
+async def parse_excel_in_pool(excel_content: bytes, year: int, month: int) -> pd.DataFrame:
+    """Parsea y prepara un periodo fuera del event loop"""
+    executor = get_parse_executor()
+    started = time.perf_counter()
+    if executor is None:
+        frame, stats = await asyncio.to_thread(parse_for_load, excel_content, year, month)
+    else:
+        loop = asyncio.get_running_loop()
+        try:
+            frame, stats = await loop.run_in_executor(executor, parse_for_load, excel_content, year, month)
+        except BrokenProcessPool:
+            # Un hijo murió (ej: sin memoria): descartar el pool para que el próximo periodo cree otro
+            shutdown_parse_executor()
+            raise
+
+    record_parse_stats(stats)
+    # total incluye la espera por un proceso libre y el paso del DataFrame entre procesos
+    EXCEL_PARSE_SECONDS.labels(stage="total").observe(time.perf_counter() - started)
+    return frame
@@ -0,0 +1,141 @@
+"""
+Particiones de fact_balance por periodo (solo PostgreSQL)
+La migración 0008 deja la tabla de hechos particionada por LIST (periodo) con
+una partición por periodo (fact_balance_pAAAAMM), como lo estaba balance_reports
+desde la 0003; en SQLite (y en PostgreSQL sin particionar) estas funciones no hacen nada
+
+Recarga atómica: los hechos del periodo se insertan en una tabla staging con la
+misma estructura, índices y un CHECK (periodo = X); luego una transacción corta
+desvincula la partición anterior y adjunta la staging en su lugar
+"""
+import uuid
+from typing import Iterable, List, Set
+from sqlalchemy import text
+from database import FactBalance
+
+PARENT_TABLE = "fact_balance"
+
+# Espera máxima por el bloqueo de la tabla padre durante el swap; si una lectura
+# larga lo impide, el periodo falla y conserva sus datos anteriores
+SWAP_LOCK_TIMEOUT = "30s"
+
+
+def partition_name(periodo: int) -> str:
+    return f"{PARENT_TABLE}_p{int(periodo)}"
+
+
+def is_partitioned(connection) -> bool:
+    """True si fact_balance es una tabla particionada de PostgreSQL"""
+    if connection.dialect.name != "postgresql":
+        return False
+    relkind = connection.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"),
+        {"table": PARENT_TABLE}
+    ).scalar()
+    return relkind == "p"
+
+
+def existing_partitions(connection) -> Set[str]:
+    rows = connection.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(:table)"
+        ),
+        {"table": PARENT_TABLE}
+    )
+    return {row[0] for row in rows}
+
+
+def _normalize(periods: Iterable[int]) -> List[int]:
+    return sorted({int(p) for p in periods if p is not None})
+
+
+def ensure_partitions(connection, periods: Iterable[int]) -> List[int]:
+    """Crea las particiones que falten; retorna los periodos creados"""
+    if not is_partitioned(connection):
+        return []
+    existing = existing_partitions(connection)
+    created = []
+    for periodo in _normalize(periods):
+        name = partition_name(periodo)
+        if name in existing:
+            continue
+        connection.execute(text(
+            f'CREATE TABLE IF NOT EXISTS "{name}" '
+            f'PARTITION OF {PARENT_TABLE} FOR VALUES IN ({periodo})'
+        ))
+        created.append(periodo)
+    return created
+
+
+def prepare_partitions(engine, periods: Iterable[int]) -> List[int]:
+    """
+    ensure_partitions en una transacción corta y propia
+    CREATE TABLE ... PARTITION OF bloquea la tabla padre: no debe quedar dentro
+    de la transacción larga de una carga
+    """
+    if engine.dialect.name != "postgresql":
+        return []
+    with engine.begin() as connection:
+        return ensure_partitions(connection, periods)
+
+
+def create_staging(connection, periodo: int) -> str:
+    """Tabla staging vacía con las columnas y valores por defecto de fact_balance (id de la secuencia)"""
+    name = f"{PARENT_TABLE}_stg_{int(periodo)}_{uuid.uuid4().hex[:8]}"
+    connection.execute(text(f'CREATE TABLE "{name}" (LIKE {PARENT_TABLE} INCLUDING DEFAULTS)'))
+    return name
+
+
+def finalize_staging(connection, name: str, periodo: int, expected_rows: int):
+    """
+    Valida la staging y le crea PK, CHECK e índices antes del swap
+    Con ellos, ATTACH PARTITION no recorre la tabla ni construye índices
+    mientras tiene bloqueada la tabla padre
+    """
+    loaded = connection.execute(text(f'SELECT count(*) FROM "{name}"')).scalar()
+    if loaded != expected_rows:
+        raise Exception(f"Staging {name}: {loaded} filas, se esperaban {expected_rows}")
+
+    connection.execute(text(
+        f'ALTER TABLE "{name}" ADD CONSTRAINT "{name}_periodo_check" CHECK (periodo = {int(periodo)})'
+    ))
+    connection.execute(text(
+        f'ALTER TABLE "{name}" ADD CONSTRAINT "{name}_pkey" PRIMARY KEY (id, periodo)'
+    ))
+    for suffix, columns in _index_suffixes().items():
+        column_list = ", ".join(f'"{column}"' for column in columns)
+        connection.execute(text(f'CREATE INDEX "{name}_{suffix}" ON "{name}" ({column_list})'))
+    connection.execute(text(f'ANALYZE "{name}"'))
+
+
+def _index_suffixes() -> dict:
+    """Índices del modelo como {sufijo: columnas} (ix_fact_balance_periodo_id -> periodo_id)"""
+    prefix = f"ix_{PARENT_TABLE}_"
+    return {
+        index.name.removeprefix(prefix): [column.name for column in index.columns]
+        for index in FactBalance.__table__.indexes
+    }
+
+
+def swap_partition(connection, periodo: int, staging: str):
+    """
+    Reemplaza la partición del periodo por la staging (dentro de la transacción
+    del llamador, que debe ser corta: DETACH bloquea la tabla padre)
+    """
+    name = partition_name(periodo)
+    connection.execute(text(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'"))
+    if name in existing_partitions(connection):
+        connection.execute(text(f'ALTER TABLE {PARENT_TABLE} DETACH PARTITION "{name}"'))
+        connection.execute(text(f'DROP TABLE "{name}"'))
+    connection.execute(text(f'ALTER TABLE "{staging}" RENAME TO "{name}"'))
+    for suffix in [*_index_suffixes(), "pkey"]:
+        connection.execute(text(f'ALTER INDEX "{staging}_{suffix}" RENAME TO "{name}_{suffix}"'))
+    connection.execute(text(
+        f'ALTER TABLE {PARENT_TABLE} ATTACH PARTITION "{name}" FOR VALUES IN ({int(periodo)})'
+    ))
+
+
+def drop_table(connection, name: str):
+    connection.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
@@ -0,0 +1,96 @@
+"""
+Registro de cargas por periodo (tabla etl_period_runs)
+Si el Excel recién descargado tiene el mismo hash que la última carga del mismo
+periodo y parámetros, y los datos siguen en la base, el ETL omite el parseo y
+las escrituras de ese periodo
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import and_, select
+from sqlalchemy.orm import Session
+from database import BalancePeriodSummary, EtlPeriodRun, upsert
+
+
+@dataclass(frozen=True)
+class PeriodRunKey:
+    """Parámetros del reporte de Siigo que identifican una carga"""
+    year: int
+    month: int
+    account_start: str = ""
+    account_end: str = ""
+    includes_tax_diff: bool = False
+
+    @classmethod
+    def build(
+        cls,
+        year: int,
+        month: int,
+        account_start: Optional[str],
+        account_end: Optional[str],
+        includes_tax_diff: bool
+    ) -> "PeriodRunKey":
+        return cls(
+            year=year,
+            month=month,
+            account_start=(account_start or "").strip(),
+            account_end=(account_end or "").strip(),
+            includes_tax_diff=bool(includes_tax_diff)
+        )
+
+    @property
+    def periodo(self) -> int:
+        return self.year * 100 + self.month
+
+    def _where(self):
+        return and_(
+            EtlPeriodRun.year == self.year,
+            EtlPeriodRun.month == self.month,
+            EtlPeriodRun.account_start == self.account_start,
+            EtlPeriodRun.account_end == self.account_end,
+            EtlPeriodRun.includes_tax_diff == self.includes_tax_diff,
+        )
+
+
+def is_unchanged(db: Session, key: PeriodRunKey, content_hash: str) -> bool:
+    """
+    True si la última carga registrada tiene el mismo hash y el periodo aún
+    tiene esas filas (el resumen por periodo coincide con row_count)
+    """
+    run = db.execute(
+        select(EtlPeriodRun.content_hash, EtlPeriodRun.row_count).where(key._where())
+    ).first()
+    if run is None or run.content_hash != content_hash:
+        return False
+
+    loaded_rows = db.execute(
+        select(BalancePeriodSummary.row_count).where(
+            BalancePeriodSummary.año == key.year,
+            BalancePeriodSummary.periodo == key.periodo
+        )
+    ).scalar() or 0
+    return loaded_rows == run.row_count
+
+
+def record_period_run(db: Session, key: PeriodRunKey, content_hash: str, row_count: int):
+    """
+    Guarda (o actualiza) la carga del periodo; sin commit
+    INSERT ... ON CONFLICT sobre uq_etl_period_runs_key: dos cargas concurrentes
+    de la misma clave no fallan por la restricción única
+    """
+    values = {"content_hash": content_hash, "row_count": row_count, "loaded_at": datetime.utcnow()}
+    statement = upsert(db, EtlPeriodRun).values(
+        year=key.year,
+        month=key.month,
+        account_start=key.account_start,
+        account_end=key.account_end,
+        includes_tax_diff=key.includes_tax_diff,
+        **values
+    )
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[
+            EtlPeriodRun.year, EtlPeriodRun.month, EtlPeriodRun.account_start,
+            EtlPeriodRun.account_end, EtlPeriodRun.includes_tax_diff
+        ],
+        set_=values
+    ))
@@ -0,0 +1,72 @@
+"""
+Planificador de periodos del ETL
+Mantiene N periodos en vuelo (semáforo acotado) y limita las llamadas a Siigo
+con un token bucket, conservando el orden de los resultados
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, List, Optional, Sequence, Tuple
+
+
+Period = Tuple[int, int]  # (año, mes)
+
+
+class TokenBucket:
+    """
+    Limitador token bucket para asyncio
+    rate: tokens por segundo; capacity: ráfaga máxima permitida
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        if rate <= 0:
+            raise ValueError("rate debe ser mayor que 0")
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self):
+        """Espera hasta que haya un token disponible y lo consume"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class PeriodScheduler:
+    """Ejecuta un worker por periodo con concurrencia acotada"""
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max(1, max_concurrency)
+
+    async def run(
+        self,
+        periods: Sequence[Period],
+        worker: Callable[[int, int], Awaitable[Any]],
+        concurrency: Optional[int] = None
+    ) -> List[Tuple[Period, Any]]:
+        """
+        Procesa todos los periodos y retorna [(periodo, resultado)] en el orden de entrada
+        Si un periodo falla, su resultado es la excepción (no cancela los demás)
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency or self.max_concurrency))
+
+        async def run_one(period: Period):
+            async with semaphore:
+                year, month = period
+                return await worker(year, month)
+
+        outcomes = await asyncio.gather(
+            *(run_one(period) for period in periods),
+            return_exceptions=True
+        )
+        return list(zip(periods, outcomes))
@@ -0,0 +1,107 @@
+"""
+Mantenimiento del resumen por periodo (balance_period_summary)
+Cada vez que el ETL reemplaza o inserta un periodo se recalculan solo sus filas,
+así /api/powerbi/stats responde en O(periodos) en lugar de recorrer fact_balance
+"""
+from typing import Iterable, List, Optional
+from sqlalchemy import column, delete, func, insert, select, table
+from sqlalchemy.orm import Session
+from database import BalancePeriodSummary, BalanceReport, FactBalance
+
+SUMMARY_MEASURES = [
+    "saldo_inicial",
+    "movimiento_debito",
+    "movimiento_credito",
+    "movimiento",
+    "saldo_final",
+]
+
+
+def _aggregate_select(periods: Optional[List[int]] = None, source=None):
+    """
+    GROUP BY (año, periodo) de la vista balance_reports_flat (o de una tabla de
+    aterrizaje) con conteo y sumas
+    """
+    columns = (source if source is not None else BalanceReport.__table__).c
+    statement = select(
+        columns["año"],
+        columns["periodo"],
+        func.count(),
+        *[func.sum(columns[measure]) for measure in SUMMARY_MEASURES],
+        func.current_timestamp(),
+    ).where(
+        columns["año"].is_not(None),
+        columns["periodo"].is_not(None)
+    ).group_by(columns["año"], columns["periodo"])
+    if periods is not None:
+        statement = statement.where(columns["periodo"].in_(periods))
+    return statement
+
+
+SUMMARY_COLUMNS = ["año", "periodo", "row_count", *SUMMARY_MEASURES, "updated_at"]
+
+
+def _insert_from_select(periods: Optional[List[int]] = None):
+    return insert(BalancePeriodSummary).from_select(SUMMARY_COLUMNS, _aggregate_select(periods))
+
+
+def refresh_periods(db: Session, periods: Iterable[int]):
+    """
+    Recalcula el resumen de los periodos indicados (sin commit)
+    Debe ejecutarse en la transacción que modificó esos periodos
+    """
+    periods = sorted({int(p) for p in periods if p is not None})
+    if not periods:
+        return
+    db.execute(delete(BalancePeriodSummary).where(BalancePeriodSummary.periodo.in_(periods)))
+    db.execute(_insert_from_select(periods))
+
+
+def compute_periods(db: Session, periods: Iterable[int], source_table: str) -> List[dict]:
+    """
+    Calcula el resumen desde la tabla de aterrizaje antes del swap, para que la
+    transacción del swap solo escriba los valores ya agregados
+    """
+    periods = sorted({int(p) for p in periods if p is not None})
+    source = table(source_table, *[column(name) for name in ["año", "periodo", *SUMMARY_MEASURES]])
+    rows = db.execute(_aggregate_select(periods, source)).all()
+    return [dict(zip(SUMMARY_COLUMNS, row)) for row in rows]
+
+
+def replace_periods(db: Session, periods: Iterable[int], rows: List[dict]):
+    """Reemplaza el resumen de los periodos con filas calculadas por compute_periods (sin commit)"""
+    periods = sorted({int(p) for p in periods if p is not None})
+    if periods:
+        db.execute(delete(BalancePeriodSummary).where(BalancePeriodSummary.periodo.in_(periods)))
+    if rows:
+        db.execute(insert(BalancePeriodSummary), rows)
+
+
+def backfill_period_summary(engine):
+    """Construye el resumen completo si está vacío y fact_balance ya tiene datos"""
+    with engine.begin() as connection:
+        if connection.execute(select(BalancePeriodSummary.periodo).limit(1)).first() is not None:
+            return
+        # Se consulta fact_balance y no la vista: sin los joins de las dimensiones
+        if connection.execute(select(FactBalance.id).limit(1)).first() is None:
+            return
+        connection.execute(_insert_from_select())
+
+
+def summary_stats(db: Session, año: Optional[int] = None) -> dict:
+    """Estadísticas de /api/powerbi/stats leídas del resumen"""
+    totals = select(
+        func.coalesce(func.sum(BalancePeriodSummary.row_count), 0),
+        func.coalesce(func.sum(BalancePeriodSummary.saldo_final), 0),
+    )
+    if año is not None:
+        totals = totals.where(BalancePeriodSummary.año == año)
+    total_records, total_saldo_final = db.execute(totals).one()
+
+    rows = db.execute(select(BalancePeriodSummary.año, BalancePeriodSummary.periodo)).all()
+    return {
+        "total_records": int(total_records),
+        "total_saldo_final": float(total_saldo_final),
+        "years": sorted({row.año for row in rows if row.año is not None}),
+        "periods": sorted(row.periodo for row in rows),
+    }
@@ -0,0 +1,104 @@
+"""
+Agregaciones de balance_reports en la base para Power BI (GROUP BY)
+En lugar de descargar millones de filas y sumarlas en el cliente, el endpoint
+/api/powerbi/balance-reports/aggregate devuelve solo los totales por grupo
+"""
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import func, select
+from database import BalanceReport
+from period_summary import SUMMARY_MEASURES
+
+# Dimensiones permitidas en group_by (en este orden se ordenan los grupos)
+GROUP_BY_DIMENSIONS = [
+    "año",
+    "periodo",
+    "codigo_cuenta_contable",
+    "cod_relacional",
+    "identificacion",
+]
+
+AGGREGATE_FUNCTIONS = {
+    "sum": func.sum,
+    "count": func.count,
+    "min": func.min,
+    "max": func.max,
+}
+
+DEFAULT_MEASURES = [("sum", measure) for measure in SUMMARY_MEASURES]
+
+
+def parse_group_by(value: Optional[str]) -> List[str]:
+    """'periodo,codigo_cuenta_contable' -> dimensiones válidas sin repetir (ValueError si no)"""
+    dimensions = []
+    for name in (value or "").split(","):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in GROUP_BY_DIMENSIONS:
+            raise ValueError(
+                f"Dimensión no permitida: {name} (use {', '.join(GROUP_BY_DIMENSIONS)})"
+            )
+        if name not in dimensions:
+            dimensions.append(name)
+    return dimensions
+
+
+def parse_measures(value: Optional[str]) -> List[Tuple[str, str]]:
+    """
+    'sum:saldo_final,max:movimiento' -> [(función, columna)] (ValueError si no es válida)
+    Sin valor: suma de las cinco columnas de montos
+    """
+    if not value:
+        return list(DEFAULT_MEASURES)
+
+    measures = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        function, _, measure = item.partition(":")
+        if function not in AGGREGATE_FUNCTIONS or measure not in SUMMARY_MEASURES:
+            raise ValueError(
+                f"Medida inválida: {item} (use función:columna con función en "
+                f"{', '.join(AGGREGATE_FUNCTIONS)} y columna en {', '.join(SUMMARY_MEASURES)})"
+            )
+        if (function, measure) not in measures:
+            measures.append((function, measure))
+    return measures
+
+
+def measure_label(function: str, measure: str) -> str:
+    return f"{function}_{measure}"
+
+
+def aggregate_statement(dimensions: Sequence[str], measures: Sequence[Tuple[str, str]]):
+    """
+    SELECT dimensiones, row_count, medidas ... GROUP BY dimensiones
+    Los filtros se agregan después (ver _apply_powerbi_filters en main)
+    """
+    group_columns = [getattr(BalanceReport, name) for name in dimensions]
+    statement = select(
+        *group_columns,
+        func.count().label("row_count"),
+        *[
+            AGGREGATE_FUNCTIONS[function](getattr(BalanceReport, measure)).label(
+                measure_label(function, measure)
+            )
+            for function, measure in measures
+        ]
+    )
+    if group_columns:
+        statement = statement.group_by(*group_columns).order_by(*group_columns)
+    return statement
+
+
+def aggregate_rows_to_dicts(rows: Sequence) -> List[Dict]:
+    """Filas del GROUP BY como dicts JSON (montos Decimal -> float)"""
+    return [
+        {
+            key: float(value) if isinstance(value, Decimal) else value
+            for key, value in row._mapping.items()
+        }
+        for row in rows
+    ]
@@ -0,0 +1,224 @@
+"""
+Exportación en streaming de balance_reports para Power BI (NDJSON / CSV / Arrow / Parquet)
+Las filas se leen con un cursor del lado del servidor (yield_per) y se envían
+por lotes a medida que llegan, con memoria constante sin importar el tamaño
+"""
+import csv
+import io
+import json
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Iterator, List, Sequence
+from sqlalchemy import Float, select, type_coerce
+from database import BalanceReport, get_db_session
+from metrics import POWERBI_QUERY_SECONDS, POWERBI_SERIALIZATION_SECONDS
+
+try:
+    # Formatos columnares opcionales (pip install pyarrow)
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+EXPORT_COLUMNS = [
+    BalanceReport.id,
+    BalanceReport.codigo_cuenta_contable,
+    BalanceReport.nombre_cuenta_contable,
+    BalanceReport.cod_relacional,
+    BalanceReport.identificacion,
+    BalanceReport.sucursal,
+    BalanceReport.nombre_tercero,
+    BalanceReport.saldo_inicial,
+    BalanceReport.movimiento_debito,
+    BalanceReport.movimiento_credito,
+    BalanceReport.movimiento,
+    BalanceReport.saldo_final,
+    BalanceReport.fecha,
+    BalanceReport.año,
+    BalanceReport.periodo,
+    BalanceReport.created_at,
+]
+EXPORT_FIELDS = [column.key for column in EXPORT_COLUMNS]
+
+MONEY_FIELDS = {
+    "saldo_inicial", "movimiento_debito", "movimiento_credito", "movimiento", "saldo_final"
+}
+
+COLUMNAR_FORMATS = ("arrow", "parquet")
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+FILE_EXTENSIONS = {
+    "ndjson": "ndjson",
+    "csv": "csv",
+    "arrow": "arrows",
+    "parquet": "parquet",
+}
+
+
+def columnar_available() -> bool:
+    return pa is not None
+
+
+def select_columns(fmt: str) -> List:
+    """En Arrow/Parquet los montos salen como float64 sin pasar por Decimal"""
+    if fmt not in COLUMNAR_FORMATS:
+        return list(EXPORT_COLUMNS)
+    return [
+        type_coerce(column, Float).label(column.key) if column.key in MONEY_FIELDS else column
+        for column in EXPORT_COLUMNS
+    ]
+
+
+def export_statement(fmt: str = "ndjson"):
+    """SELECT de las columnas exportadas (sin ORM) en orden estable"""
+    return select(*select_columns(fmt)).order_by(BalanceReport.periodo, BalanceReport.id)
+
+
+def arrow_schema():
+    """Tipos columnares: enteros, float64 para montos, date32 y timestamp"""
+    return pa.schema([
+        ("id", pa.int64()),
+        ("codigo_cuenta_contable", pa.int64()),
+        ("nombre_cuenta_contable", pa.string()),
+        ("cod_relacional", pa.string()),
+        ("identificacion", pa.string()),
+        ("sucursal", pa.string()),
+        ("nombre_tercero", pa.string()),
+        ("saldo_inicial", pa.float64()),
+        ("movimiento_debito", pa.float64()),
+        ("movimiento_credito", pa.float64()),
+        ("movimiento", pa.float64()),
+        ("saldo_final", pa.float64()),
+        ("fecha", pa.date32()),
+        ("año", pa.int32()),
+        ("periodo", pa.int32()),
+        ("created_at", pa.timestamp("us")),
+    ])
+
+
+def rows_to_record_batch(rows: Sequence, schema=None):
+    """Convierte filas del cursor en un RecordBatch (columna a columna)"""
+    schema = schema or arrow_schema()
+    columns = list(zip(*rows)) if rows else [()] * len(schema)
+    return pa.RecordBatch.from_arrays(
+        [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+        schema=schema
+    )
+
+
+class _ChunkSink(io.RawIOBase):
+    """Destino de escritura que acumula bytes para enviarlos por partes"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _columnar_writer(sink, fmt: str, schema):
+    if fmt == "arrow":
+        return pa.ipc.new_stream(sink, schema)
+    return pq.ParquetWriter(sink, schema, compression="snappy")
+
+
+def _write_batch(writer, batch, fmt: str):
+    if fmt == "arrow":
+        writer.write_batch(batch)
+    else:
+        writer.write_table(pa.Table.from_batches([batch]))
+
+
+def rows_to_columnar_bytes(rows: Sequence, fmt: str) -> bytes:
+    """Serializa una página completa a Arrow IPC o Parquet"""
+    schema = arrow_schema()
+    sink = _ChunkSink()
+    writer = _columnar_writer(sink, fmt, schema)
+    _write_batch(writer, rows_to_record_batch(rows, schema), fmt)
+    writer.close()
+    return sink.drain()
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(value)}")
+
+
+def _ndjson_chunk(rows) -> str:
+    return "".join(
+        json.dumps(dict(zip(EXPORT_FIELDS, row)), default=_json_default, ensure_ascii=False) + "\n"
+        for row in rows
+    )
+
+
+def _csv_chunk(rows, header: bool = False) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(EXPORT_FIELDS)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def _stream_columnar(result, fmt: str) -> Iterator[bytes]:
+    """Un RecordBatch / row group por partición del cursor"""
+    schema = arrow_schema()
+    sink = _ChunkSink()
+    writer = _columnar_writer(sink, fmt, schema)
+    for rows in result.partitions():
+        _write_batch(writer, rows_to_record_batch(rows, schema), fmt)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def stream_export(statement, fmt: str, chunk_rows: int) -> Iterator:
+    """
+    Genera el archivo exportado por bloques de chunk_rows filas
+    Abre su propia sesión: el generador vive más que la dependencia get_db
+    Métricas: la consulta hasta el primer lote y la duración total del stream
+    (lectura + serialización intercaladas, incluye la espera por el cliente)
+    """
+    db = get_db_session()
+    started = time.perf_counter()
+    try:
+        result = db.execute(statement.execution_options(yield_per=chunk_rows))
+        POWERBI_QUERY_SECONDS.labels(endpoint="export").observe(time.perf_counter() - started)
+        if fmt in COLUMNAR_FORMATS:
+            yield from _stream_columnar(result, fmt)
+            return
+        if fmt == "csv":
+            yield _csv_chunk([], header=True)
+        for rows in result.partitions():
+            yield _ndjson_chunk(rows) if fmt == "ndjson" else _csv_chunk(rows)
+    finally:
+        db.close()
+        POWERBI_SERIALIZATION_SECONDS.labels(endpoint="export", format=fmt).observe(
+            time.perf_counter() - started
+        )
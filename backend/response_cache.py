@@ -0,0 +1,164 @@
+"""
+Caché de respuestas de los endpoints de Power BI
+La clave combina la ruta, los parámetros normalizados y la versión de datos de
+los periodos consultados (data_versions), así una carga del ETL invalida solo
+lo que cambió. El backend por defecto es un LRU en memoria con TTL y límite de
+bytes; se puede reemplazar por otro (ej: Redis) con set_response_cache()
+"""
+import hashlib
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+from config import get_settings
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    media_type: str
+    headers: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(k) + len(v) for k, v in self.headers.items())
+
+
+class ResponseCacheBackend(ABC):
+    """Interfaz de los backends de caché"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[CachedResponse]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: CachedResponse):
+        ...
+
+    @abstractmethod
+    def clear(self):
+        ...
+
+    @abstractmethod
+    def stats(self) -> dict:
+        ...
+
+
+class InMemoryLRUCache(ResponseCacheBackend):
+    """LRU por proceso con expiración (TTL) y presupuesto máximo de bytes"""
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "rejected": 0}
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            expires_at, value = entry
+            if time.monotonic() >= expires_at:
+                self._remove(key)
+                self._counters["expirations"] += 1
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return value
+
+    def set(self, key: str, value: CachedResponse):
+        size = value.size
+        with self._lock:
+            if size > self.max_bytes:
+                # Respuestas más grandes que todo el presupuesto no se guardan
+                self._counters["rejected"] += 1
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._counters["evictions"] += 1
+
+    def _remove(self, key: str):
+        _, value = self._entries.pop(key)
+        self._bytes -= value.size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                "backend": "memory",
+                **self._counters,
+                "hit_ratio": round(self._counters["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+            }
+
+
+_cache: Optional[ResponseCacheBackend] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCacheBackend]:
+    """Caché del proceso (se crea la primera vez); None si RESPONSE_CACHE_ENABLED = false"""
+    global _cache
+
+    settings = get_settings()
+    if not settings.response_cache_enabled:
+        return None
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = InMemoryLRUCache(
+                    max_bytes=settings.response_cache_max_bytes,
+                    ttl=settings.response_cache_ttl
+                )
+    return _cache
+
+
+def set_response_cache(backend: Optional[ResponseCacheBackend]):
+    """Reemplaza el backend de la caché (None vuelve al LRU en memoria)"""
+    global _cache
+
+    with _cache_lock:
+        _cache = backend
+
+
+def cache_key(path: str, params: Dict[str, Any], data_version: str) -> str:
+    """Clave estable: parámetros sin valores None, ordenados, más la versión de datos"""
+    normalized = {name: value for name, value in params.items() if value is not None}
+    raw = json.dumps([path, normalized, data_version], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def etag_for(key: str) -> str:
+    return f'"{key[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Compara If-None-Match (lista separada por comas, admite W/ y *)"""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or any(
+        candidate.removeprefix("W/") == etag for candidate in candidates
+    )
@@ -1,6 +1,11 @@
+import asyncio
+import threading
+import time
 import httpx
 from typing import Optional, Dict, Any
 from config import get_settings
+from http_client import get_http_client
+from metrics import SIIGO_REQUEST_SECONDS, SIIGO_REQUESTS
 
 
 class SiigoClient:
@@ -8,53 +13,113 @@ class SiigoClient:
         self.settings = get_settings()
         self.base_url = self.settings.siigo_base_url
         self.access_token: Optional[str] = None
+        self.token_expires_at: float = 0.0  # time.monotonic() de expiración
+        self.token_ttl: float = 0.0  # expires_in del token actual
+        # Un lock de renovación por event loop (un asyncio.Lock solo sirve en un loop),
+        # como el cliente HTTP de http_client
+        self._token_locks: Dict[asyncio.AbstractEventLoop, asyncio.Lock] = {}
+        self._token_locks_guard = threading.Lock()
+
+    def _token_lock(self) -> asyncio.Lock:
+        """Lock de renovación del event loop actual"""
+        loop = asyncio.get_running_loop()
+        with self._token_locks_guard:
+            for closed in [other for other in self._token_locks if other.is_closed()]:
+                del self._token_locks[closed]
+            lock = self._token_locks.get(loop)
+            if lock is None:
+                lock = self._token_locks[loop] = asyncio.Lock()
+            return lock
+
+    def _token_is_fresh(self) -> bool:
+        """
+        True si hay token y no está dentro del margen de renovación
+        El margen es a lo sumo la mitad de la vigencia: con un expires_in menor
+        que siigo_token_refresh_margin cada llamada pediría un token nuevo
+        """
+        margin = min(self.settings.siigo_token_refresh_margin, self.token_ttl / 2)
+        return bool(self.access_token) and time.monotonic() < self.token_expires_at - margin
+
+    @staticmethod
+    def _observe(endpoint: str, started: float, status: str):
+        """Latencia y conteo por código de estado ('error' = sin respuesta)"""
+        SIIGO_REQUEST_SECONDS.labels(endpoint=endpoint, status=status).observe(time.perf_counter() - started)
+        SIIGO_REQUESTS.labels(endpoint=endpoint, status=status).inc()
+
+    def invalidate_token(self, token: Optional[str] = None):
+        """Descarta el token actual (solo si coincide con el rechazado por Siigo)"""
+        if token is None or token == self.access_token:
+            self.access_token = None
+            self.token_expires_at = 0.0
+            self.token_ttl = 0.0
 
     async def get_access_token(self) -> str:
-        """Obtiene el token de acceso de la API de Siigo"""
-        if self.access_token:
+        """
+        Obtiene el token de acceso de la API de Siigo
+        Se reutiliza hasta poco antes de expirar (expires_in) y las renovaciones
+        concurrentes del mismo event loop se agrupan en una sola petición a /auth
+        """
+        if self._token_is_fresh():
             return self.access_token
 
-        async with httpx.AsyncClient() as client:
-            # Para autenticación, SOLO se necesita Content-Type (según PowerQuery)
-            # NO incluir Partner-Id en el header de auth
-            headers = {
-                "Content-Type": "application/json"
-            }
-
-            payload = {
-                "username": self.settings.siigo_username,
-                "access_key": self.settings.siigo_access_key
-            }
-
+        async with self._token_lock():
+            # Otro llamador pudo renovarlo mientras esperábamos el lock
+            if self._token_is_fresh():
+                return self.access_token
+            return await self._request_access_token()
+
+    async def _request_access_token(self) -> str:
+        """POST /auth; se llama siempre con el lock de _token_lock() tomado"""
+        client = get_http_client()
+        # Para autenticación, SOLO se necesita Content-Type (según PowerQuery)
+        # NO incluir Partner-Id en el header de auth
+        headers = {
+            "Content-Type": "application/json"
+        }
+
+        payload = {
+            "username": self.settings.siigo_username,
+            "access_key": self.settings.siigo_access_key
+        }
+
+        try:
+            # Endpoint de autenticación: /auth (según PowerQuery)
+            auth_endpoint = f"{self.base_url}/auth"
+            started = time.perf_counter()
             try:
-                # Endpoint de autenticación: /auth (según PowerQuery)
-                auth_endpoint = f"{self.base_url}/auth"
                 response = await client.post(
                     auth_endpoint,
                     json=payload,
                     headers=headers,
-                    timeout=30.0
+                    timeout=self.settings.siigo_auth_timeout
                 )
+            except httpx.HTTPError:
+                self._observe("auth", started, "error")
+                raise
+            self._observe("auth", started, str(response.status_code))
 
-                response.raise_for_status()
-                data = response.json()
-                self.access_token = data.get("access_token")
-                
-                if not self.access_token:
-                    raise Exception(f"No se recibió access_token en la respuesta: {data}")
+            response.raise_for_status()
+            data = response.json()
+            self.access_token = data.get("access_token")
 
-                return self.access_token
-            except httpx.HTTPStatusError as e:
-                error_detail = f"Error de autenticación: {e.response.status_code}"
-                if e.response.text:
-                    try:
-                        error_data = e.response.json()
-                        error_detail += f" - {error_data}"
-                    except:
-                        error_detail += f" - {e.response.text}"
-                raise Exception(error_detail)
-            except Exception as e:
-                raise Exception(f"Error al obtener token de acceso: {str(e)}")
+            if not self.access_token:
+                raise Exception(f"No se recibió access_token en la respuesta: {data}")
+
+            expires_in = data.get("expires_in") or self.settings.siigo_token_default_ttl
+            self.token_ttl = float(expires_in)
+            self.token_expires_at = time.monotonic() + self.token_ttl
+            return self.access_token
+        except httpx.HTTPStatusError as e:
+            error_detail = f"Error de autenticación: {e.response.status_code}"
+            if e.response.text:
+                try:
+                    error_data = e.response.json()
+                    error_detail += f" - {error_data}"
+                except:
+                    error_detail += f" - {e.response.text}"
+            raise Exception(error_detail)
+        except Exception as e:
+            raise Exception(f"Error al obtener token de acceso: {str(e)}")
 
     async def get_balance_report_by_thirdparty(
         self,
@@ -79,48 +144,62 @@ class SiigoClient:
         Returns:
             Datos del reporte de balance con file_id y file_url para descargar el Excel
         """
-        token = await self.get_access_token()
-
-        async with httpx.AsyncClient() as client:
-            headers = {
-                "Authorization": f"Bearer {token}",
-                "Partner-Id": self.settings.siigo_partner_id,
-                "Content-Type": "application/json"
-            }
-
-            # Construir el cuerpo de la petición según la documentación de Siigo
-            payload = {
-                "year": year,
-                "month_start": month_start,
-                "month_end": month_end,
-                "includes_tax_difference": includes_tax_diff
-            }
-
-            # Agregar account_start y account_end solo si están presentes y no están vacíos
-            if account_start and account_start.strip():
-                payload["account_start"] = account_start.strip()
-            if account_end and account_end.strip():
-                payload["account_end"] = account_end.strip()
-
-            # El endpoint test-balance-report-by-thirdparty usa POST
-            try:
-                response = await client.post(
-                    f"{self.base_url}/v1/test-balance-report-by-thirdparty",
-                    headers=headers,
-                    json=payload,
-                    timeout=60.0
-                )
-
-                response.raise_for_status()
-                return response.json()
-            except httpx.HTTPStatusError as e:
-                error_detail = f"Error de la API de Siigo: {e.response.status_code}"
-                if e.response.text:
-                    try:
-                        error_data = e.response.json()
-                        error_detail += f" - {error_data}"
-                    except:
-                        error_detail += f" - {e.response.text[:500]}"  # Limitar tamaño
-                raise Exception(error_detail)
-            except Exception as e:
-                raise Exception(f"Error al obtener el reporte: {str(e)}")
+        # Construir el cuerpo de la petición según la documentación de Siigo
+        payload = {
+            "year": year,
+            "month_start": month_start,
+            "month_end": month_end,
+            "includes_tax_difference": includes_tax_diff
+        }
+
+        # Agregar account_start y account_end solo si están presentes y no están vacíos
+        if account_start and account_start.strip():
+            payload["account_start"] = account_start.strip()
+        if account_end and account_end.strip():
+            payload["account_end"] = account_end.strip()
+
+        # El endpoint test-balance-report-by-thirdparty usa POST
+        try:
+            token = await self.get_access_token()
+            response = await self._post_report(token, payload)
+
+            if response.status_code == 401:
+                # Token vencido o revocado por Siigo: renovar y reintentar una vez
+                self.invalidate_token(token)
+                token = await self.get_access_token()
+                response = await self._post_report(token, payload)
+
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPStatusError as e:
+            error_detail = f"Error de la API de Siigo: {e.response.status_code}"
+            if e.response.text:
+                try:
+                    error_data = e.response.json()
+                    error_detail += f" - {error_data}"
+                except:
+                    error_detail += f" - {e.response.text[:500]}"  # Limitar tamaño
+            raise Exception(error_detail)
+        except Exception as e:
+            raise Exception(f"Error al obtener el reporte: {str(e)}")
+
+    async def _post_report(self, token: str, payload: Dict[str, Any]) -> httpx.Response:
+        client = get_http_client()
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Partner-Id": self.settings.siigo_partner_id,
+            "Content-Type": "application/json"
+        }
+        started = time.perf_counter()
+        try:
+            response = await client.post(
+                f"{self.base_url}/v1/test-balance-report-by-thirdparty",
+                headers=headers,
+                json=payload,
+                timeout=self.settings.siigo_report_timeout
+            )
+        except httpx.HTTPError:
+            self._observe("report", started, "error")
+            raise
+        self._observe("report", started, str(response.status_code))
+        return response
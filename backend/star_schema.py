@@ -0,0 +1,227 @@
+"""
+Esquema estrella: dim_cuenta, dim_tercero y fact_balance
+fact_balance es la tabla de los reportes (claves enteras + montos) y la vista
+balance_reports_flat (BalanceReport) conserva la forma plana. El ETL carga el
+Excel en una tabla de aterrizaje temporal (bulk_loader.create_landing) y, en la
+misma transacción, actualiza las dimensiones en bloque (un INSERT ... SELECT ...
+ON CONFLICT por dimensión) e inserta los hechos con las claves de las dimensiones
+"""
+from datetime import date, datetime
+from decimal import Decimal
+from typing import List, Optional, Tuple
+from sqlalchemy import DateTime, column, func, literal, select, table, tuple_
+from sqlalchemy.orm import Session
+from bulk_loader import LOAD_COLUMNS
+from database import DimCuenta, DimTercero, FactBalance, upsert
+
+FACT_MEASURES = ["saldo_inicial", "movimiento_debito", "movimiento_credito", "saldo_final"]
+FACT_COLUMNS = ["periodo", "año", "fecha", "cuenta_id", "tercero_id", *FACT_MEASURES, "created_at"]
+
+
+def _landing(landing: str):
+    return table(landing, column("fila"), *[column(name) for name in LOAD_COLUMNS])
+
+
+def upsert_dimensions(db: Session, landing: str):
+    """
+    Agrega las cuentas y terceros nuevos de la tabla de aterrizaje y actualiza sus
+    nombres con los de su fila más reciente, solo si vienen de un periodo igual o
+    posterior al que ya tiene la dimensión (recargar un periodo viejo no los pisa)
+    Un grupo por clave natural (ON CONFLICT no admite dos filas con la misma clave)
+    y en orden de la clave, para que cargas concurrentes bloqueen filas en el mismo orden
+    """
+    source = _landing(landing)
+    now = literal(datetime.utcnow(), DateTime)
+
+    ranked = select(
+        source.c.codigo_cuenta_contable,
+        source.c.nombre_cuenta_contable,
+        source.c.cod_relacional,
+        source.c.periodo,
+        func.row_number().over(
+            partition_by=source.c.codigo_cuenta_contable,
+            order_by=[source.c.periodo.desc(), source.c.fila.desc()]
+        ).label("orden"),
+    ).where(source.c.codigo_cuenta_contable.is_not(None)).subquery()
+    cuentas = select(
+        ranked.c.codigo_cuenta_contable,
+        ranked.c.nombre_cuenta_contable,
+        ranked.c.cod_relacional,
+        ranked.c.periodo,
+        now,
+    ).where(ranked.c.orden == 1).order_by(ranked.c.codigo_cuenta_contable)
+
+    statement = upsert(db, DimCuenta).from_select(
+        ["codigo_cuenta_contable", "nombre_cuenta_contable", "cod_relacional", "ultimo_periodo", "updated_at"],
+        cuentas
+    )
+    excluded = statement.excluded
+    statement = statement.on_conflict_do_update(
+        index_elements=[DimCuenta.codigo_cuenta_contable],
+        set_={
+            "nombre_cuenta_contable": excluded.nombre_cuenta_contable,
+            "cod_relacional": excluded.cod_relacional,
+            "ultimo_periodo": excluded.ultimo_periodo,
+            "updated_at": excluded.updated_at,
+        },
+        where=(
+            (func.coalesce(excluded.ultimo_periodo, 0) >= func.coalesce(DimCuenta.ultimo_periodo, 0))
+            & (
+                DimCuenta.nombre_cuenta_contable.is_distinct_from(excluded.nombre_cuenta_contable)
+                | DimCuenta.cod_relacional.is_distinct_from(excluded.cod_relacional)
+                | DimCuenta.ultimo_periodo.is_distinct_from(excluded.ultimo_periodo)
+            )
+        )
+    )
+    db.execute(statement)
+
+    identificacion = func.coalesce(source.c.identificacion, "")
+    sucursal = func.coalesce(source.c.sucursal, "")
+    ranked = select(
+        identificacion.label("identificacion"),
+        sucursal.label("sucursal"),
+        source.c.nombre_tercero,
+        source.c.periodo,
+        func.row_number().over(
+            partition_by=[identificacion, sucursal],
+            order_by=[source.c.periodo.desc(), source.c.fila.desc()]
+        ).label("orden"),
+    ).subquery()
+    terceros = select(
+        ranked.c.identificacion,
+        ranked.c.sucursal,
+        ranked.c.nombre_tercero,
+        ranked.c.periodo,
+        now,
+    ).where(ranked.c.orden == 1).order_by(ranked.c.identificacion, ranked.c.sucursal)
+
+    statement = upsert(db, DimTercero).from_select(
+        ["identificacion", "sucursal", "nombre_tercero", "ultimo_periodo", "updated_at"], terceros
+    )
+    excluded = statement.excluded
+    statement = statement.on_conflict_do_update(
+        index_elements=[DimTercero.identificacion, DimTercero.sucursal],
+        set_={
+            "nombre_tercero": excluded.nombre_tercero,
+            "ultimo_periodo": excluded.ultimo_periodo,
+            "updated_at": excluded.updated_at,
+        },
+        where=(
+            (func.coalesce(excluded.ultimo_periodo, 0) >= func.coalesce(DimTercero.ultimo_periodo, 0))
+            & (
+                DimTercero.nombre_tercero.is_distinct_from(excluded.nombre_tercero)
+                | DimTercero.ultimo_periodo.is_distinct_from(excluded.ultimo_periodo)
+            )
+        )
+    )
+    db.execute(statement)
+
+
+def insert_facts(db: Session, landing: str, target: Optional[str] = None) -> int:
+    """
+    INSERT ... SELECT de la tabla de aterrizaje a fact_balance (o a la staging de
+    una partición) con las claves de las dimensiones, en el orden del Excel
+    Las dimensiones ya deben tener las claves de la carga (upsert_dimensions)
+    """
+    source = _landing(landing)
+    rows = select(
+        source.c.periodo,
+        source.c["año"],
+        source.c.fecha,
+        DimCuenta.cuenta_id,
+        DimTercero.tercero_id,
+        *[source.c[measure] for measure in FACT_MEASURES],
+        source.c.created_at,
+    ).select_from(source).outerjoin(
+        DimCuenta, DimCuenta.codigo_cuenta_contable == source.c.codigo_cuenta_contable
+    ).join(
+        DimTercero,
+        (DimTercero.identificacion == func.coalesce(source.c.identificacion, ""))
+        & (DimTercero.sucursal == func.coalesce(source.c.sucursal, ""))
+    ).order_by(source.c.fila)
+
+    destination = FactBalance.__table__ if target is None else table(
+        target, *[column(name) for name in FACT_COLUMNS]
+    )
+    return db.execute(destination.insert().from_select(FACT_COLUMNS, rows)).rowcount
+
+
+def load_facts(db: Session, landing: str, target: Optional[str] = None) -> int:
+    """Dimensiones + hechos de la tabla de aterrizaje (sin commit)"""
+    upsert_dimensions(db, landing)
+    return insert_facts(db, landing, target)
+
+
+# ---------- Consultas para Power BI ----------
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _rows_to_dicts(rows) -> List[dict]:
+    return [{key: _json_value(value) for key, value in row._mapping.items()} for row in rows]
+
+
+def dim_cuenta_rows(db: Session) -> List[dict]:
+    return _rows_to_dicts(db.execute(
+        select(
+            DimCuenta.cuenta_id,
+            DimCuenta.codigo_cuenta_contable,
+            DimCuenta.nombre_cuenta_contable,
+            DimCuenta.cod_relacional,
+        ).order_by(DimCuenta.cuenta_id)
+    ))
+
+
+def dim_tercero_rows(db: Session) -> List[dict]:
+    return _rows_to_dicts(db.execute(
+        select(
+            DimTercero.tercero_id,
+            DimTercero.identificacion,
+            DimTercero.sucursal,
+            DimTercero.nombre_tercero,
+        ).order_by(DimTercero.tercero_id)
+    ))
+
+
+def facts_page(
+    db: Session,
+    año: Optional[int],
+    periodo: Optional[int],
+    cuenta_id: Optional[int],
+    tercero_id: Optional[int],
+    limit: int,
+    after: Optional[Tuple[int, int]] = None
+) -> Tuple[List[dict], bool]:
+    """Página de hechos ordenada por (periodo, balance_id); after = último (periodo, balance_id)"""
+    statement = select(
+        FactBalance.periodo,
+        FactBalance.id.label("balance_id"),
+        FactBalance.año,
+        FactBalance.fecha,
+        FactBalance.cuenta_id,
+        FactBalance.tercero_id,
+        *[getattr(FactBalance, measure) for measure in FACT_MEASURES],
+    )
+    if año is not None:
+        statement = statement.where(
+            FactBalance.año == año, FactBalance.periodo.between(año * 100, año * 100 + 99)
+        )
+    if periodo is not None:
+        statement = statement.where(FactBalance.periodo == periodo)
+    if cuenta_id is not None:
+        statement = statement.where(FactBalance.cuenta_id == cuenta_id)
+    if tercero_id is not None:
+        statement = statement.where(FactBalance.tercero_id == tercero_id)
+    if after is not None:
+        statement = statement.where(
+            tuple_(FactBalance.periodo, FactBalance.id) > tuple_(*after)
+        )
+    rows = db.execute(
+        statement.order_by(FactBalance.periodo, FactBalance.id).limit(limit + 1)
+    ).all()
+    return _rows_to_dicts(rows[:limit]), len(rows) > limit